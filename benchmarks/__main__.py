@@ -0,0 +1,131 @@
+"""Run the offline benchmark suite and write the results as JSON.
+
+Run with: python -m benchmarks [--quick] [--output results.json] [--baseline old.json]
+
+Nothing here touches the network or bot_users.db: bots are rendered into
+temporary directories and replies go through an offline session. With
+--baseline, every timing is printed next to the same row of an earlier
+results file.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from benchmarks import bench_dispatch, bench_escape_markdown, bench_generate, bench_routing, bench_validation
+
+# name -> (full run, --quick run); each returns a list of flat dict rows of parameters and float timings.
+SUITE = {
+    "generate": (
+        lambda: bench_generate.run(bench_generate.SIZES, 50),
+        lambda: bench_generate.run((1, 50), 5),
+    ),
+    "validate_config": (
+        lambda: bench_validation.run(bench_validation.SIZES, 50),
+        lambda: bench_validation.run((1, 50), 5),
+    ),
+    "is_valid_text": (
+        lambda: bench_validation.run_text(bench_validation.TEXT_LENGTHS, bench_validation.FAQS, 2000),
+        lambda: bench_validation.run_text((20, 500), 100, 100),
+    ),
+    "escape_markdown": (
+        lambda: bench_escape_markdown.run(bench_escape_markdown.SIZES, 50, 20),
+        lambda: bench_escape_markdown.run((100, 2000), 10, 2),
+    ),
+    "routing": (
+        lambda: asyncio.run(bench_routing.run(bench_routing.SIZES, 20)),
+        lambda: asyncio.run(bench_routing.run((10, 100), 2)),
+    ),
+    "dispatch": (
+        lambda: asyncio.run(bench_dispatch.run(bench_dispatch.SIZES, 2000)),
+        lambda: asyncio.run(bench_dispatch.run((1, 50), 100)),
+    ),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, quick=False):
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        },
+        "benchmarks": {},
+    }
+    for name in names:
+        start = time.perf_counter()
+        rows = SUITE[name][1 if quick else 0]()
+        print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        results["benchmarks"][name] = rows
+    return results
+
+
+def row_key(row):
+    """A row is identified by its parameters, i.e. every value that is not a float timing."""
+    return tuple((k, v) for k, v in row.items() if not isinstance(v, float))
+
+
+def compare(results, baseline):
+    """Yield (benchmark, row key, metric, value, baseline value) for every timing both results have."""
+    for name, rows in results["benchmarks"].items():
+        old_rows = baseline.get("benchmarks", {}).get(name, [])
+        for row in rows:
+            key = row_key(row)
+            old = next((old for old in old_rows if row_key(old) == key), None)
+            if old is None:
+                continue
+            for metric, value in row.items():
+                if isinstance(value, float) and isinstance(old.get(metric), (int, float)):
+                    yield name, ",".join(f"{k}={v}" for k, v in key), metric, value, old[metric]
+
+
+def print_results(results, baseline=None):
+    if baseline is not None:
+        print(f"{'benchmark':<16} {'row':<28} {'metric':<28} {'value':>12} {'baseline':>12} {'change':>8}")
+        for name, key, metric, value, old in compare(results, baseline):
+            change = f"{(value / old - 1) * 100:+.1f}%" if old else ""
+            print(f"{name:<16} {key:<28} {metric:<28} {value:>12.2f} {old:>12.2f} {change:>8}")
+        return
+    for name, rows in results["benchmarks"].items():
+        print(name)
+        for row in rows:
+            print("  " + ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, of: {', '.join(SUITE)} (default: all)")
+    parser.add_argument("--quick", action="store_true", help="small sizes and few rounds, for a smoke run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="a results file from an earlier run to compare against")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in SUITE]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_suite(args.names or list(SUITE), args.quick)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""list_bots / delete_bot latency on a large bot_configs table, before and after the index migration.
+
+Run with: python -m benchmarks.bench_bot_configs_index
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from utils.utils_migrations import MIGRATIONS, migrate
+
+INDEX_VERSION = next(number for number, _, fn in MIGRATIONS if fn.__name__ == "create_bot_configs_indexes")
+
+
+def seed(conn, rows, users):
+    conn.executemany(
+        'INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token) VALUES (?, ?, ?, ?)',
+        ((i % users, f"bot{i}", '{"bot_name": "x", "handlers": []}', f"{i}:TOKEN") for i in range(rows))
+    )
+    conn.commit()
+
+
+def measure(conn, users, queries):
+    rng = random.Random(0)
+    list_times = []
+    delete_times = []
+    max_id = conn.execute('SELECT MAX(config_id) FROM bot_configs').fetchone()[0]
+    for _ in range(queries):
+        user_id = rng.randrange(users)
+        start = time.perf_counter()
+        conn.execute('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (user_id,)).fetchall()
+        list_times.append(time.perf_counter() - start)
+
+        config_id = rng.randrange(1, max_id + 1)
+        start = time.perf_counter()
+        conn.execute('DELETE FROM bot_configs WHERE config_id = ? AND user_id = ?', (config_id, user_id))
+        conn.commit()
+        delete_times.append(time.perf_counter() - start)
+    return statistics.median(list_times) * 1000, statistics.median(delete_times) * 1000
+
+
+def run(rows, users, queries):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bot_users.db"))
+        conn.execute('PRAGMA journal_mode=WAL')
+        migrate(conn, target=INDEX_VERSION - 1)
+        seed(conn, rows, users)
+        results["without indexes"] = measure(conn, users, queries)
+        migrate(conn)
+        results["with indexes"] = measure(conn, users, queries)
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    print(f"bot_configs rows: {args.rows}, users: {args.users}")
+    print(f"{'schema':<18} {'list_bots p50, ms':>18} {'delete p50, ms':>15}")
+    for name, (list_ms, delete_ms) in run(args.rows, args.users, args.queries).items():
+        print(f"{name:<18} {list_ms:>18.3f} {delete_ms:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
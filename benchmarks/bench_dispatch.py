@@ -0,0 +1,117 @@
+"""End-to-end update throughput of a generated bot, fed synthetic Updates with no network.
+
+The bot is rendered by generate(), imported like BotHost does and sends its
+replies through OfflineSession, which serializes each request and parses a
+canned Bot API response instead of calling Telegram.
+
+Run with: python -m benchmarks.bench_dispatch
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.types import Update
+from benchmarks.bench_generate import make_config
+from egtgbt.host import load_bot_module
+from egtgbt.runtime import build_dispatcher, create_bot
+from generate import generate
+
+TOKEN = "123456:ABCDEF"
+SIZES = (1, 50, 500)
+CHAT = {"id": 1, "type": "private"}
+USER = {"id": 1, "is_bot": False, "first_name": "User"}
+RESPONSES = {
+    "sendMessage": json.dumps({"ok": True, "result": {"message_id": 1, "date": 0, "chat": CHAT, "text": "ok"}}),
+}
+DEFAULT_RESPONSE = json.dumps({"ok": True, "result": True})
+
+
+class OfflineSession(AiohttpSession):
+    """A session that does everything but the HTTP round trip."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.build_form_data(bot=bot, method=method)
+        self.requests += 1
+        content = RESPONSES.get(method.__api_method__, DEFAULT_RESPONSE)
+        return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+
+
+def message_update(text, update_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text, "chat": CHAT, "from": USER,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    })
+
+
+def callback_update(data, update_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": data, "from": USER,
+            "message": {"message_id": 1, "date": 0, "chat": CHAT, "text": "menu"},
+        },
+    })
+
+
+def make_updates(handlers, count):
+    updates = []
+    for i in range(count):
+        # Every other update is a button click, like a user browsing a FAQ.
+        n = i * 7919 % handlers
+        if i % 2:
+            updates.append(callback_update(f"faq_{n}", i))
+        else:
+            updates.append(message_update(f"/cmd{n}", i))
+    return updates
+
+
+def load_generated_bot(config, bots_dir):
+    generate(config, os.path.join(bots_dir, "bot_1.py"), 1)
+    module = load_bot_module(1, TOKEN, bots_dir)
+    session = OfflineSession()
+    bot = create_bot(TOKEN, session=session)
+    return bot, build_dispatcher(module.COMMANDS, module.CALLBACKS, name=module.BOT_NAME), session
+
+
+async def updates_per_second(handlers, count, bots_dir):
+    bot, dp, session = load_generated_bot(make_config(handlers), bots_dir)
+    updates = make_updates(handlers, count)
+    start = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - start
+    # A reply per message, a reply and an answerCallbackQuery per click.
+    assert session.requests == count + count // 2
+    await bot.session.close()
+    return {"handlers": handlers, "updates": count, "updates_per_second": count / elapsed, "us_per_update": elapsed / count * 1e6}
+
+
+async def run(sizes, count):
+    with tempfile.TemporaryDirectory() as bots_dir:
+        return [await updates_per_second(handlers, count, bots_dir) for handlers in sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="handlers in the generated bot")
+    parser.add_argument("--count", type=int, default=2000, help="updates fed per size")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{'handlers':>9} {'updates/s':>10} {'us/update':>10}")
+    for row in asyncio.run(run(args.sizes, args.count)):
+        print(f"{row['handlers']:>9} {row['updates_per_second']:>10.0f} {row['us_per_update']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
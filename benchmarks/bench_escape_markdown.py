@@ -0,0 +1,80 @@
+"""escape_markdown: sequential str.replace passes vs single-pass str.translate and re.sub on long FAQ answers.
+
+Run with: python -m benchmarks.bench_escape_markdown
+"""
+import argparse
+import re
+import time
+from utils.utils_markdown import SPECIAL_CHARS, escape_markdown
+
+SIZES = (100, 2000, 4096)
+ANSWER = (
+    "Доставка (по Москве) занимает 1-2 дня; стоимость — 300 руб. "
+    "Подробнее: https://example.com/delivery?city=msk_center#faq! "
+    "Вопросы? Пишите на support@example.com или звоните +7 (999) 123-45-67.\n"
+)
+
+
+def composed_escape(char):
+    """What the sequential passes turn a single character into."""
+    return escape_markdown(char)
+
+
+ESCAPES = {char: composed_escape(char) for char, _ in SPECIAL_CHARS}
+ESCAPE_TABLE = str.maketrans(ESCAPES)
+ESCAPE_RE = re.compile("[" + re.escape("".join(ESCAPES)) + "]")
+
+
+def translate_escape_markdown(text):
+    return text.translate(ESCAPE_TABLE)
+
+
+def regex_escape_markdown(text):
+    return ESCAPE_RE.sub(lambda match: ESCAPES[match.group()], text)
+
+
+VARIANTS = (
+    ("replace", escape_markdown),
+    ("translate", translate_escape_markdown),
+    ("regex", regex_escape_markdown),
+)
+
+
+def make_answer(length):
+    return (ANSWER * (length // len(ANSWER) + 1))[:length]
+
+
+def time_escape(escape, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            escape(text)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+
+def run(sizes, answers, rounds):
+    results = []
+    for length in sizes:
+        texts = [make_answer(length) + str(i) for i in range(answers)]
+        for _, escape in VARIANTS[1:]:
+            assert all(escape(text) == escape_markdown(text) for text in texts)
+        row = {"length": length}
+        for name, escape in VARIANTS:
+            row[f"{name}_us"] = time_escape(escape, texts, rounds) * 1e6
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="answer length, characters")
+    parser.add_argument("--answers", type=int, default=50, help="answers escaped per round")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'length':>7}" + "".join(f"{name + ', us':>15}" for name, _ in VARIANTS))
+    for row in run(args.sizes, args.answers, args.rounds):
+        print(f"{row['length']:>7}" + "".join(f"{row[name + '_us']:>15.2f}" for name, _ in VARIANTS))
+
+
+if __name__ == "__main__":
+    main()
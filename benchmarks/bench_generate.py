@@ -0,0 +1,68 @@
+"""generate() throughput: bots rendered per second for configs of 1, 50 and 500 handlers.
+
+Run with: python -m benchmarks.bench_generate
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import generate as generate_module
+from generate import generate
+
+SIZES = (1, 50, 500)
+
+
+def make_config(handlers):
+    config = {"bot_name": f"Bench{handlers}", "handlers": []}
+    for i in range(handlers):
+        config["handlers"].append({
+            "command": f"/cmd{i}",
+            "text": f"Ответ на команду {i}\\. Подробнее: https://example\\.com",
+            "reply_markup": {"inline_keyboard": [[
+                {"text": "Сайт", "url": "https://example.com"},
+                {"text": f"Вопрос {i}", "callback_data": f"faq_{i}", "response": f"Ответ {i}\\."},
+            ]]},
+        })
+    return config
+
+
+def bots_per_second(config, count, output_dir):
+    start = time.perf_counter()
+    for i in range(count):
+        generate(config, os.path.join(output_dir, f"bot_{i}.py"), i)
+    return count / (time.perf_counter() - start)
+
+
+def run(sizes, count):
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for handlers in sizes:
+            config = make_config(handlers)
+            # First call after clearing the module caches pays for loading the template.
+            generate_module.get_environment.cache_clear()
+            generate_module.get_template.cache_clear()
+            start = time.perf_counter()
+            generate(config, os.path.join(output_dir, "bot_cold.py"), 0)
+            cold_ms = (time.perf_counter() - start) * 1000
+            results.append({
+                "handlers": handlers,
+                "cold_ms": cold_ms,
+                "bots_per_second": bots_per_second(config, count, output_dir),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--count", type=int, default=50, help="bots generated per size")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+    print(f"{'handlers':>9} {'first call, ms':>15} {'bots/s':>10}")
+    for row in run(args.sizes, args.count):
+        print(f"{row['handlers']:>9} {row['cold_ms']:>15.2f} {row['bots_per_second']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Callback routing: aiogram lambda filter chain vs CallbackRouter dict lookup.
+
+Run with: python -m benchmarks.bench_routing
+"""
+import argparse
+import asyncio
+import time
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from egtgbt.routing import CallbackRouter
+
+TOKEN = "123456:ABCDEF"
+SIZES = (10, 100, 1000)
+
+
+def callback_update(data, update_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": data,
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        },
+    })
+
+
+async def noop_handler(callback) -> None:
+    return None
+
+
+def lambda_dispatcher(buttons):
+    dp = Dispatcher()
+    for i in range(buttons):
+        dp.callback_query.register(noop_handler, (lambda value: lambda c: c.data == value)(f"faq_{i}"))
+    return dp
+
+
+def table_dispatcher(buttons):
+    dp = Dispatcher()
+    callbacks = CallbackRouter()
+    for i in range(buttons):
+        callbacks.add(f"faq_{i}", noop_handler)
+    callbacks.add_prefix("template_", noop_handler)
+    callbacks.attach(dp)
+    return dp
+
+
+async def time_dispatch(dp, updates, rounds):
+    bot = Bot(TOKEN)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / (rounds * len(updates))
+
+
+async def run(sizes, rounds, clicks=20):
+    results = []
+    for buttons in sizes:
+        # Spread clicks across the keyboard so the filter chain pays its average cost.
+        step = max(buttons // clicks, 1)
+        updates = [callback_update(f"faq_{i}", i) for i in range(0, buttons, step)]
+        results.append({
+            "buttons": buttons,
+            "lambda_us": await time_dispatch(lambda_dispatcher(buttons), updates, rounds) * 1e6,
+            "table_us": await time_dispatch(table_dispatcher(buttons), updates, rounds) * 1e6,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'buttons':>8} {'lambda chain, us':>18} {'dict table, us':>16}")
+    for row in asyncio.run(run(args.sizes, args.rounds)):
+        print(f"{row['buttons']:>8} {row['lambda_us']:>18.1f} {row['table_us']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Config validation (validate_config, validate_block_schema, validate_bot_config) and user text checks.
+
+Run with: python -m benchmarks.bench_validation
+"""
+import argparse
+import time
+from benchmarks.bench_generate import make_config
+from utils.utils_validation import is_valid_text, validate_block_schema, validate_bot_config, validate_config, validate_faqs
+
+SIZES = (1, 50, 500)
+TEXT_LENGTHS = (20, 500, 4000)
+FAQS = 1000
+SENTENCE = "Доставка по Москве занимает 1-2 дня, оплата при получении (наличными или картой). "
+
+VALIDATORS = (
+    ("validate_config", validate_config),
+    ("validate_block_schema", validate_block_schema),
+    ("validate_bot_config", validate_bot_config),
+)
+
+
+def time_call(fn, arg, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - start) / rounds
+
+
+def make_text(length):
+    return (SENTENCE * (length // len(SENTENCE) + 1))[:length].strip()
+
+
+def run(sizes, rounds):
+    results = []
+    for handlers in sizes:
+        config = make_config(handlers)
+        row = {"handlers": handlers}
+        for name, validate in VALIDATORS:
+            assert validate(config)[0]
+            row[f"{name}_us"] = time_call(validate, config, rounds) * 1e6
+        results.append(row)
+    return results
+
+
+def run_text(lengths, faqs, rounds):
+    results = []
+    for length in lengths:
+        text = make_text(length)
+        assert is_valid_text(text)
+        results.append({"check": "is_valid_text", "size": length, "us": time_call(is_valid_text, text, rounds) * 1e6})
+    entries = [{"question": f"Вопрос {i}?", "answer": make_text(200)} for i in range(faqs)]
+    assert validate_faqs(entries)[0]
+    results.append({"check": "validate_faqs", "size": faqs, "us": time_call(validate_faqs, entries, max(rounds // 100, 1)) * 1e6})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="handlers per config")
+    parser.add_argument("--lengths", type=int, nargs="+", default=list(TEXT_LENGTHS), help="is_valid_text input length")
+    parser.add_argument("--faqs", type=int, default=FAQS, help="entries in the validate_faqs list")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    print(f"{'handlers':>9}" + "".join(f"{name + ', us':>27}" for name, _ in VALIDATORS))
+    for row in run(args.sizes, args.rounds):
+        print(f"{row['handlers']:>9}" + "".join(f"{row[name + '_us']:>27.1f}" for name, _ in VALIDATORS))
+    print()
+    print(f"{'check':>15} {'size':>6} {'us':>10}")
+    for row in run_text(args.lengths, args.faqs, args.rounds * 10):
+        print(f"{row['check']:>15} {row['size']:>6} {row['us']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""A local stand-in for the Telegram Bot API, for load tests that must not reach Telegram.
+
+Serves getMe, getUpdates (long polling), sendMessage and answerCallbackQuery
+for any number of bot tokens on localhost; every other method answers
+``{"ok": true, "result": true}``. Bots are pointed at it with
+TELEGRAM_API_URL. Updates are queued with push(); replies are passed to the
+``on_reply`` callback as they arrive.
+
+Run with: python -m benchmarks.fake_bot_api --port 8081
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from aiohttp import web
+
+# Upper bound for a getUpdates long poll, so a stopped bot never holds a request for long.
+MAX_POLL_TIMEOUT = 10.0
+
+
+class FakeBotState:
+    """Pending updates and bookkeeping of one bot token."""
+
+    def __init__(self, token):
+        self.user = {
+            "id": int(token.split(":", 1)[0]), "is_bot": True,
+            "first_name": "Fake", "username": f"fake_{token.split(':', 1)[0]}_bot",
+        }
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.arrived = asyncio.Event()
+        self.polling = asyncio.Event()
+
+
+class FakeBotApi:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.bots = {}
+        self.requests = 0
+        self.on_reply = None
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def bot(self, token):
+        state = self.bots.get(token)
+        if state is None:
+            state = self.bots[token] = FakeBotState(token)
+        return state
+
+    def push(self, token, update):
+        """Queue an update (without update_id) for the bot's next getUpdates; returns its update_id."""
+        state = self.bot(token)
+        update = {"update_id": next(state.update_ids), **update}
+        state.updates.append(update)
+        state.arrived.set()
+        return update["update_id"]
+
+    async def wait_polling(self, token, timeout=30.0):
+        """Wait until the bot has called getUpdates, i.e. its dispatcher is running."""
+        await asyncio.wait_for(self.bot(token).polling.wait(), timeout)
+
+    async def get_updates(self, state, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), MAX_POLL_TIMEOUT)
+        state.polling.set()
+        state.updates = [update for update in state.updates if update["update_id"] >= offset]
+        if not state.updates and timeout:
+            state.arrived.clear()
+            try:
+                await asyncio.wait_for(state.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return state.updates[:limit]
+
+    def send_message(self, state, params):
+        chat_id = int(params["chat_id"])
+        return {
+            "message_id": next(state.message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": state.user, "text": params.get("text", ""),
+        }
+
+    async def handle(self, request):
+        self.requests += 1
+        token, method = request.match_info["token"], request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json() if request.can_read_body else {}
+        else:
+            params = dict(await request.post())
+        state = self.bot(token)
+        if method == "getMe":
+            result = state.user
+        elif method == "getUpdates":
+            result = await self.get_updates(state, params)
+        elif method == "sendMessage":
+            result = self.send_message(state, params)
+        else:
+            result = True
+        if method in ("sendMessage", "answerCallbackQuery") and self.on_reply is not None:
+            self.on_reply(token, method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app(), handle_signals=False, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        # With port=0 the OS picks a free port.
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        for state in self.bots.values():
+            # Release pending long polls so the runner can shut down.
+            state.arrived.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(host, port):
+    api = await FakeBotApi(host, port).start()
+    api.on_reply = lambda token, method, params: print(method, json.dumps(params, ensure_ascii=False))
+    print(f"Fake Bot API on {api.url}; start bots with TELEGRAM_API_URL={api.url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Latency of the builder's /start and /list_bots handlers under concurrent traffic.
+
+Compares the old per-update sqlite3.connect on the event loop with the
+Database pool from utils.utils_db. Run with: python -m benchmarks.load_builder_db
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from utils.utils_db import Database
+
+
+def seed(path, users, bots_per_user):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT)')
+    conn.execute('CREATE TABLE bot_configs (config_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bot_name TEXT)')
+    conn.executemany('INSERT INTO users (user_id, first_name) VALUES (?, ?)', ((i, f"user{i}") for i in range(users)))
+    conn.executemany(
+        'INSERT INTO bot_configs (user_id, bot_name) VALUES (?, ?)',
+        ((i, f"bot{i}_{j}") for i in range(users) for j in range(bots_per_user))
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_sync_queries(path):
+    def start(user_id):
+        conn = sqlite3.connect(path)
+        user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        conn.close()
+        return user
+
+    def list_bots(user_id):
+        conn = sqlite3.connect(path)
+        bots = conn.execute('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (user_id,)).fetchall()
+        conn.close()
+        return bots
+
+    async def start_async(user_id):
+        return start(user_id)
+
+    async def list_bots_async(user_id):
+        return list_bots(user_id)
+
+    return start_async, list_bots_async
+
+
+def make_pool_queries(db):
+    async def start(user_id):
+        return await db.fetchone('SELECT * FROM users WHERE user_id = ?', (user_id,))
+
+    async def list_bots(user_id):
+        return await db.fetchall('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (user_id,))
+
+    return start, list_bots
+
+
+async def drive(start, list_bots, users, requests, rate):
+    """Open-loop load: requests arrive at a fixed rate and latency counts from arrival."""
+    latencies = []
+    max_lag = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        # Any blocking call on the loop shows up as lag for every other user.
+        nonlocal max_lag
+        while not done.is_set():
+            begin = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - begin - 0.001)
+
+    async def one(i, arrival):
+        if i % 2:
+            await list_bots(i % users)
+        else:
+            await start(i % users)
+        latencies.append(time.perf_counter() - arrival)
+
+    monitor = asyncio.create_task(heartbeat())
+    tasks = []
+    begin = time.perf_counter()
+    for i in range(requests):
+        arrival = begin + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - begin
+    done.set()
+    await monitor
+    latencies.sort()
+    return {
+        "throughput": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max_loop_lag_ms": max_lag * 1000,
+    }
+
+
+async def run(users, bots_per_user, requests, rate, pool_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bot_users.db")
+        seed(path, users, bots_per_user)
+        results = {"sqlite3.connect per update": await drive(*make_sync_queries(path), users, requests, rate)}
+        db = Database(path, pool_size=pool_size)
+        try:
+            results[f"Database pool ({pool_size})"] = await drive(*make_pool_queries(db), users, requests, rate)
+        finally:
+            db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bots-per-user", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=2000, help="requests per second")
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+    results = asyncio.run(run(args.users, args.bots_per_user, args.requests, args.rate, args.pool_size))
+    print(f"{'mode':<28} {'req/s':>8} {'p50, ms':>9} {'p99, ms':>9} {'max loop lag, ms':>17}")
+    for mode, row in results.items():
+        print(f"{mode:<28} {row['throughput']:>8.0f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_loop_lag_ms']:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
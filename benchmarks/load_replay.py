@@ -0,0 +1,241 @@
+"""Reply latency and throughput of the builder or a generated bot, replayed against a fake Bot API.
+
+Starts benchmarks.fake_bot_api on localhost, runs the target (target_bot_code.py
+or bots/bot_N.py) as a subprocess pointed at it with TELEGRAM_API_URL, and
+pushes /start, /faq and callback traffic at a fixed rate from many simulated
+users. Latency counts from the moment an update is queued to the first reply
+it gets (sendMessage, or answerCallbackQuery for a silent button); replies in
+one chat are matched to its updates in order.
+
+The target's send queue (utils.utils_sendqueue) is switched off unless
+--telegram-limits is given, so the numbers show the bot itself rather than
+Telegram's 1 message per second per chat.
+
+Run with: python -m benchmarks.load_replay bots/bot_5.py --rate 200 --count 2000
+"""
+import argparse
+import ast
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.fake_bot_api import FakeBotApi
+from egtgbt.supervisor import bot_env
+
+TOKEN = "123456:FAKE-TOKEN"
+BUILDER_SCRIPT = "target_bot_code.py"
+BUILDER_COMMANDS = ("/start", "/menu", "/list_bots")
+BUILDER_CALLBACKS = ("menu_list_bots",)
+
+
+def bot_traffic(script):
+    """(commands, callbacks) a script answers, read from a generated bot's COMMANDS/CALLBACKS tables."""
+    if os.path.basename(script) == BUILDER_SCRIPT:
+        return BUILDER_COMMANDS, BUILDER_CALLBACKS
+    with open(script, encoding="utf-8-sig") as f:
+        tree = ast.parse(f.read())
+    tables = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if node.targets[0].id in ("COMMANDS", "CALLBACKS"):
+                tables[node.targets[0].id] = ast.literal_eval(node.value)
+    if "COMMANDS" not in tables:
+        raise ValueError(f"{script} creates its Bot at import time and cannot be pointed at the fake API; "
+                         "regenerate it with `python cli.py regenerate --force`")
+    return tuple("/" + command for command, _, _ in tables["COMMANDS"]), tuple(data for data, _ in tables.get("CALLBACKS", ()))
+
+
+def random_traffic(commands, callbacks, seed=0):
+    """Endless ("text" | "callback_data", value) steps: 20% /start, 30% other commands, 50% button clicks."""
+    rng = random.Random(seed)
+    others = [command for command in commands if command != "/start"] or list(commands)
+    while True:
+        roll = rng.random()
+        if roll < 0.2 and "/start" in commands:
+            yield "text", "/start"
+        elif roll < 0.5 or not callbacks:
+            yield "text", "/faq" if "/faq" in others and rng.random() < 0.5 else rng.choice(others)
+        else:
+            yield "callback_data", rng.choice(callbacks)
+
+
+def scripted_traffic(path):
+    """Cycle through a JSONL script of {"text": ...} or {"callback_data": ...} steps."""
+    with open(path, encoding="utf-8") as f:
+        steps = [next(iter(json.loads(line).items())) for line in f if line.strip()]
+    if not steps:
+        raise ValueError(f"{path}: no steps")
+    return itertools.cycle(steps)
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Replayer:
+    """Pushes updates into a FakeBotApi and times the bot's replies to them."""
+
+    def __init__(self, api, token, users=100):
+        self.api = api
+        self.token = token
+        self.users = users
+        self.pending = collections.defaultdict(collections.deque)
+        self.callbacks = {}
+        self.latencies = []
+        self.sent = 0
+        self.first_sent = None
+        self.last_reply = None
+        self.all_replied = asyncio.Event()
+        api.on_reply = self.on_reply
+
+    def update(self, kind, value, chat_id):
+        user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+        chat = {"id": chat_id, "type": "private"}
+        if kind == "callback_data":
+            return {"callback_query": {
+                "id": f"{chat_id}-{self.sent}", "chat_instance": str(chat_id), "data": value, "from": user,
+                "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"},
+            }}
+        message = {"message_id": self.sent + 1, "date": int(time.time()), "chat": chat, "from": user, "text": value}
+        if value.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(value.split()[0])}]
+        return {"message": message}
+
+    def send(self, kind, value):
+        chat_id = 1000 + self.sent % self.users
+        update = self.update(kind, value, chat_id)
+        entry = [time.perf_counter(), False]
+        self.pending[chat_id].append(entry)
+        if kind == "callback_data":
+            self.callbacks[update["callback_query"]["id"]] = entry
+        if self.first_sent is None:
+            self.first_sent = entry[0]
+        self.sent += 1
+        self.all_replied.clear()
+        self.api.push(self.token, update)
+
+    def complete(self, entry):
+        if entry is None or entry[1]:
+            return
+        entry[1] = True
+        self.last_reply = time.perf_counter()
+        self.latencies.append(self.last_reply - entry[0])
+        if len(self.latencies) == self.sent:
+            self.all_replied.set()
+
+    def on_reply(self, token, method, params):
+        if token != self.token:
+            return
+        if method == "answerCallbackQuery":
+            self.complete(self.callbacks.pop(params.get("callback_query_id"), None))
+            return
+        queue = self.pending.get(int(params["chat_id"]))
+        while queue and queue[0][1]:
+            queue.popleft()
+        if queue:
+            self.complete(queue.popleft())
+
+    async def replay(self, traffic, count, rate, reply_timeout=10.0):
+        begin = time.perf_counter()
+        for i, (kind, value) in enumerate(itertools.islice(traffic, count)):
+            delay = begin + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.send(kind, value)
+        try:
+            await asyncio.wait_for(self.all_replied.wait(), reply_timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.report()
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        elapsed = (self.last_reply - self.first_sent) if latencies else 0.0
+        row = {"sent": self.sent, "replied": len(latencies), "lost": self.sent - len(latencies),
+               "throughput": len(latencies) / elapsed if elapsed else 0.0}
+        for name, fraction in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99), ("max_ms", 1.0)):
+            row[name] = percentile(latencies, fraction) * 1000 if latencies else 0.0
+        return row
+
+
+NO_SEND_LIMITS = {"SEND_RATE": "0", "SEND_CHAT_RATE": "0", "SEND_GROUP_RATE": "0"}
+
+
+async def start_target(script, api, token, workdir, telegram_limits=False):
+    """Run script against the fake API and wait until it polls for updates."""
+    env = bot_env(token, TELEGRAM_API_URL=api.url, **({} if telegram_limits else NO_SEND_LIMITS))
+    env.pop("WEBHOOK_BASE_URL", None)
+    log = open(os.path.join(workdir, "bot.log"), "wb")
+    # The builder keeps bot_users.db in its working directory, so it gets a fresh one here.
+    process = subprocess.Popen([sys.executable, os.path.abspath(script)], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    log.close()
+    polling = asyncio.ensure_future(api.wait_polling(token))
+    while not polling.done():
+        if process.poll() is not None:
+            polling.cancel()
+            with open(os.path.join(workdir, "bot.log"), encoding="utf-8", errors="replace") as f:
+                raise RuntimeError(f"{script} exited with {process.returncode}:\n{f.read()[-2000:]}")
+        await asyncio.wait([polling], timeout=0.1)
+    polling.result()
+    return process
+
+
+def stop_target(process, timeout=10.0):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run(script, traffic, count, rate, users, reply_timeout=10.0, telegram_limits=False):
+    api = await FakeBotApi().start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            process = await start_target(script, api, TOKEN, workdir, telegram_limits)
+            try:
+                result = await Replayer(api, TOKEN, users).replay(traffic, count, rate, reply_timeout)
+            finally:
+                stop_target(process)
+    finally:
+        await api.close()
+    result["api_requests"] = api.requests
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("script", help="target_bot_code.py or bots/bot_N.py")
+    parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    parser.add_argument("--count", type=int, default=2000, help="updates to send")
+    parser.add_argument("--users", type=int, default=100, help="distinct simulated users (chats)")
+    parser.add_argument("--script-file", help='JSONL of {"text": "/faq"} / {"callback_data": "faq_1"} steps to cycle instead of random traffic')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reply-timeout", type=float, default=10.0, help="seconds to wait for replies after the last update")
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the bot's send queue at Telegram's flood limits")
+    parser.add_argument("--output", help="also write the result as JSON to this file")
+    args = parser.parse_args()
+    if args.script_file:
+        traffic = scripted_traffic(args.script_file)
+    else:
+        traffic = random_traffic(*bot_traffic(args.script), seed=args.seed)
+    result = asyncio.run(run(args.script, traffic, args.count, args.rate, args.users, args.reply_timeout,
+                             args.telegram_limits))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"script": args.script, "rate": args.rate, "users": args.users, **result}, f, indent=2)
+    print(f"{'sent':>6} {'replied':>8} {'lost':>5} {'replies/s':>10} {'p50, ms':>9} {'p90, ms':>9} {'p99, ms':>9} {'max, ms':>9}")
+    print(f"{result['sent']:>6} {result['replied']:>8} {result['lost']:>5} {result['throughput']:>10.0f} "
+          f"{result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['max_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
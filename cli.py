@@ -3,65 +3,34 @@ import asyncio
 import json
 import os
 import sqlite3
-from target_bot_code import generate_and_run_bot, escape_markdown, validate_config, validate_block_schema, init_db
-
-def is_valid_text(text):
-    """Validate text to ensure it contains only safe characters."""
-    if not text:
-        return False
-    allowed_chars = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ,.!?+-*()[]{}:;@#$%^&_=<>~`")
-    return all(char in allowed_chars for char in text) and len(text.strip()) > 0
-
-async def create_business_card(bot_name, bot_token, welcome_text, phone, email, website, help_text):
-    config = {"bot_name": bot_name, "handlers": []}
-    contact_text = f"*{escape_markdown(welcome_text)}*\\n\\n📋 *Контактная информация:*\\n"
-    if website:
-        contact_text += f"🌐 *Website:* {escape_markdown(website)}\\n"
-    if email:
-        contact_text += f"📧 *Email:* {escape_markdown(email)}\\n"
-    if phone:
-        contact_text += f"📞 *Phone:* {escape_markdown(phone)}\\n"
-    if not any([website, email, phone]):
-        contact_text += "ℹ️ Контактная информация не указана.\\n"
-
-    handlers = [
-        {"command": "/start", "text": contact_text},
-        {"command": "/help", "text": escape_markdown(help_text)},
-        {"command": "/create_bot", "text": "Начать создание нового бота."},
-        {"command": "/list_bots", "text": "Показать список ваших ботов."},
-        {"command": "/delete_bot", "text": "Удалить бота."},
-        {
-            "command": "/menu",
-            "text": "Выберите действие:",
-            "reply_markup": {
-                "inline_keyboard": [
-                    [
-                        {"text": "Создать бота", "callback_data": "menu_create_bot", "response": "Начнем создание бота!"},
-                        {"text": "Список ботов", "callback_data": "menu_list_bots", "response": "Показываю ваши боты."}
-                    ],
-                    [
-                        {"text": "Удалить бота", "callback_data": "menu_delete_bot", "response": "Выберите бота для удаления."}
-                    ]
-                ]
-            }
-        }
-    ]
-    config["handlers"] = handlers
-
-    is_valid, error = validate_config(config)
-    if not is_valid:
-        print(f"Ошибка в конфигурации: {error}")
-        return
-    is_valid, error = validate_block_schema(config)
+from concurrent.futures import ProcessPoolExecutor
+from target_bot_code import generate_and_run_bot, validate_bot_config, init_db, supervisor, snapshot_files, restore_files
+from generate import content_hash, render_bot
+from egtgbt.host import BotHost, RUN_MODES, DEFAULT_RUN_MODE, RUN_MODE_INPROCESS, RUN_MODE_SUBPROCESS
+from egtgbt.supervisor import STATUS_BACKOFF, STATUS_RUNNING, Supervisor
+from utils.utils_db import Database
+from utils.utils_logging import setup_logging
+from utils.utils_markdown import business_card_handlers, faq_handlers
+from utils.utils_metrics import METRICS_PORT
+from utils.utils_validation import validate_bot_token, validate_faqs
+from egtgbt.webhook import default_ingress
+
+def business_card_config(bot_name, welcome_text, phone, email, website, help_text):
+    return {"bot_name": bot_name, "handlers": business_card_handlers(welcome_text, phone, email, website, help_text)}
+
+async def create_business_card(bot_name, bot_token, welcome_text, phone, email, website, help_text, run_mode=DEFAULT_RUN_MODE):
+    config = business_card_config(bot_name, welcome_text, phone, email, website, help_text)
+
+    is_valid, errors = validate_bot_config(config)
     if not is_valid:
-        print(f"Ошибка в схеме: {error}")
+        print("Ошибка в конфигурации: " + "; ".join(errors))
         return
 
     conn = sqlite3.connect("bot_users.db")
     c = conn.cursor()
     c.execute(
-        "INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token) VALUES (?, ?, ?, ?)",
-        (1, bot_name, json.dumps(config), bot_token)  # user_id=1 как пример, можно заменить
+        "INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token, run_mode) VALUES (?, ?, ?, ?, ?)",
+        (1, bot_name, json.dumps(config), bot_token, run_mode)  # user_id=1 как пример, можно заменить
     )
     config_id = c.lastrowid
     conn.commit()
@@ -70,41 +39,22 @@ async def create_business_card(bot_name, bot_token, welcome_text, phone, email,
     await generate_and_run_bot(config, bot_token, config_id)
     print(f"Бот '{bot_name}' успешно создан и запущен! ID: {config_id}")
 
-async def create_faq(bot_name, bot_token, faqs):
-    config = {"bot_name": bot_name, "handlers": []}
-    faq_text = "Часто задаваемые вопросы:\\nВыберите интересующий вопрос\\."
-    keyboard_buttons = []
-
-    for i, faq in enumerate(faqs, 1):
-        callback_data = f"faq_{i}"
-        keyboard_buttons.append([
-            {
-                "text": escape_markdown(faq["question"]),
-                "callback_data": callback_data,
-                "response": escape_markdown(faq["answer"])
-            }
-        ])
-
-    handlers = [
-        {"command": "/start", "text": "Добро пожаловать в бот FAQ! Используйте /faq для просмотра вопросов."},
-        {"command": "/faq", "text": faq_text, "reply_markup": {"inline_keyboard": keyboard_buttons}}
-    ]
-    config["handlers"] = handlers
-
-    is_valid, error = validate_config(config)
-    if not is_valid:
-        print(f"Ошибка в конфигурации: {error}")
-        return
-    is_valid, error = validate_block_schema(config)
+def faq_config(bot_name, faqs):
+    return {"bot_name": bot_name, "handlers": faq_handlers(faqs)}
+
+async def create_faq(bot_name, bot_token, faqs, run_mode=DEFAULT_RUN_MODE):
+    config = faq_config(bot_name, faqs)
+
+    is_valid, errors = validate_bot_config(config)
     if not is_valid:
-        print(f"Ошибка в схеме: {error}")
+        print("Ошибка в конфигурации: " + "; ".join(errors))
         return
 
     conn = sqlite3.connect("bot_users.db")
     c = conn.cursor()
     c.execute(
-        "INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token) VALUES (?, ?, ?, ?)",
-        (1, bot_name, json.dumps(config), bot_token)  # user_id=1 как пример
+        "INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token, run_mode) VALUES (?, ?, ?, ?, ?)",
+        (1, bot_name, json.dumps(config), bot_token, run_mode)  # user_id=1 как пример
     )
     config_id = c.lastrowid
     conn.commit()
@@ -113,7 +63,216 @@ async def create_faq(bot_name, bot_token, faqs):
     await generate_and_run_bot(config, bot_token, config_id)
     print(f"Бот '{bot_name}' успешно создан и запущен! ID: {config_id}")
 
+def parse_faqs(items):
+    faqs = []
+    for item in items or []:
+        if isinstance(item, str):
+            if ":" not in item:
+                raise ValueError(f"FAQ '{item}' не в формате 'вопрос:ответ'")
+            question, answer = item.split(":", 1)
+        else:
+            question, answer = item.get("question"), item.get("answer")
+        faqs.append({"question": question, "answer": answer})
+    if not faqs:
+        raise ValueError("укажите хотя бы один вопрос и ответ")
+    is_valid, errors = validate_faqs(faqs)
+    if not is_valid:
+        raise ValueError("; ".join(errors))
+    return faqs
+
+def bulk_spec_config(spec):
+    """Build and validate the config of one bulk JSONL row; raises ValueError with the reason."""
+    name, token = spec.get("name"), spec.get("token")
+    if not name:
+        raise ValueError("не указано имя бота")
+    is_valid, error = validate_bot_token(token)
+    if not is_valid:
+        raise ValueError(error)
+    if spec.get("run_mode", DEFAULT_RUN_MODE) not in RUN_MODES:
+        raise ValueError(f"неизвестный run_mode: {spec['run_mode']}")
+    template = spec.get("template")
+    if template == "business_card":
+        if not spec.get("welcome") or not spec.get("help_text"):
+            raise ValueError("для визитки нужны welcome и help_text")
+        config = business_card_config(
+            name, spec["welcome"], spec.get("phone"), spec.get("email"), spec.get("website"), spec["help_text"]
+        )
+    elif template == "faq":
+        config = faq_config(name, parse_faqs(spec.get("faqs")))
+    else:
+        raise ValueError(f"неизвестный шаблон: {template}")
+    is_valid, errors = validate_bot_config(config)
+    if not is_valid:
+        raise ValueError("; ".join(errors))
+    return config
+
+def read_bulk_specs(path):
+    """Yield (line_number, spec, error) for every non-empty line of a JSONL file."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                spec = json.loads(line)
+                if not isinstance(spec, dict):
+                    raise ValueError("строка должна быть JSON-объектом")
+                yield number, spec, None
+            except ValueError as e:
+                yield number, {}, f"некорректный JSON: {e}"
+
+def insert_bulk(rows, user_id, db_path="bot_users.db"):
+    """Insert every valid row in one transaction and set row["config_id"]; tokens already in use are rejected."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            used = {token for token, in conn.execute("SELECT bot_token FROM bot_configs WHERE bot_token IS NOT NULL")}
+            for row in rows:
+                if row["error"]:
+                    continue
+                spec = row["spec"]
+                if spec["token"] in used:
+                    row["error"] = "токен уже используется другим ботом"
+                    continue
+                used.add(spec["token"])
+                row["config_id"] = conn.execute(
+                    "INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token, run_mode) VALUES (?, ?, ?, ?, ?)",
+                    (spec.get("user_id", user_id), spec["name"], json.dumps(row["config"]), spec["token"],
+                     spec.get("run_mode", DEFAULT_RUN_MODE))
+                ).lastrowid
+    finally:
+        conn.close()
+
+def bot_files(config_id, bots_dir="bots"):
+    return [os.path.join(bots_dir, f"bot_{config_id}.py"), os.path.join(bots_dir, f"bot_{config_id}.env")]
+
+async def render_bulk(rows, jobs=None, bots_dir="bots"):
+    """Render bot files for subprocess rows on a process pool; row["previous"] keeps the files they replace."""
+    pending = [row for row in rows if not row["error"] and row["spec"].get("run_mode", DEFAULT_RUN_MODE) != RUN_MODE_INPROCESS]
+    if not pending:
+        return
+    for row in pending:
+        row["previous"] = snapshot_files(bot_files(row["config_id"], bots_dir))
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, render_bot, row["config"], row["spec"]["token"], row["config_id"], bots_dir)
+              for row in pending),
+            return_exceptions=True
+        )
+    for row, result in zip(pending, results):
+        if isinstance(result, Exception):
+            row["error"] = f"ошибка генерации: {result}"
+        else:
+            row["content_hash"] = content_hash(row["config"], row["spec"]["token"])
+
+def store_content_hashes(rows, db_path="bot_users.db"):
+    """Record the hash of every rendered row that did not fail afterwards, so regenerate skips only good files."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE bot_configs SET content_hash = ? WHERE config_id = ?",
+                [(row["content_hash"], row["config_id"]) for row in rows if row.get("content_hash") and not row["error"]]
+            )
+    finally:
+        conn.close()
+
+def supervisor_for(db_path="bot_users.db", bots_dir="bots"):
+    """A Supervisor over db_path and bots_dir, so the bots started are the ones just rendered there."""
+    return Supervisor(Database(db_path), bots_dir=os.path.abspath(bots_dir), webhook=supervisor.webhook,
+                      metrics=supervisor.metrics)
+
+async def start_bulk(rows, concurrency, bulk_supervisor):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def start(row):
+        async with limit:
+            try:
+                await bulk_supervisor.replace(row["config_id"], row["spec"]["token"])
+                row["status"] = "запущен"
+            except Exception as e:
+                row["error"] = f"не запущен: {e}"
+                # The previous version keeps serving; put its files back so a crash restart runs it too.
+                if "previous" in row:
+                    restore_files(row["previous"])
+
+    try:
+        await asyncio.gather(*(
+            start(row) for row in rows
+            if not row["error"] and row["spec"].get("run_mode", DEFAULT_RUN_MODE) != RUN_MODE_INPROCESS
+        ))
+    finally:
+        # The started bots keep running; this process only stops watching them.
+        await bulk_supervisor.close()
+        bulk_supervisor.db.close()
+
+async def create_bulk(path, user_id=1, jobs=None, concurrency=32, start=True, db_path="bot_users.db", bots_dir="bots"):
+    """Provision every bot of a JSONL file: validate all, insert in one transaction, render in parallel, start."""
+    rows = []
+    for number, spec, error in read_bulk_specs(path):
+        config = None
+        if error is None:
+            try:
+                config = bulk_spec_config(spec)
+            except ValueError as e:
+                error = str(e)
+        rows.append({"line": number, "spec": spec, "config": config, "config_id": None, "error": error, "status": "создан"})
+    insert_bulk(rows, user_id, db_path)
+    await render_bulk(rows, jobs, bots_dir)
+    for row in rows:
+        if not row["error"] and row["spec"].get("run_mode", DEFAULT_RUN_MODE) == RUN_MODE_INPROCESS:
+            row["status"] = "в общем хосте"
+    if start:
+        await start_bulk(rows, concurrency, supervisor_for(db_path, bots_dir))
+    store_content_hashes(rows, db_path)
+    return rows
+
+async def regenerate_all(force=False, jobs=None, concurrency=32, start=True, db_path="bot_users.db", bots_dir="bots"):
+    """Re-render the subprocess bots whose content hash changed and restart those that were running.
+
+    Returns (rows, skipped); bots whose config, token and template version
+    are unchanged are not touched unless force is set.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        records = conn.execute(
+            "SELECT config_id, bot_name, bot_token, config_json, content_hash, pid, status FROM bot_configs "
+            "WHERE bot_token IS NOT NULL AND config_json IS NOT NULL AND COALESCE(run_mode, ?) = ?",
+            (RUN_MODE_SUBPROCESS, RUN_MODE_SUBPROCESS)
+        ).fetchall()
+    finally:
+        conn.close()
+    rows = []
+    skipped = 0
+    for config_id, name, token, config_json, stored_hash, pid, status in records:
+        row = {"line": config_id, "spec": {"name": name, "token": token}, "config": None, "config_id": config_id,
+               "error": None, "status": "перегенерирован", "running": pid is not None or status in (STATUS_RUNNING, STATUS_BACKOFF)}
+        try:
+            row["config"] = json.loads(config_json)
+        except ValueError as e:
+            row["error"] = f"некорректный config_json: {e}"
+        else:
+            if not force and stored_hash == content_hash(row["config"], token) \
+                    and os.path.exists(os.path.join(bots_dir, f"bot_{config_id}.py")):
+                skipped += 1
+                continue
+        rows.append(row)
+    await render_bulk(rows, jobs, bots_dir)
+    if start:
+        await start_bulk([row for row in rows if row["running"]], concurrency, supervisor_for(db_path, bots_dir))
+    store_content_hashes(rows, db_path)
+    return rows, skipped
+
+def print_bulk_report(rows):
+    print("строка\tрезультат\tID\tимя\tсообщение")
+    for row in rows:
+        result = "ошибка" if row["error"] else "ok"
+        print(f"{row['line']}\t{result}\t{row['config_id'] or '-'}\t{row['spec'].get('name', '')}\t{row['error'] or row['status']}")
+    failed = sum(1 for row in rows if row["error"])
+    print(f"Всего: {len(rows)}, успешно: {len(rows) - failed}, с ошибками: {failed}")
+
 def main():
+    setup_logging()
     init_db()
     parser = argparse.ArgumentParser(description="CLI для генерации Telegram-ботов")
     subparsers = parser.add_subparsers(dest="command")
@@ -127,34 +286,55 @@ def main():
     parser_business.add_argument("--email", help="Email")
     parser_business.add_argument("--website", help="URL сайта")
     parser_business.add_argument("--help-text", required=True, help="Текст для /help")
+    parser_business.add_argument("--run-mode", choices=RUN_MODES, default=DEFAULT_RUN_MODE, help="Запуск в отдельном процессе или в общем хосте")
 
     # Команда для создания бота "FAQ"
     parser_faq = subparsers.add_parser("faq", help="Создать бота-FAQ")
     parser_faq.add_argument("--name", required=True, help="Имя бота")
     parser_faq.add_argument("--token", required=True, help="Токен бота от @BotFather")
     parser_faq.add_argument("--faqs", nargs="+", help="Список вопросов и ответов (в формате 'вопрос:ответ')")
+    parser_faq.add_argument("--run-mode", choices=RUN_MODES, default=DEFAULT_RUN_MODE, help="Запуск в отдельном процессе или в общем хосте")
+
+    # Команда для запуска всех in-process ботов в одном процессе
+    subparsers.add_parser("host", help="Запустить всех ботов с run_mode=inprocess в одном процессе")
+
+    # Команда для массового создания ботов из JSONL-файла
+    parser_bulk = subparsers.add_parser("bulk", help="Создать ботов по спецификациям из JSONL-файла")
+    parser_bulk.add_argument("file", help="JSONL: по одному объекту {template, name, token, ...} на строку")
+    parser_bulk.add_argument("--user-id", type=int, default=1, help="Владелец ботов, если в строке не указан user_id")
+    parser_bulk.add_argument("--jobs", type=int, default=None, help="Число процессов для генерации (по умолчанию — число CPU)")
+    parser_bulk.add_argument("--concurrency", type=int, default=32, help="Сколько ботов запускать одновременно")
+    parser_bulk.add_argument("--no-start", action="store_true", help="Только создать и сгенерировать, не запускать")
+
+    # Команда для перегенерации ботов после изменения шаблона
+    parser_regenerate = subparsers.add_parser("regenerate", help="Перегенерировать ботов, у которых изменились конфиг, токен или шаблон")
+    parser_regenerate.add_argument("--force", action="store_true", help="Перегенерировать всех, даже без изменений")
+    parser_regenerate.add_argument("--jobs", type=int, default=None, help="Число процессов для генерации (по умолчанию — число CPU)")
+    parser_regenerate.add_argument("--concurrency", type=int, default=32, help="Сколько ботов перезапускать одновременно")
+    parser_regenerate.add_argument("--no-start", action="store_true", help="Только сгенерировать файлы, не перезапускать")
 
     args = parser.parse_args()
 
     if args.command == "business_card":
         asyncio.run(create_business_card(
-            args.name, args.token, args.welcome, args.phone, args.email, args.website, args.help_text
+            args.name, args.token, args.welcome, args.phone, args.email, args.website, args.help_text, args.run_mode
         ))
     elif args.command == "faq":
-        faqs = []
-        if args.faqs:
-            for faq_str in args.faqs:
-                if ":" in faq_str:
-                    question, answer = faq_str.split(":", 1)
-                    if is_valid_text(question) and is_valid_text(answer):
-                        faqs.append({"question": question, "answer": answer})
-                    else:
-                        print("Ошибка: вопрос или ответ содержат недопустимые символы.")
-                        return
-        if not faqs:
-            print("Ошибка: укажите хотя бы один вопрос и ответ в формате 'вопрос:ответ'.")
+        try:
+            faqs = parse_faqs(args.faqs)
+        except ValueError as e:
+            print(f"Ошибка: {e}.")
             return
-        asyncio.run(create_faq(args.name, args.token, faqs))
+        asyncio.run(create_faq(args.name, args.token, faqs, args.run_mode))
+    elif args.command == "host":
+        asyncio.run(BotHost(webhook=default_ingress(), metrics=METRICS_PORT is not None).serve())
+    elif args.command == "bulk":
+        rows = asyncio.run(create_bulk(args.file, args.user_id, args.jobs, args.concurrency, start=not args.no_start))
+        print_bulk_report(rows)
+    elif args.command == "regenerate":
+        rows, skipped = asyncio.run(regenerate_all(args.force, args.jobs, args.concurrency, start=not args.no_start))
+        print_bulk_report(rows)
+        print(f"Пропущено без изменений: {skipped}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
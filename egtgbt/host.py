@@ -0,0 +1,178 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+from egtgbt.interpreter import build_dispatcher
+from egtgbt.runtime import create_bot, build_dispatcher as build_table_dispatcher
+from egtgbt.webhook import default_ingress
+from utils.utils_logging import LoggingContextMiddleware, setup_logging
+from utils.utils_metrics import METRICS_PORT, collect_local, instrument, serve_metrics
+from utils.utils_sendqueue import throttle
+from utils.utils_profiler import SamplingProfiler, install_profile_signal
+
+logger = logging.getLogger(__name__)
+
+RUN_MODE_SUBPROCESS = "subprocess"
+RUN_MODE_INPROCESS = "inprocess"
+RUN_MODES = (RUN_MODE_SUBPROCESS, RUN_MODE_INPROCESS)
+DEFAULT_RUN_MODE = os.getenv("BOT_RUN_MODE", RUN_MODE_SUBPROCESS)
+
+BOTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bots")
+
+
+def load_bot_module(config_id, bot_token, bots_dir=BOTS_DIR):
+    """Import bots/bot_{config_id}.py under its own module name without starting it."""
+    path = os.path.join(bots_dir, f"bot_{config_id}.py")
+    spec = importlib.util.spec_from_file_location(f"bots.bot_{config_id}", path)
+    module = importlib.util.module_from_spec(spec)
+    # Modules rendered before egtgbt.runtime create their Bot at import time from
+    # BOT_TOKEN, so every bot has to see its own token while its module body runs.
+    previous_token = os.environ.get("BOT_TOKEN")
+    os.environ["BOT_TOKEN"] = bot_token
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        if previous_token is None:
+            os.environ.pop("BOT_TOKEN", None)
+        else:
+            os.environ["BOT_TOKEN"] = previous_token
+    return module
+
+
+class BotHost:
+    """Runs many generated bots on one event loop, each with its own Bot and Dispatcher.
+
+    Bots long-poll by default; given a WebhookIngress they receive updates
+    through it instead and hold no connection while idle. With ``metrics``
+    on, each bot's handlers and API calls are recorded under its config_id.
+    """
+
+    def __init__(self, db_path='bot_users.db', bots_dir=BOTS_DIR, webhook=None, metrics=False):
+        self.db_path = db_path
+        self.bots_dir = bots_dir
+        self.webhook = webhook
+        self.metrics = metrics
+        self.bots = {}
+        self._tasks = {}
+        self.running = False
+
+    def __contains__(self, config_id):
+        return config_id in self.bots
+
+    def __len__(self):
+        return len(self.bots)
+
+    async def start_bot(self, config_id, bot_token, config=None):
+        """Start (or restart) a bot from its config dict, or from bots/bot_{config_id}.py if no config is given."""
+        if config is not None:
+            dp = build_dispatcher(config)
+            entry = self.bots.get(config_id)
+            if entry is not None and entry[0].token == bot_token:
+                # Config reload: keep the Bot and its HTTP session, swap only the handlers.
+                await self._cancel(config_id)
+                bot = entry[0]
+            else:
+                await self.stop_bot(config_id)
+                bot = create_bot(bot_token)
+        else:
+            await self.stop_bot(config_id)
+            module = load_bot_module(config_id, bot_token, self.bots_dir)
+            if hasattr(module, "COMMANDS"):
+                bot = create_bot(bot_token)
+                dp = build_table_dispatcher(module.COMMANDS, module.CALLBACKS, name=module.BOT_NAME)
+            else:
+                bot, dp = module.bot, module.dp
+        self.bots[config_id] = (bot, dp)
+        if not any(isinstance(m, LoggingContextMiddleware) for m in dp.update.outer_middleware):
+            dp.update.outer_middleware(LoggingContextMiddleware(config_id))
+        throttle(bot, config_id)
+        if self.metrics:
+            instrument(bot, dp, config_id)
+        if self.webhook is not None:
+            await self.webhook.attach(bot, dp)
+        else:
+            self._tasks[config_id] = asyncio.create_task(self._poll(config_id, bot, dp), name=f"bot_{config_id}")
+        logger.info("Bot %s started in-process", config_id)
+
+    async def _cancel(self, config_id):
+        task = self._tasks.pop(config_id, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop_bot(self, config_id):
+        await self._cancel(config_id)
+        entry = self.bots.pop(config_id, None)
+        if entry is not None:
+            if self.webhook is not None:
+                self.webhook.remove(entry[0].token)
+            await entry[0].session.close()
+            logger.info("Bot %s stopped", config_id)
+
+    async def _poll(self, config_id, bot, dp):
+        try:
+            # A bot that ran on webhooks before cannot call getUpdates until its webhook is removed.
+            await bot.delete_webhook()
+            await dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Bot %s stopped polling with an error", config_id)
+
+    def configs(self, run_mode=RUN_MODE_INPROCESS):
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute(
+            'SELECT config_id, bot_token, config_json FROM bot_configs WHERE run_mode = ? AND bot_token IS NOT NULL',
+            (run_mode,)
+        )
+        rows = c.fetchall()
+        conn.close()
+        return rows
+
+    async def load_all(self):
+        self.running = True
+        for config_id, bot_token, config_json in self.configs():
+            try:
+                await self.start_bot(config_id, bot_token, json.loads(config_json) if config_json else None)
+            except Exception as e:
+                logger.error("Failed to load bot %s: %s", config_id, e)
+        return len(self.bots)
+
+    async def stop_all(self):
+        self.running = False
+        for config_id in list(self.bots):
+            await self.stop_bot(config_id)
+
+    async def serve(self):
+        install_profile_signal(SamplingProfiler("host"))
+        if self.webhook is not None:
+            await self.webhook.start()
+        metrics = None
+        if self.metrics:
+            metrics = await serve_metrics(collect_local)
+        count = await self.load_all()
+        logger.info("Hosting %d bots in one process", count)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop_all()
+            if self.webhook is not None:
+                await self.webhook.close()
+            if metrics is not None:
+                await metrics.cleanup()
+
+
+async def main() -> None:
+    from utils.utils_migrations import migrate_path
+    migrate_path()
+    await BotHost(webhook=default_ingress(), metrics=METRICS_PORT is not None).serve()
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
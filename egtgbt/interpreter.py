@@ -0,0 +1,136 @@
+import ast
+import warnings
+from aiogram import Dispatcher, Router
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from markupsafe import escape
+from egtgbt.routing import CallbackRouter
+from utils.utils_validation import validate_bot_config
+
+DEFAULT_HELP_TEXT = "*Для помощи напишите администратору:* @NeK0TeR"
+
+
+def render_text(text):
+    """Return the string a generated bot would send for this config text.
+
+    bot_template.py.j2 writes texts as "{{ text | e }}" Python literals, so the
+    reply is the HTML-escaped text with Python escape sequences applied.
+    """
+    escaped = str(escape(text)).replace("\n", "\\n").replace("\r", "\\r")
+    if "\\" not in escaped:
+        # No escape sequences: the literal evaluates to itself.
+        return escaped
+    try:
+        with warnings.catch_warnings():
+            # Markdown escapes like "\." are invalid Python escapes and stay as written.
+            warnings.simplefilter("ignore", (DeprecationWarning, SyntaxWarning))
+            return ast.literal_eval(f'"{escaped}"')
+    except (SyntaxError, ValueError):
+        return escaped
+
+
+def compile_keyboard(reply_markup):
+    """Turn a reply_markup dict into rows of (text, url, callback_data) tuples."""
+    rows = []
+    for row in reply_markup.get('inline_keyboard', []):
+        buttons = []
+        for button in row:
+            if button.get('url'):
+                buttons.append((render_text(button['text']), render_text(button['url']), None))
+            elif button.get('callback_data'):
+                buttons.append((render_text(button['text']), None, render_text(button['callback_data'])))
+        rows.append(tuple(buttons))
+    return tuple(rows)
+
+
+def build_keyboard(rows):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=text, url=url) if url else InlineKeyboardButton(text=text, callback_data=callback_data)
+            for text, url, callback_data in row
+        ]
+        for row in rows
+    ])
+
+
+def make_command_handler(text, keyboard=None):
+    if keyboard is None:
+        async def command_handler(message: Message) -> None:
+            await message.answer(text)
+    else:
+        async def command_handler(message: Message) -> None:
+            await message.answer(text, reply_markup=keyboard)
+    return command_handler
+
+
+def make_callback_handler(response):
+    async def callback_handler(callback: CallbackQuery) -> None:
+        try:
+            await callback.message.answer(response)
+            await callback.answer()
+        except Exception as e:
+            await callback.answer(text=f"Error occurred: {str(e)}")
+    return callback_handler
+
+
+async def help_handler(message: Message) -> None:
+    await message.answer(DEFAULT_HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
+
+
+def check_config(config):
+    is_valid, errors = validate_bot_config(config)
+    if not is_valid:
+        raise ValueError("; ".join(errors))
+
+
+def compile_config(config):
+    """Validate a config and reduce it to frozen (commands, callbacks) tables.
+
+    commands holds (command, text, keyboard_rows_or_None) and callbacks holds
+    (callback_data, response); all texts are already rendered the way a
+    generated bot would send them. Duplicates keep the first entry, as
+    aiogram did with the handlers the template used to register twice.
+    """
+    check_config(config)
+    commands = {}
+    callbacks = {}
+    for handler in config['handlers']:
+        reply_markup = handler.get('reply_markup')
+        if reply_markup:
+            for row in reply_markup.get('inline_keyboard', []):
+                for button in row:
+                    if button.get('callback_data'):
+                        callbacks.setdefault(render_text(button['callback_data']), render_text(button['response']))
+        command = handler['command'].lstrip('/')
+        if command not in commands:
+            keyboard = compile_keyboard(reply_markup) if reply_markup else None
+            commands[command] = (command, render_text(handler['text']), keyboard)
+    return tuple(commands.values()), tuple(callbacks.items())
+
+
+def build_table_router(commands, callbacks, name=None):
+    router = Router(name=name)
+    for command, text, keyboard in commands:
+        router.message.register(
+            make_command_handler(text, build_keyboard(keyboard) if keyboard else None), Command(command)
+        )
+    if not any(command == 'help' for command, _, _ in commands):
+        router.message.register(help_handler, Command("help"))
+    callback_router = CallbackRouter()
+    for callback_data, response in callbacks:
+        callback_router.add(callback_data, make_callback_handler(response))
+    callback_router.attach(router)
+    return router
+
+
+def build_router(config, name=None):
+    """Build a Router answering like the code generate() would render for this config."""
+    commands, callbacks = compile_config(config)
+    return build_table_router(commands, callbacks, name=name or config['bot_name'])
+
+
+def build_dispatcher(config, **kwargs):
+    dp = Dispatcher(**kwargs)
+    dp.include_router(build_router(config))
+    return dp
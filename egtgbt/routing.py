@@ -0,0 +1,68 @@
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery
+
+
+class CallbackRouter:
+    """Dispatches callback queries by a dict lookup on callback_data.
+
+    aiogram tries callback filters one by one, so a bot with N buttons pays up
+    to N filter calls per click. Here exact callback_data values map straight
+    to their handler and prefixes (e.g. "template_") are matched by slicing the
+    data once per distinct prefix length, so the cost does not grow with the
+    number of buttons.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.prefixes = {}
+        self._prefix_lengths = ()
+
+    def __len__(self):
+        return len(self.handlers) + len(self.prefixes)
+
+    def add(self, callback_data, handler):
+        # Like aiogram's filter chain, the handler registered first wins.
+        self.handlers.setdefault(callback_data, CallableObject(handler))
+        return handler
+
+    def add_prefix(self, prefix, handler):
+        self.prefixes.setdefault(prefix, CallableObject(handler))
+        self._prefix_lengths = tuple(sorted({len(p) for p in self.prefixes}, reverse=True))
+        return handler
+
+    def exact(self, callback_data):
+        def decorator(handler):
+            return self.add(callback_data, handler)
+        return decorator
+
+    def prefix(self, prefix):
+        def decorator(handler):
+            return self.add_prefix(prefix, handler)
+        return decorator
+
+    def resolve(self, data):
+        if data is None:
+            return None
+        handler = self.handlers.get(data)
+        if handler is not None:
+            return handler
+        # Longest prefix wins.
+        for length in self._prefix_lengths:
+            handler = self.prefixes.get(data[:length])
+            if handler is not None:
+                return handler
+        return None
+
+    async def _filter(self, callback: CallbackQuery):
+        handler = self.resolve(callback.data)
+        if handler is None:
+            return False
+        return {"callback_route": handler}
+
+    async def _dispatch(self, callback: CallbackQuery, callback_route, **kwargs):
+        return await callback_route.call(callback, **kwargs)
+
+    def attach(self, router):
+        """Register this table as a single callback_query handler on an aiogram Router or Dispatcher."""
+        router.callback_query.register(self._dispatch, self._filter)
+        return router
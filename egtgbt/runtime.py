@@ -0,0 +1,111 @@
+import asyncio
+import os
+import signal
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from dotenv import load_dotenv
+from egtgbt.interpreter import build_table_router
+from egtgbt.webhook import serve_socket, socket_path, webhook_secret, SOCKETS_DIR
+from utils.utils_logging import LoggingContextMiddleware, config_id_var, setup_logging
+from utils.utils_metrics import METRICS_ENV, instrument, metrics_socket_path, serve_snapshot_socket
+from utils.utils_sendqueue import throttle
+from utils.utils_profiler import SamplingProfiler, install_profile_signal
+from utils.utils_telegram import bot_session
+
+
+def create_bot(bot_token, **kwargs):
+    kwargs.setdefault("session", bot_session())
+    return Bot(bot_token, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN), **kwargs)
+
+
+def build_dispatcher(commands, callbacks, name=None, **kwargs):
+    dp = Dispatcher(**kwargs)
+    dp.include_router(build_table_router(commands, callbacks, name=name))
+    return dp
+
+
+def load_token(module_file, config_id):
+    env_path = os.path.join(os.path.dirname(os.path.abspath(module_file)), f"bot_{config_id}.env")
+    load_dotenv(env_path)
+    return os.getenv("BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
+
+
+def notify_ready():
+    """Tell the supervisor waiting on BOT_READY_FD that this bot is up (see Supervisor.replace)."""
+    fd = os.environ.pop("BOT_READY_FD", None)
+    if fd is not None:
+        os.write(int(fd), b"ready\n")
+        os.close(int(fd))
+
+
+def wait_for_start():
+    """Block until the supervisor has drained the version this bot replaces (see Supervisor.replace).
+
+    Reading EOF, e.g. because the builder died, also lets the bot start.
+    """
+    fd = os.environ.pop("BOT_START_FD", None)
+    if fd is not None:
+        with os.fdopen(int(fd), "rb") as pipe:
+            pipe.readline()
+
+
+async def start(module_file, config_id, commands, callbacks, bot_name=None):
+    bot = create_bot(load_token(module_file, config_id))
+    dp = build_dispatcher(commands, callbacks, name=bot_name)
+    throttle(bot, config_id)
+    # Every record of this process belongs to config_id, updates add their user_id.
+    config_id_var.set(config_id)
+    dp.update.outer_middleware(LoggingContextMiddleware(config_id))
+    # kill -USR1 <pid> (or /profile in the builder) profiles this bot for a while.
+    install_profile_signal(SamplingProfiler(f"bot_{config_id}"))
+    if os.getenv(METRICS_ENV):
+        instrument(bot, dp, config_id)
+    # getMe proves the token works before the previous version is drained; polling reuses the cached result.
+    await bot.me()
+    webhook_url = os.getenv("BOT_WEBHOOK_URL")
+    metrics = None
+    try:
+        if os.getenv(METRICS_ENV):
+            # The builder collects these numbers from the socket and serves them with its own.
+            metrics_path = metrics_socket_path(config_id, os.getpid(), os.getenv("BOT_SOCKETS_DIR", SOCKETS_DIR))
+            metrics = await serve_snapshot_socket(metrics_path)
+        if webhook_url:
+            await serve_webhook(bot, dp, config_id, webhook_url)
+        else:
+            # A bot that ran on webhooks before cannot call getUpdates until its webhook is removed.
+            await bot.delete_webhook()
+            notify_ready()
+            # Polling next to the old version would make both getUpdates calls fail with 409 Conflict.
+            await asyncio.to_thread(wait_for_start)
+            await dp.start_polling(bot)
+    finally:
+        if metrics is not None:
+            await metrics.cleanup()
+            if os.path.exists(metrics_path):
+                os.remove(metrics_path)
+
+
+async def serve_webhook(bot, dp, config_id, webhook_url):
+    """Receive updates forwarded by the builder's WebhookIngress on a unix socket until SIGTERM."""
+    await bot.set_webhook(webhook_url, secret_token=webhook_secret(bot.token))
+    path = socket_path(config_id, os.getpid(), os.getenv("BOT_SOCKETS_DIR", SOCKETS_DIR))
+    runner = await serve_socket(bot, dp, path)
+    notify_ready()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if os.path.exists(path):
+            os.remove(path)
+        await bot.session.close()
+
+
+def run(module_file, config_id, commands, callbacks, bot_name=None):
+    """Entry point of a generated bots/bot_N.py module."""
+    setup_logging()
+    asyncio.run(start(module_file, config_id, commands, callbacks, bot_name))
@@ -0,0 +1,409 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import psutil
+from egtgbt.host import BOTS_DIR, RUN_MODE_SUBPROCESS
+from egtgbt.webhook import SOCKETS_DIR, socket_path, webhook_secret
+from utils.utils_metrics import METRICS_ENV, fetch_snapshot, metrics_socket_path
+from utils.utils_telegram import token_hash
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(BOTS_DIR)
+
+STATUS_RUNNING = "running"
+STATUS_BACKOFF = "backoff"
+STATUS_STOPPED = "stopped"
+STATUS_FAILED = "failed"
+
+# A bot started by replace() writes a line to this inherited pipe once getMe succeeds.
+READY_FD_ENV = "BOT_READY_FD"
+# A polling bot started by replace() then waits for a line (or EOF) on this one before its first getUpdates.
+START_FD_ENV = "BOT_START_FD"
+
+
+def bot_env(bot_token, **extra):
+    # Generated bots run from bots/ and import the shared egtgbt runtime from the project root.
+    pythonpath = os.pathsep.join(filter(None, [PROJECT_DIR, os.environ.get("PYTHONPATH")]))
+    return {**os.environ, "BOT_TOKEN": bot_token, "PYTHONPATH": pythonpath, **extra}
+
+
+def is_bot_process(pid, script):
+    """True if pid is alive and runs script; guards against acting on a recycled pid."""
+    try:
+        process = psutil.Process(pid)
+        if process.status() == psutil.STATUS_ZOMBIE:
+            return False
+        cmdline = process.cmdline()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+    return len(cmdline) >= 2 and os.path.realpath(cmdline[-1]) == os.path.realpath(script)
+
+
+async def wait_pid(pid, popen=None, poll_interval=1.0):
+    """Wait for a process to exit without blocking the loop; returns its exit code if it is our child.
+
+    Uses a pidfd registered with the event loop where available (Linux 5.3+),
+    which also works for adopted processes that are not our children, and
+    falls back to polling otherwise.
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        fd = None
+    except (AttributeError, OSError):
+        fd = -1
+    if fd is not None and fd >= 0:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+    elif fd == -1:
+        while (popen.poll() is None) if popen is not None else psutil.pid_exists(pid):
+            await asyncio.sleep(poll_interval)
+    return popen.wait() if popen is not None else None
+
+
+class Supervisor:
+    """Owns the subprocess bots: starts them, watches for exits and restarts crashes.
+
+    Bots run in their own session and outlive the builder, so a builder
+    restart adopts the processes still recorded in bot_configs (after
+    checking their command line) instead of restarting them. Exits are
+    awaited through pidfds on the event loop, so nothing here blocks it. A
+    bot that exits without being asked to is restarted after an exponential
+    backoff (``backoff_initial`` doubling up to ``backoff_max``); the backoff
+    resets once a run has lasted ``stable_after`` seconds, and after
+    ``max_restarts`` consecutive failures the bot is marked failed. Status,
+    pid, restart count and last exit code are kept in bot_configs.
+
+    replace() swaps a bot for a new version blue/green: the old process
+    keeps serving until the new one reports readiness, then it is drained.
+    In webhook mode the two overlap and the ingress route moves to the new
+    pid. Polling bots cannot overlap: two getUpdates callers on one token
+    get 409 Conflict. So the new version stops after getMe and waits, the
+    old one is drained, and only then does the new one start polling.
+    Updates sent in that window wait at Telegram and are not lost, but they
+    are late by up to the old bot's shutdown time. Updates the old bot
+    fetched but had not confirmed before it exited are delivered again to
+    the new one.
+
+    Given a WebhookIngress, bots are started in webhook mode and the
+    ingress forwards each bot's updates to the unix socket of its current pid.
+    With ``metrics`` on, bots also serve their metrics on a unix socket and
+    metrics_snapshots() collects them.
+    """
+
+    def __init__(self, db, bots_dir=BOTS_DIR, backoff_initial=1.0, backoff_max=60.0, stable_after=30.0,
+                 max_restarts=10, stop_timeout=3.0, concurrency=16, ready_timeout=30.0, drain_timeout=10.0,
+                 webhook=None, sockets_dir=SOCKETS_DIR, metrics=False):
+        self.db = db
+        self.bots_dir = bots_dir
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.max_restarts = max_restarts
+        self.stop_timeout = stop_timeout
+        self.concurrency = concurrency
+        self.ready_timeout = ready_timeout
+        self.drain_timeout = drain_timeout
+        self.webhook = webhook
+        self.sockets_dir = sockets_dir
+        self.metrics = metrics
+        self.processes = {}
+        self._children = {}
+        self._watchers = {}
+        self._tokens = {}
+
+    def __contains__(self, config_id):
+        return config_id in self.processes
+
+    def script(self, config_id):
+        return os.path.join(self.bots_dir, f"bot_{config_id}.py")
+
+    async def _record(self, config_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        await self.db.execute(f'UPDATE bot_configs SET {columns} WHERE config_id = ?', (*fields.values(), config_id))
+
+    def backoff(self, failures):
+        return min(self.backoff_initial * 2 ** (failures - 1), self.backoff_max)
+
+    def _env(self, bot_token, **extra):
+        if self.webhook is not None:
+            extra.update(BOT_WEBHOOK_URL=self.webhook.url(bot_token), BOT_SOCKETS_DIR=self.sockets_dir)
+        if self.metrics:
+            extra.update({METRICS_ENV: "1", "BOT_SOCKETS_DIR": self.sockets_dir})
+        return bot_env(bot_token, **extra)
+
+    def _spawn(self, config_id, bot_token):
+        popen = subprocess.Popen(
+            [sys.executable, self.script(config_id)], cwd=self.bots_dir, env=self._env(bot_token), start_new_session=True
+        )
+        self._register(config_id, bot_token, popen.pid, popen)
+        return popen.pid
+
+    def _register(self, config_id, bot_token, pid, popen=None):
+        self.processes[config_id] = pid
+        if popen is not None:
+            self._children[config_id] = popen
+        self._tokens[config_id] = bot_token
+        if self.webhook is not None:
+            self.webhook.add_socket(bot_token, socket_path(config_id, pid, self.sockets_dir))
+
+    def _supervise(self, config_id, bot_token):
+        self._watchers[config_id] = asyncio.create_task(
+            self._watch(config_id, bot_token), name=f"supervise_bot_{config_id}"
+        )
+
+    async def start(self, config_id, bot_token):
+        """Start bots/bot_{config_id}.py, stopping whatever ran for this config before."""
+        script = self.script(config_id)
+        if not os.path.exists(script):
+            raise FileNotFoundError(script)
+        await self.stop(config_id, status=None)
+        pid = self._spawn(config_id, bot_token)
+        self._supervise(config_id, bot_token)
+        await self._record(config_id, pid=pid, status=STATUS_RUNNING, run_mode=RUN_MODE_SUBPROCESS,
+                           token_hash=token_hash(bot_token))
+        logger.info("Bot %s started with pid %s", config_id, pid)
+        return pid
+
+    async def replace(self, config_id, bot_token):
+        """Blue/green restart: start the new version, wait until it is ready, then drain the old one.
+
+        If the new process exits or times out before reporting readiness it is
+        killed, the old one keeps running and RuntimeError is raised. A
+        polling bot only starts polling once the old one is gone.
+        """
+        script = self.script(config_id)
+        if not os.path.exists(script):
+            raise FileNotFoundError(script)
+        read_fd, write_fd = os.pipe()
+        fds = {READY_FD_ENV: write_fd}
+        start_write = None
+        if self.webhook is None:
+            fds[START_FD_ENV], start_write = os.pipe()
+        try:
+            popen = subprocess.Popen(
+                [sys.executable, script], cwd=self.bots_dir, start_new_session=True, pass_fds=tuple(fds.values()),
+                env=self._env(bot_token, **{name: str(fd) for name, fd in fds.items()}),
+            )
+        except BaseException:
+            os.close(read_fd)
+            if start_write is not None:
+                os.close(start_write)
+            raise
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+        try:
+            await self._swap(config_id, bot_token, popen, read_fd, start_write)
+        finally:
+            if start_write is not None:
+                # Lets the new bot poll; EOF after a rollback or an error does the same, but it is killed then.
+                self._allow_start(start_write)
+        return popen.pid
+
+    async def _swap(self, config_id, bot_token, popen, read_fd, start_write):
+        if not await self._wait_ready(read_fd):
+            await self._terminate(popen.pid, popen)
+            logger.error("Bot %s (pid %s) did not become ready; rolled back", config_id, popen.pid)
+            if config_id not in self.processes and await self._recorded_pid(config_id) is None:
+                await self._record(config_id, pid=None, status=STATUS_FAILED, last_exit_code=popen.returncode)
+            raise RuntimeError(f"Bot {config_id} did not become ready")
+        await self._cancel(config_id)
+        old_pid = self.processes.pop(config_id, None)
+        old_popen = self._children.pop(config_id, None)
+        if old_pid is None:
+            old_pid = await self._recorded_pid(config_id)
+        self._register(config_id, bot_token, popen.pid, popen)
+        self._supervise(config_id, bot_token)
+        await self._record(config_id, pid=popen.pid, status=STATUS_RUNNING, run_mode=RUN_MODE_SUBPROCESS,
+                           token_hash=token_hash(bot_token))
+        if old_pid is not None:
+            await self._terminate(old_pid, old_popen, self.drain_timeout)
+        logger.info("Bot %s replaced: pid %s -> %s", config_id, old_pid, popen.pid)
+
+    @staticmethod
+    def _allow_start(fd):
+        try:
+            os.write(fd, b"start\n")
+        except BrokenPipeError:
+            # The new bot already exited; its watcher restarts it.
+            pass
+        finally:
+            os.close(fd)
+
+    async def _wait_ready(self, fd):
+        loop = asyncio.get_running_loop()
+        line = loop.create_future()
+        loop.add_reader(fd, lambda: line.done() or line.set_result(os.read(fd, 64)))
+        try:
+            # An empty read means the bot closed the pipe, i.e. exited, before becoming ready.
+            return bool(await asyncio.wait_for(line, timeout=self.ready_timeout))
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+
+    def adopt(self, config_id, bot_token, pid):
+        """Supervise an already running bot process left by a previous builder."""
+        self._register(config_id, bot_token, pid)
+        self._supervise(config_id, bot_token)
+        logger.info("Bot %s adopted with pid %s", config_id, pid)
+
+    async def _watch(self, config_id, bot_token):
+        failures = 0
+        while True:
+            started = time.monotonic()
+            returncode = await wait_pid(self.processes[config_id], self._children.get(config_id))
+            if time.monotonic() - started >= self.stable_after:
+                failures = 0
+            failures += 1
+            self.processes.pop(config_id, None)
+            self._children.pop(config_id, None)
+            if failures > self.max_restarts:
+                logger.error("Bot %s exited with code %s; giving up after %d restarts", config_id, returncode, self.max_restarts)
+                await self._record(config_id, pid=None, status=STATUS_FAILED, last_exit_code=returncode)
+                return
+            delay = self.backoff(failures)
+            logger.warning("Bot %s exited with code %s; restarting in %.1fs", config_id, returncode, delay)
+            await self._record(config_id, pid=None, status=STATUS_BACKOFF, last_exit_code=returncode)
+            await asyncio.sleep(delay)
+            try:
+                pid = self._spawn(config_id, bot_token)
+            except OSError:
+                logger.exception("Failed to restart bot %s", config_id)
+                continue
+            await self.db.execute(
+                'UPDATE bot_configs SET pid = ?, status = ?, restart_count = COALESCE(restart_count, 0) + 1 WHERE config_id = ?',
+                (pid, STATUS_RUNNING, config_id)
+            )
+
+    async def adopt_unknown(self, key, secret):
+        """Ingress resolver: adopt the running bot whose token hashes to key, e.g. one just started by the CLI.
+
+        Only a request carrying that bot's webhook secret gets as far as the process check.
+        """
+        row = await self.db.fetchone(
+            'SELECT config_id, bot_token, pid FROM bot_configs WHERE token_hash = ? AND pid IS NOT NULL', (key,)
+        )
+        if row is None or row[0] in self.processes:
+            return False
+        config_id, bot_token, pid = row
+        if not hmac.compare_digest(webhook_secret(bot_token), secret):
+            return False
+        if await asyncio.to_thread(is_bot_process, pid, self.script(config_id)):
+            self.adopt(config_id, bot_token, pid)
+            return True
+        return False
+
+    async def _cancel(self, config_id):
+        watcher = self._watchers.pop(config_id, None)
+        if watcher is not None:
+            watcher.cancel()
+            try:
+                await watcher
+            except asyncio.CancelledError:
+                pass
+
+    async def stop(self, config_id, status=STATUS_STOPPED):
+        """Stop the bot's process, whether it is supervised here or only its pid is on record."""
+        await self._cancel(config_id)
+        pid = self.processes.pop(config_id, None)
+        popen = self._children.pop(config_id, None)
+        bot_token = self._tokens.pop(config_id, None)
+        if self.webhook is not None and bot_token is not None:
+            self.webhook.remove(bot_token)
+        if pid is None:
+            pid = await self._recorded_pid(config_id)
+        if pid is not None:
+            await self._terminate(pid, popen)
+        fields = {"pid": None} if status is None else {"pid": None, "status": status}
+        await self._record(config_id, **fields)
+
+    async def metrics_snapshots(self):
+        """Registry snapshots of the running bots; bots that do not answer are left out."""
+        snapshots = await asyncio.gather(*(
+            fetch_snapshot(metrics_socket_path(config_id, pid, self.sockets_dir))
+            for config_id, pid in list(self.processes.items())
+        ))
+        return [snapshot for snapshot in snapshots if snapshot is not None]
+
+    async def is_running(self, config_id):
+        return config_id in self.processes or await self._recorded_pid(config_id) is not None
+
+    async def _recorded_pid(self, config_id):
+        """The pid on record for an unsupervised bot (e.g. started by the CLI), if it is still that bot."""
+        row = await self.db.fetchone('SELECT pid FROM bot_configs WHERE config_id = ?', (config_id,))
+        # psutil reads /proc, which blocks; keep it off the event loop (see resume()).
+        if row and row[0] and await asyncio.to_thread(is_bot_process, row[0], self.script(config_id)):
+            return row[0]
+        return None
+
+    async def _terminate(self, pid, popen=None, timeout=None):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            await asyncio.wait_for(wait_pid(pid, popen), timeout=timeout or self.stop_timeout)
+        except ProcessLookupError:
+            if popen is not None:
+                popen.wait()
+        except asyncio.TimeoutError:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await wait_pid(pid, popen)
+
+    async def resume(self):
+        """Adopt the bots still running from before a builder restart and start the dead ones.
+
+        Returns (adopted, restarted).
+        """
+        rows = await self.db.fetchall(
+            'SELECT config_id, bot_token, pid FROM bot_configs '
+            'WHERE bot_token IS NOT NULL AND COALESCE(run_mode, ?) = ? AND (pid IS NOT NULL OR status IN (?, ?))',
+            (RUN_MODE_SUBPROCESS, RUN_MODE_SUBPROCESS, STATUS_RUNNING, STATUS_BACKOFF)
+        )
+
+        def check():
+            return [bool(pid) and is_bot_process(pid, self.script(config_id)) for config_id, _, pid in rows]
+
+        alive = await asyncio.to_thread(check)
+        dead = []
+        for (config_id, bot_token, pid), is_alive in zip(rows, alive):
+            if is_alive:
+                self.adopt(config_id, bot_token, pid)
+            else:
+                dead.append((config_id, bot_token))
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def restart(config_id, bot_token):
+            async with limit:
+                try:
+                    await self.start(config_id, bot_token)
+                except Exception as e:
+                    logger.error("Failed to restart bot %s: %s", config_id, e)
+                    await self._record(config_id, pid=None, status=STATUS_FAILED)
+
+        await asyncio.gather(*(restart(config_id, bot_token) for config_id, bot_token in dead))
+        logger.info("Adopted %d running bots, restarted %d", len(rows) - len(dead), len(dead))
+        return len(rows) - len(dead), len(dead)
+
+    async def close(self):
+        """Stop supervising on builder shutdown; the bots keep running and are adopted on the next start."""
+        for config_id in list(self._watchers):
+            await self._cancel(config_id)
+        self.processes.clear()
+        self._children.clear()
+        self._tokens.clear()
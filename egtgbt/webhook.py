@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import aiohttp
+from aiohttp import web
+from utils.utils_telegram import token_hash
+
+logger = logging.getLogger(__name__)
+
+# Public https URL the ingress is reachable at; webhook mode is on when it is set.
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = "/webhook"
+SOCKETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bots", "sockets")
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_secret(bot_token):
+    """Per-bot secret_token for setWebhook; Telegram echoes it in SECRET_HEADER."""
+    return hmac.new(bot_token.encode("utf-8"), b"webhook", hashlib.sha256).hexdigest()
+
+
+def socket_path(config_id, pid, sockets_dir=SOCKETS_DIR):
+    """Unix socket a subprocess bot serves updates on; per pid, so blue/green versions do not clash."""
+    return os.path.join(sockets_dir, f"bot_{config_id}.{pid}.sock")
+
+
+def feed_in_background(bot, dp, update, tasks):
+    task = asyncio.create_task(dp.feed_raw_update(bot, update))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
+async def serve_socket(bot, dp, path):
+    """Accept updates forwarded by WebhookIngress on a unix socket and feed them to dp; returns the runner."""
+    tasks = set()
+
+    async def handle(request):
+        feed_in_background(bot, dp, await request.json(), tasks)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    await web.UnixSite(runner, path).start()
+    return runner
+
+
+def default_ingress():
+    """The ingress configured by WEBHOOK_BASE_URL, or None to keep long polling."""
+    return WebhookIngress() if WEBHOOK_BASE_URL else None
+
+
+class WebhookIngress:
+    """One aiohttp server receiving webhook updates for every bot.
+
+    Telegram posts to ``{base_url}/webhook/{token_hash}``; the path selects
+    the bot and the secret header is checked against that bot's
+    webhook_secret(). An update is either fed to an in-process Dispatcher in
+    a background task, or forwarded to a subprocess bot's unix socket.
+    Updates are acknowledged right away; a forward that fails returns 503 so
+    Telegram redelivers it, e.g. while a bot is being replaced. ``resolver``
+    is awaited with an unknown key and the request's secret header, and may
+    add its route; requests without a secret never reach it.
+    """
+
+    def __init__(self, base_url=WEBHOOK_BASE_URL, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        self.base_url = (base_url or "").rstrip("/")
+        self.host = host
+        self.port = port
+        self.routes = {}
+        self._sessions = {}
+        self._tasks = set()
+        self._runner = None
+        self.resolver = None
+
+    def __len__(self):
+        return len(self.routes)
+
+    def url(self, bot_token):
+        return f"{self.base_url}{WEBHOOK_PATH}/{token_hash(bot_token)}"
+
+    async def attach(self, bot, dp):
+        """Point the bot's webhook at this ingress and route its updates to dp."""
+        await bot.set_webhook(self.url(bot.token), secret_token=webhook_secret(bot.token))
+        return self.add_dispatcher(bot, dp)
+
+    def add_dispatcher(self, bot, dp):
+        key = token_hash(bot.token)
+        self.routes[key] = (webhook_secret(bot.token), lambda update: self._feed(bot, dp, update))
+        return key
+
+    def add_socket(self, bot_token, path):
+        key = token_hash(bot_token)
+        self._close_session(key)
+        self.routes[key] = (webhook_secret(bot_token), lambda update: self._forward(key, path, update))
+        return key
+
+    def remove(self, bot_token):
+        key = token_hash(bot_token)
+        self.routes.pop(key, None)
+        self._close_session(key)
+
+    def _close_session(self, key):
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            asyncio.ensure_future(session.close())
+
+    async def _feed(self, bot, dp, update):
+        feed_in_background(bot, dp, update, self._tasks)
+        return True
+
+    async def _forward(self, key, path, update):
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=path), timeout=aiohttp.ClientTimeout(total=10)
+            )
+        try:
+            async with session.post("http://bot/", json=update) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Forwarding update to %s failed: %r", path, e)
+            return False
+
+    async def handle(self, request):
+        key = request.match_info["key"]
+        route = self.routes.get(key)
+        presented = request.headers.get(SECRET_HEADER, "")
+        if route is None and presented and self.resolver is not None and await self.resolver(key, presented):
+            route = self.routes.get(key)
+        if route is None:
+            raise web.HTTPNotFound()
+        secret, deliver = route
+        if not hmac.compare_digest(presented, secret):
+            raise web.HTTPForbidden()
+        if not await deliver(await request.json()):
+            raise web.HTTPServiceUnavailable()
+        return web.Response()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH + "/{key}", self.handle)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app(), handle_signals=False, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Webhook ingress listening on %s:%s", self.host, self.port)
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for key in list(self._sessions):
+            await self._sessions.pop(key).close()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,26 +1,73 @@
+import hashlib
 import json
 import os
 import logging
-from jinja2 import Environment, FileSystemLoader
-from utils.utils_validation import validate_config, validate_block_schema
-import sys
+from functools import lru_cache
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from egtgbt import interpreter
+from egtgbt.interpreter import compile_config
+from utils.utils_metrics import GENERATE_SECONDS
 
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = 'bot_template.py.j2'
+# Compiled template bytecode survives between CLI runs, so a cold start skips Jinja compilation.
+BYTECODE_CACHE_DIR = os.path.join(TEMPLATE_DIR, '__pycache__', 'jinja')
+
+
+@lru_cache(maxsize=None)
+def get_environment():
+    os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_template():
+    return get_environment().get_template(TEMPLATE_NAME)
+
+
+@lru_cache(maxsize=None)
+def template_version():
+    """Hash of everything besides the config that shapes a rendered bot: the template and compile_config."""
+    digest = hashlib.sha256()
+    for path in (os.path.join(TEMPLATE_DIR, TEMPLATE_NAME), interpreter.__file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def content_hash(config, bot_token):
+    """Identifies a bot's rendered output: normalized config, token and template version."""
+    normalized = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256('\0'.join((normalized, bot_token, template_version())).encode('utf-8')).hexdigest()
 
-logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 
 def generate(config, output_file, config_id=None):
-    is_valid, error = validate_config(config)
-    if not is_valid:
-        raise ValueError(error)
-    
-    is_valid, error = validate_block_schema(config)
-    if not is_valid:
-        raise ValueError(error)
-    
-    logging.debug(f"Generating bot with config: {json.dumps(config, indent=2, ensure_ascii=False)}")
-    
-    env = Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))))
-    template = env.get_template('bot_template.py.j2')
-    output_code = template.render(config=config, config_id=config_id or os.path.basename(output_file).split('.')[0].split('_')[-1])
-    with open(output_file, 'w', encoding='utf-8-sig') as f:
-        f.write(output_code)
+    with GENERATE_SECONDS.time():
+        # compile_config validates the config (validate_bot_config) and raises ValueError.
+        commands, callbacks = compile_config(config)
+
+        logger.debug("Generating bot", extra={"config_id": config_id, "config": config})
+
+        output_code = get_template().render(
+            bot_name=config['bot_name'],
+            config_id=config_id or os.path.basename(output_file).split('.')[0].split('_')[-1],
+            commands=repr(commands),
+            callbacks=repr(callbacks),
+        )
+        with open(output_file, 'w', encoding='utf-8-sig') as f:
+            f.write(output_code)
+
+
+def render_bot(config, bot_token, config_id, bots_dir='bots'):
+    """Write bots_dir/bot_{config_id}.py and its .env; top-level so a process pool can run it."""
+    os.makedirs(bots_dir, exist_ok=True)
+    output_file = os.path.join(bots_dir, f"bot_{config_id}.py")
+    generate(config, output_file, config_id)
+    with open(os.path.join(bots_dir, f"bot_{config_id}.env"), "w", encoding="utf-8") as f:
+        f.write(f"BOT_TOKEN={bot_token}\n")
+    return output_file
@@ -1,11 +1,7 @@
 import asyncio
-import sys
 import sqlite3
 import json
 import os
-import subprocess
-import psutil
-import aiohttp
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
@@ -13,63 +9,61 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from utils.utils_validation import validate_config, validate_block_schema
+from utils.utils_validation import validate_bot_config, is_valid_text
+from egtgbt.host import BotHost, DEFAULT_RUN_MODE, RUN_MODE_INPROCESS
+from egtgbt.interpreter import check_config
+from egtgbt.routing import CallbackRouter
+from egtgbt.supervisor import Supervisor
+from egtgbt.webhook import default_ingress
+from utils.utils_db import Database
+from utils.utils_fsm_storage import SQLiteStorage
+from utils.utils_migrations import migrate
+from utils.utils_cache import LRUCache
+from utils.utils_users import RegisteredUsers
+from utils.utils_markdown import escape_markdown, business_card_handlers, faq_handlers
+from utils.utils_metrics import BUILDER_ID, METRICS_PORT, REGISTRY, cache_snapshot, instrument, serve_metrics
+from utils.utils_profiler import PROFILE_SECONDS, SamplingProfiler, install_profile_signal, request_profile
+from utils.utils_telegram import TelegramApi, bot_session
+from utils.utils_logging import LoggingContextMiddleware, setup_logging
+from utils.utils_sendqueue import throttle
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
 
-def init_db():
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS bot_configs (
-            config_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            bot_name TEXT,
-            config_json TEXT,
-            bot_token TEXT,
-            pid INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    try:
-        c.execute('ALTER TABLE bot_configs ADD COLUMN bot_token TEXT')
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute('ALTER TABLE bot_configs ADD COLUMN pid INTEGER')
-    except sqlite3.OperationalError:
-        pass
-    c.execute('SELECT config_id, pid FROM bot_configs WHERE pid IS NOT NULL')
-    for config_id, pid in c.fetchall():
-        try:
-            process = psutil.Process(pid)
-            process.terminate()
-            process.wait(timeout=3)
-        except (psutil.NoSuchProcess, psutil.TimeoutExpired):
-            pass
-        c.execute('UPDATE bot_configs SET pid = NULL WHERE config_id = ?', (config_id,))
-    conn.commit()
+def init_db(path='bot_users.db'):
+    conn = sqlite3.connect(path)
+    # journal_mode answers with a row; an unread statement would keep migrate() from committing.
+    conn.execute('PRAGMA journal_mode=WAL').fetchone()
+    migrate(conn)
     conn.close()
 
-dp = Dispatcher(storage=MemoryStorage())
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+db = Database('bot_users.db')
+# Wizard state survives builder restarts and is written to SQLite in batches.
+dp = Dispatcher(storage=SQLiteStorage(db))
+# Records logged while handling an update carry the user's id.
+dp.update.outer_middleware(LoggingContextMiddleware())
+# Registered user ids, so repeat visitors never hit SQLite on /start.
+known_users = LRUCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "100000")))
+users = RegisteredUsers(db, known_users)
+bot = Bot(BOT_TOKEN, session=bot_session(), default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+# Replies go out within Telegram's flood limits instead of running into 429s.
+throttle(bot, BUILDER_ID)
+# With WEBHOOK_BASE_URL set, generated bots get updates through one shared webhook server instead of long polling.
+ingress = default_ingress()
+host = BotHost(webhook=ingress, metrics=METRICS_PORT is not None)
+# Owns the subprocess bots, restarts them if they crash and adopts them across builder restarts.
+supervisor = Supervisor(db, webhook=ingress, metrics=METRICS_PORT is not None)
+if ingress is not None:
+    ingress.resolver = supervisor.adopt_unknown
+telegram_api = TelegramApi()
+# Telegram user ids allowed to run admin commands such as /profile, e.g. ADMIN_IDS=123,456.
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+profiler = SamplingProfiler("builder")
+callbacks = CallbackRouter()
 
 class RegistrationForm(StatesGroup):
     name = State()
@@ -96,12 +90,7 @@ class BotDeleteForm(StatesGroup):
 
 @dp.message(Command("start"))
 async def command_start_handler(message: Message, state: FSMContext) -> None:
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE user_id = ?', (message.from_user.id,))
-    user = c.fetchone()
-    conn.close()
-    if user:
+    if await users.is_registered(message.from_user.id):
         keyboard_buttons = [
             [
                 InlineKeyboardButton(text="Создать бота", callback_data="menu_create_bot"),
@@ -120,40 +109,6 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
         await message.answer("Привет! Давай зарегистрируем тебя. Введи свое имя:")
         await state.set_state(RegistrationForm.name)
 
-def escape_markdown(text):
-    """Escape special MarkdownV2 characters for Telegram."""
-    if text is None:
-        return ""
-    special_chars = {
-        '_': '\\_',
-        '*': '\\*',
-        '[': '\\[',
-        ']': '\\]',
-        '(': '\\(',
-        ')': '\\)',
-        '~': '\\~',
-        '`': '\\`',
-        '>': '\\>',
-        '#': '\\#',
-        '+': '\\+',
-        '-': '\\-',
-        '=': '\\=',
-        '|': '\\|',
-        '{': '\\{',
-        '}': '\\}',
-        '.': '\\.',
-        '!': '\\!',
-        '"': '\\"',
-        "'": "\\'",
-        "\\": "\\\\",
-        "\n": "\\n",
-        "\r": "\\r",
-        "\t": "\\t",
-    }
-    for char, escaped in special_chars.items():
-        text = text.replace(char, escaped)
-    return text
-
 @dp.message(Command("help"))
 async def command_help_handler(message: Message) -> None:
     await message.answer("Используйте /menu для управления ботами или /start для начала работы.")
@@ -176,22 +131,22 @@ async def command_faq_handler(message: Message) -> None:
         reply_markup=keyboard
     )
 
-@dp.callback_query(lambda c: c.data == "faq_what_do_you_do")
+@callbacks.exact("faq_what_do_you_do")
 async def callback_faq_what_do_you_do_handler(callback: CallbackQuery) -> None:
     await callback.message.answer("Мы создаем крутые Telegram-боты!")
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "faq_contact")
+@callbacks.exact("faq_contact")
 async def callback_faq_contact_handler(callback: CallbackQuery) -> None:
     await callback.message.answer("Напишите на почту user@example.com или позвоните +1234567890.")
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "faq_location")
+@callbacks.exact("faq_location")
 async def callback_faq_location_handler(callback: CallbackQuery) -> None:
     await callback.message.answer("Наш офис находится в центре города.")
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "faq_q2")
+@callbacks.exact("faq_q2")
 async def callback_faq_q2_handler(callback: CallbackQuery) -> None:
     await callback.message.answer("Ответ на вопрос 2")
     await callback.answer()
@@ -208,7 +163,7 @@ async def create_bot_handler(message: Message, state: FSMContext) -> None:
     await message.answer("Выберите шаблон для нового бота:", reply_markup=keyboard)
     await state.set_state(BotCreationForm.template)
 
-@dp.callback_query(lambda c: c.data.startswith("template_"))
+@callbacks.prefix("template_")
 async def process_template_selection(callback: CallbackQuery, state: FSMContext) -> None:
     template = callback.data.replace("template_", "")
     if template == "business_card":
@@ -248,12 +203,10 @@ async def process_bot_token(message: Message, state: FSMContext) -> None:
     if not bot_token.count(":") == 1 or not bot_token.split(":")[0].isdigit():
         await message.answer("Некорректный формат токена. Попробуйте снова или /cancel.")
         return
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"https://api.telegram.org/bot{bot_token}/getMe") as response:
-            data = await response.json()
-            if not data.get("ok"):
-                await message.answer(f"Недействительный токен: {data.get('description', 'Ошибка')}. Попробуйте снова или /cancel.")
-                return
+    is_valid, result = await telegram_api.verify_token(bot_token)
+    if not is_valid:
+        await message.answer(f"Недействительный токен: {result}. Попробуйте снова или /cancel.")
+        return
     await state.update_data(bot_token=bot_token)
     template = (await state.get_data())['template']
     if template == "business_card":
@@ -334,17 +287,6 @@ async def process_help_text(message: Message, state: FSMContext) -> None:
     await state.update_data(help_text=help_text)
     await finalize_business_card(message, state)
 
-def is_valid_text(text):
-    """Validate text to ensure it contains only safe characters for Markdown and Python strings."""
-    if not text:
-        return False
-    # Expanded allowed_chars to include Russian Cyrillic alphabet
-    allowed_chars = set(
-        "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ,.!?+-*()[]{}:;@#$%^&_=<>~`" +
-        "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
-    )
-    return all(char in allowed_chars for char in text) and len(text.strip()) > 0
-
 @dp.message(FAQCreationForm.faq_count)
 async def process_faq_count(message: Message, state: FSMContext) -> None:
     if message.text == "/cancel":
@@ -401,89 +343,28 @@ async def finalize_business_card(message: Message, state: FSMContext):
     user_data = await state.get_data()
     config = user_data['config']
     bot_token = user_data['bot_token']
-    welcome_text = escape_markdown(user_data['welcome_text'])
-    phone = escape_markdown(user_data.get('phone'))
-    email = escape_markdown(user_data.get('email'))
-    website = escape_markdown(user_data.get('website'))
-    help_text = escape_markdown(user_data['help_text'])
-
-    contact_text = f"*{welcome_text}*\\n\\n📋 *Контактная информация:*\\n"
-    if website:
-        contact_text += f"🌐 *Website:* {website}\\n"
-    if email:
-        contact_text += f"📧 *Email:* {email}\\n"
-    if phone:
-        contact_text += f"📞 *Phone:* {phone}\\n"
-    if not any([website, email, phone]):
-        contact_text += "ℹ️ Контактная информация не указана.\\n"
-
-    handlers = [
-        {
-            "command": "/start",
-            "text": contact_text
-        },
-        {
-            "command": "/help",
-            "text": help_text
-        },
-        {
-            "command": "/create_bot",
-            "text": "Начать создание нового бота."
-        },
-        {
-            "command": "/list_bots",
-            "text": "Показать список ваших ботов."
-        },
-        {
-            "command": "/delete_bot",
-            "text": "Удалить бота."
-        },
-        {
-            "command": "/menu",
-            "text": "Выберите действие:",
-            "reply_markup": {
-                "inline_keyboard": [
-                    [
-                        {"text": "Создать бота", "callback_data": "menu_create_bot", "response": "Начнем создание бота!"},
-                        {"text": "Список ботов", "callback_data": "menu_list_bots", "response": "Показываю ваши боты."}
-                    ],
-                    [
-                        {"text": "Удалить бота", "callback_data": "menu_delete_bot", "response": "Выберите бота для удаления."}
-                    ]
-                ]
-            }
-        }
-    ]
-
-    config['handlers'] = handlers
+    config['handlers'] = business_card_handlers(
+        user_data['welcome_text'], user_data.get('phone'), user_data.get('email'), user_data.get('website'),
+        user_data['help_text']
+    )
 
-    logger.debug(f"Business card config: {json.dumps(config, ensure_ascii=False)}")
-    is_valid, error = validate_config(config)
+    logger.debug("Business card config", extra={"config": config})
+    is_valid, errors = validate_bot_config(config)
     if not is_valid:
-        await message.answer(f"Ошибка в конфигурации: {escape_markdown(str(error))}")
-        await state.clear()
-        return
-    is_valid, error = validate_block_schema(config)
-    if not is_valid:
-        await message.answer(f"Ошибка в конфигурации: {escape_markdown(str(error))}")
+        await message.answer(f"Ошибка в конфигурации: {escape_markdown('; '.join(errors))}")
         await state.clear()
         return
 
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute(
+    _, config_id = await db.execute(
         'INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token) VALUES (?, ?, ?, ?)',
         (message.from_user.id, config['bot_name'], json.dumps(config), bot_token)
     )
-    config_id = c.lastrowid
-    conn.commit()
-    conn.close()
 
     try:
         await generate_and_run_bot(config, bot_token, config_id)
         await message.answer(f"Бот '{config['bot_name']}' успешно создан и запущен! ID: {config_id}")
     except Exception as e:
-        logger.error(f"Error generating bot: {str(e)}")
+        logger.error("Error generating bot: %s", e, extra={"config_id": config_id})
         await message.answer(f"Ошибка при запуске бота: {escape_markdown(str(e))}")
     finally:
         await state.clear()
@@ -494,108 +375,85 @@ async def finalize_faq(message: Message, state: FSMContext):
     bot_token = user_data['bot_token']
     faq_list = user_data.get('faq_list', [])
 
-    faq_text = "Часто задаваемые вопросы:\\nВыберите интересующий вопрос\\."
-    keyboard_buttons = []
-
-    # Create serializable button data for config
-    for i, faq in enumerate(faq_list, 1):
-        callback_data = f"faq_{i}"
-        keyboard_buttons.append([
-            {
-                "text": escape_markdown(faq['question']),
-                "callback_data": callback_data,
-                "response": escape_markdown(faq['answer'])
-            }
-        ])
-
-    handlers = [
-        {
-            "command": "/start",
-            "text": "Добро пожаловать в бот FAQ! Используйте /faq для просмотра вопросов."
-        },
-        {
-            "command": "/faq",
-            "text": faq_text,
-            "reply_markup": {"inline_keyboard": keyboard_buttons}
-        }
-    ]
-
-    config['handlers'] = handlers
+    config['handlers'] = faq_handlers(faq_list)
 
-    # Log the configuration
-    try:
-        logger.debug(f"FAQ config: {json.dumps(config, ensure_ascii=False)}")
-    except Exception as e:
-        logger.error(f"Failed to log config: {str(e)}")
+    logger.debug("FAQ config", extra={"config": config})
 
-    is_valid, error = validate_config(config)
-    if not is_valid:
-        logger.error(f"Config validation failed: {error}")
-        await message.answer(f"Ошибка в конфигурации: {escape_markdown(str(error))}")
-        await state.clear()
-        return
-    is_valid, error = validate_block_schema(config)
+    is_valid, errors = validate_bot_config(config)
     if not is_valid:
-        logger.error(f"Schema validation failed: {error}")
-        await message.answer(f"Ошибка в конфигурации: {escape_markdown(str(error))}")
+        logger.error("Config validation failed: %s", errors)
+        await message.answer(f"Ошибка в конфигурации: {escape_markdown('; '.join(errors))}")
         await state.clear()
         return
 
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute(
+    _, config_id = await db.execute(
         'INSERT INTO bot_configs (user_id, bot_name, config_json, bot_token) VALUES (?, ?, ?, ?)',
         (message.from_user.id, config['bot_name'], json.dumps(config), bot_token)
     )
-    config_id = c.lastrowid
-    conn.commit()
-    conn.close()
 
     try:
         await generate_and_run_bot(config, bot_token, config_id)
         await message.answer(f"Бот '{config['bot_name']}' успешно создан и запущен! ID: {config_id}")
     except Exception as e:
-        logger.error(f"Error generating bot: {str(e)}")
+        logger.error("Error generating bot: %s", e, extra={"config_id": config_id})
         await message.answer(f"Ошибка при запуске бота: {escape_markdown(str(e))}")
     finally:
         await state.clear()
 
-async def generate_and_run_bot(config, bot_token, config_id):
-    from generate import generate
-    output_file = f"bots/bot_{config_id}.py"
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    generate(config, output_file, config_id)
-    env_file = f"bots/bot_{config_id}.env"
-    with open(env_file, "w", encoding="utf-8") as f:
-        f.write(f"BOT_TOKEN={bot_token}\n")
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute('SELECT pid FROM bot_configs WHERE config_id = ?', (config_id,))
-    result = c.fetchone()
-    if result and result[0]:
-        old_pid = result[0]
+def snapshot_files(paths):
+    snapshot = {}
+    for path in paths:
         try:
-            old_process = psutil.Process(old_pid)
-            old_process.terminate()
-            old_process.wait(timeout=3)
-        except (psutil.NoSuchProcess, psutil.TimeoutExpired):
-            pass
-    process = subprocess.Popen(
-        [sys.executable, os.path.abspath(output_file)],
-        cwd=os.path.dirname(os.path.abspath(output_file)),
-        env={**os.environ, "BOT_TOKEN": bot_token}
-    )
-    c.execute('UPDATE bot_configs SET pid = ? WHERE config_id = ?', (process.pid, config_id))
-    conn.commit()
-    conn.close()
+            with open(path, "rb") as f:
+                snapshot[path] = f.read()
+        except FileNotFoundError:
+            snapshot[path] = None
+    return snapshot
+
+def restore_files(snapshot):
+    for path, content in snapshot.items():
+        if content is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            with open(path, "wb") as f:
+                f.write(content)
+
+async def generate_and_run_bot(config, bot_token, config_id):
+    """Render and (re)start the bot; returns False if it already runs this exact version."""
+    check_config(config)
+    result = await db.fetchone('SELECT run_mode, content_hash FROM bot_configs WHERE config_id = ?', (config_id,))
+    run_mode = result[0] if result and result[0] else DEFAULT_RUN_MODE
+    if run_mode == RUN_MODE_INPROCESS:
+        # In-process bots are interpreted straight from config_json by whichever
+        # BotHost owns bot_configs, so nothing is rendered; if that host is this
+        # process, reload the running bot right away.
+        await supervisor.stop(config_id, status=None)
+        await db.execute('UPDATE bot_configs SET run_mode = ? WHERE config_id = ?', (run_mode, config_id))
+        if host.running:
+            await host.start_bot(config_id, bot_token, config)
+        return True
+    from generate import content_hash, render_bot
+    new_hash = content_hash(config, bot_token)
+    if result and result[1] == new_hash and os.path.exists(supervisor.script(config_id)) \
+            and await supervisor.is_running(config_id):
+        logger.info("Bot %s is up to date, skipping regeneration", config_id)
+        return False
+    previous = snapshot_files([f"bots/bot_{config_id}.py", f"bots/bot_{config_id}.env"])
+    render_bot(config, bot_token, config_id)
+    try:
+        # The running version keeps serving until the new one has passed getMe.
+        await supervisor.replace(config_id, bot_token)
+    except Exception:
+        # Put the old files back too, so a crash restart runs the version that is serving.
+        restore_files(previous)
+        raise
+    await db.execute('UPDATE bot_configs SET content_hash = ? WHERE config_id = ?', (new_hash, config_id))
+    return True
 
 @dp.message(Command("list_bots"))
 async def list_bots_handler(message: Message) -> None:
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (message.from_user.id,))
-    bots = c.fetchall()
-    conn.close()
+    bots = await db.fetchall('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (message.from_user.id,))
     if bots:
         response = "Ваши боты:\n" + "\n".join([f"ID: {bot[0]}, Имя: {bot[1]}" for bot in bots])
     else:
@@ -615,16 +473,17 @@ async def process_delete_id(message: Message, state: FSMContext) -> None:
         return
     try:
         config_id = int(message.text)
-        conn = sqlite3.connect('bot_users.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM bot_configs WHERE config_id = ? AND user_id = ?', 
-                  (config_id, message.from_user.id))
-        if c.rowcount > 0:
+        owner = await db.fetchone('SELECT 1 FROM bot_configs WHERE config_id = ? AND user_id = ?',
+                                  (config_id, message.from_user.id))
+        if owner:
+            await supervisor.stop(config_id)
+            await host.stop_bot(config_id)
+        rowcount, _ = await db.execute('DELETE FROM bot_configs WHERE config_id = ? AND user_id = ?',
+                                       (config_id, message.from_user.id))
+        if rowcount > 0:
             await message.answer("Бот успешно удален!")
         else:
             await message.answer("Бот не найден или вы не владелец.")
-        conn.commit()
-        conn.close()
         await state.clear()
     except ValueError:
         await message.answer("Ошибка: ID должен быть числом.")
@@ -647,7 +506,43 @@ async def command_menu_handler(message: Message) -> None:
         reply_markup=keyboard
     )
 
-@dp.callback_query(lambda c: c.data == "menu_create_bot")
+@dp.message(Command("profile"))
+async def command_profile_handler(message: Message) -> None:
+    """/profile [seconds] [config_id]: profile the builder, or the subprocess of a bot, for a while."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администраторам.")
+        return
+    args = message.text.split()[1:]
+    try:
+        seconds = float(args[0]) if args else PROFILE_SECONDS
+        config_id = int(args[1]) if len(args) > 1 else None
+    except ValueError:
+        await message.answer("Использование: /profile [секунды] [ID бота]")
+        return
+    pid = supervisor.processes.get(config_id)
+    if config_id is not None and pid is None and config_id not in host:
+        await message.answer(f"Бот {config_id} не запущен.")
+        return
+    if pid is not None:
+        try:
+            if not request_profile(pid, seconds):
+                # Legacy bots/bot_N.py modules install no handler, and SIGUSR1 would kill them.
+                await message.answer(f"Бот {config_id} не поддерживает профилирование: он собран без egtgbt.runtime "
+                                     "или еще запускается. Пересоздайте бота или повторите позже.")
+                return
+        except ProcessLookupError:
+            await message.answer(f"Бот {config_id} не запущен.")
+            return
+        target = f"бота {config_id}"
+    elif not profiler.start(seconds):
+        await message.answer("Профилирование уже идет.")
+        return
+    else:
+        # In-process bots share the builder's process.
+        target = "конструктора"
+    await message.answer(f"Профилирование {target} запущено на {seconds:.0f} с.")
+
+@callbacks.exact("menu_create_bot")
 async def callback_menu_create_bot_handler(callback: CallbackQuery, state: FSMContext) -> None:
     keyboard_buttons = [
         [
@@ -660,13 +555,9 @@ async def callback_menu_create_bot_handler(callback: CallbackQuery, state: FSMCo
     await state.set_state(BotCreationForm.template)
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "menu_list_bots")
+@callbacks.exact("menu_list_bots")
 async def callback_menu_list_bots_handler(callback: CallbackQuery) -> None:
-    conn = sqlite3.connect('bot_users.db')
-    c = conn.cursor()
-    c.execute('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (callback.from_user.id,))
-    bots = c.fetchall()
-    conn.close()
+    bots = await db.fetchall('SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (callback.from_user.id,))
     if bots:
         response = "Ваши боты:\n" + "\n".join([f"ID: {bot[0]}, Имя: {bot[1]}" for bot in bots])
     else:
@@ -674,7 +565,7 @@ async def callback_menu_list_bots_handler(callback: CallbackQuery) -> None:
     await callback.message.answer(response)
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "menu_delete_bot")
+@callbacks.exact("menu_delete_bot")
 async def callback_menu_delete_bot_handler(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.answer("Введите ID бота для удаления (или /cancel):")
     await state.set_state(BotDeleteForm.config_id)
@@ -694,21 +585,44 @@ async def process_confirm(message: Message, state: FSMContext) -> None:
     if message.text.lower() == "да":
         user_data = await state.get_data()
         name = user_data['name']
-        conn = sqlite3.connect('bot_users.db')
-        c = conn.cursor()
-        c.execute('INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
-                  (message.from_user.id, message.from_user.username, name))
-        conn.commit()
-        conn.close()
+        await users.register(message.from_user.id, message.from_user.username, name)
         await message.answer("Регистрация завершена! Нажми /start, чтобы продолжить.")
         await state.clear()
     else:
         await message.answer("Регистрация отменена! Нажми /start, чтобы начать заново.")
         await state.clear()
 
+callbacks.attach(dp)
+
+async def collect_metrics():
+    return [REGISTRY.snapshot(), cache_snapshot("known_users", known_users), *await supervisor.metrics_snapshots()]
+
 async def main() -> None:
     init_db()
-    await dp.start_polling(bot)
+    await users.warm()
+    if ingress is not None:
+        await ingress.start()
+    await host.load_all()
+    await supervisor.resume()
+    install_profile_signal(profiler)
+    metrics = None
+    if METRICS_PORT is not None:
+        # Builder, in-process and subprocess bots on one endpoint, told apart by config_id.
+        instrument(bot, dp, BUILDER_ID)
+        metrics = await serve_metrics(collect_metrics)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics is not None:
+            await metrics.cleanup()
+        await host.stop_all()
+        await supervisor.close()
+        if ingress is not None:
+            await ingress.close()
+        await dp.storage.close()
+        await telegram_api.close()
+        db.close()
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())
\ No newline at end of file
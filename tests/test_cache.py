@@ -0,0 +1,79 @@
+import sqlite3
+import pytest
+from utils.utils_cache import LRUCache
+from utils.utils_db import Database
+from utils.utils_metrics import cache_snapshot, render
+from utils.utils_migrations import migrate
+from utils.utils_users import RegisteredUsers
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.get(1) == "a"
+    cache.put(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+
+def test_ttl_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.put("token", True)
+    cache.put("forever", True, ttl=100)
+    clock.now = 4.9
+    assert cache.get("token") is True
+    clock.now = 5
+    assert cache.get("token") is None
+    assert len(cache) == 1
+    assert cache.get("forever") is True
+
+
+@pytest.fixture
+def users(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "bot_users.db"))
+    migrate(conn)
+    conn.execute("INSERT INTO users (user_id, first_name) VALUES (1, 'Old')")
+    conn.commit()
+    conn.close()
+    db = Database(str(tmp_path / "bot_users.db"), pool_size=1)
+    yield RegisteredUsers(db, LRUCache(maxsize=10))
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_is_registered_caches_only_registered_users(users):
+    assert await users.is_registered(1)
+    assert await users.is_registered(1)
+    assert not await users.is_registered(2)
+    assert not await users.is_registered(2)
+    assert users.cache.stats()["hits"] == 1 and len(users.cache) == 1
+    assert 'cache_hits_total{cache="known_users"} 1' in render([cache_snapshot("known_users", users.cache)])
+
+
+@pytest.mark.asyncio
+async def test_registration_fills_the_cache(users):
+    assert not await users.is_registered(2)
+    await users.register(2, "new", "New")
+    assert users.cache.get(2) is True
+    assert await users.db.fetchone("SELECT first_name FROM users WHERE user_id = 2") == ("New",)
+    assert await users.is_registered(2)
+
+
+@pytest.mark.asyncio
+async def test_warm_loads_the_newest_users(users):
+    for user_id in range(2, 15):
+        await users.register(user_id, None, "User")
+    users.cache = LRUCache(maxsize=10)
+    await users.warm()
+    assert len(users.cache) == 10
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+from types import SimpleNamespace
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import cli
+from cli import create_bulk, regenerate_all
+from utils.utils_migrations import migrate
+
+pytestmark = pytest.mark.asyncio
+
+SPECS = [
+    {"template": "faq", "name": "FAQ1", "token": "100:AAA", "faqs": ["Q1:A1", {"question": "Q2", "answer": "A2"}]},
+    {"template": "business_card", "name": "Card", "token": "101:BBB", "welcome": "Hello", "help_text": "Help",
+     "run_mode": "inprocess", "user_id": 7},
+    "not json",
+    {"template": "faq", "name": "Dup", "token": "100:AAA", "faqs": ["Q:A"]},
+    {"template": "faq", "name": "Bad", "token": "abc", "faqs": ["Q:A"]},
+    {"template": "faq", "name": "Emoji", "token": "102:CCC", "faqs": ["Вопрос:Ответ", "Q:😀"]},
+    {"template": "poll", "name": "Unknown", "token": "103:DDD"},
+]
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "bot_users.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO bot_configs (user_id, bot_name, bot_token) VALUES (1, 'Old', '102:CCC')")
+    conn.commit()
+    conn.close()
+    return path
+
+async def test_bulk_validates_inserts_and_renders(tmp_path, db_path):
+    specs = tmp_path / "bots.jsonl"
+    specs.write_text("\n".join(spec if isinstance(spec, str) else json.dumps(spec, ensure_ascii=False) for spec in SPECS))
+    bots_dir = tmp_path / "bots"
+    rows = await create_bulk(str(specs), user_id=3, jobs=2, start=False, db_path=db_path, bots_dir=str(bots_dir))
+    report = [(row["line"], row["config_id"], row["error"] is None) for row in rows]
+    assert report == [(1, 2, True), (2, 3, True), (3, None, False), (4, None, False),
+                      (5, None, False), (6, None, False), (7, None, False)]
+    assert rows[3]["error"] == "токен уже используется другим ботом"
+    assert rows[5]["error"] == "FAQ 2: вопрос или ответ содержат недопустимые символы"
+    assert rows[6]["error"] == "неизвестный шаблон: poll"
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT config_id, user_id, bot_name, run_mode FROM bot_configs WHERE config_id > 1").fetchall() == [
+        (2, 3, "FAQ1", "subprocess"), (3, 7, "Card", "inprocess")
+    ]
+    conn.close()
+    # In-process bots are interpreted from config_json, so only the subprocess bot is rendered.
+    assert sorted(os.listdir(bots_dir)) == ["bot_2.env", "bot_2.py"]
+    assert (bots_dir / "bot_2.env").read_text() == "BOT_TOKEN=100:AAA\n"
+
+async def test_regenerate_skips_unchanged_bots(tmp_path, db_path):
+    specs = tmp_path / "bots.jsonl"
+    specs.write_text("\n".join(json.dumps(spec) for spec in SPECS[:2]))
+    bots_dir = tmp_path / "bots"
+    await create_bulk(str(specs), start=False, db_path=db_path, bots_dir=str(bots_dir))
+    rows, skipped = await regenerate_all(start=False, db_path=db_path, bots_dir=str(bots_dir))
+    assert (rows, skipped) == ([], 1)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE bot_configs SET bot_name = 'Renamed', config_json = replace(config_json, 'FAQ1', 'FAQ2') WHERE config_id = 2")
+    conn.commit()
+    conn.close()
+    rows, skipped = await regenerate_all(start=False, db_path=db_path, bots_dir=str(bots_dir))
+    assert [(row["config_id"], row["error"]) for row in rows] == [(2, None)] and skipped == 0
+    assert "FAQ2" in (bots_dir / "bot_2.py").read_text(encoding="utf-8-sig")
+    assert (await regenerate_all(start=False, db_path=db_path, bots_dir=str(bots_dir)))[1] == 1
+    rows, skipped = await regenerate_all(force=True, start=False, db_path=db_path, bots_dir=str(bots_dir))
+    assert (len(rows), skipped) == (1, 0)
+
+class FailingSupervisor:
+    def __init__(self, db_path, bots_dir):
+        self.db_path, self.bots_dir = db_path, bots_dir
+        self.closed = False
+        self.db = SimpleNamespace(close=lambda: None)
+
+    async def replace(self, config_id, bot_token):
+        # What the real Supervisor would run.
+        assert os.path.exists(os.path.join(self.bots_dir, f"bot_{config_id}.py"))
+        raise RuntimeError(f"Bot {config_id} did not become ready")
+
+    async def close(self):
+        self.closed = True
+
+async def test_failed_restart_keeps_old_files_and_hash(tmp_path, db_path, monkeypatch):
+    specs = tmp_path / "bots.jsonl"
+    specs.write_text(json.dumps(SPECS[0]))
+    bots_dir = tmp_path / "bots"
+    await create_bulk(str(specs), start=False, db_path=db_path, bots_dir=str(bots_dir))
+    old = (bots_dir / "bot_2.py").read_bytes()
+    supervisors = []
+
+    def supervisor_for(path, directory):
+        supervisor = FailingSupervisor(path, directory)
+        supervisors.append(supervisor)
+        return supervisor
+
+    monkeypatch.setattr(cli, "supervisor_for", supervisor_for)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE bot_configs SET pid = 1, config_json = replace(config_json, 'FAQ1', 'FAQ2') WHERE config_id = 2")
+    conn.commit()
+    conn.close()
+    rows, skipped = await regenerate_all(db_path=db_path, bots_dir=str(bots_dir))
+    assert [(row["config_id"], row["error"]) for row in rows] == [(2, "не запущен: Bot 2 did not become ready")]
+    assert [(s.db_path, s.bots_dir, s.closed) for s in supervisors] == [(db_path, str(bots_dir), True)]
+    # The old version keeps serving, so its files are back and the new hash is not recorded.
+    assert (bots_dir / "bot_2.py").read_bytes() == old
+    assert (await regenerate_all(start=False, db_path=db_path, bots_dir=str(bots_dir)))[1] == 0
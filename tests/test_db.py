@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import pytest
+from utils.utils_db import Database
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "bot_users.db"), pool_size=2)
+    yield db
+    db.close()
+
+async def test_execute_and_fetch(db):
+    await db.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, first_name TEXT)')
+    rowcount, lastrowid = await db.execute('INSERT INTO users (user_id, first_name) VALUES (?, ?)', (7, "Ann"))
+    assert (rowcount, lastrowid) == (1, 7)
+    await db.executemany('INSERT INTO users (user_id, first_name) VALUES (?, ?)', [(8, "Bob"), (9, "Eve")])
+    assert await db.fetchone('SELECT first_name FROM users WHERE user_id = ?', (8,)) == ("Bob",)
+    assert len(await db.fetchall('SELECT * FROM users')) == 3
+    assert await db.fetchone('PRAGMA journal_mode') == ("wal",)
+
+async def test_queries_run_off_the_event_loop_on_long_lived_connections(db):
+    await db.execute('CREATE TABLE t (x INTEGER)')
+    loop_thread = threading.get_ident()
+    threads = await asyncio.gather(*(db.run(lambda conn: threading.get_ident()) for _ in range(20)))
+    assert loop_thread not in threads
+    assert len(set(threads)) <= db.pool_size
+    assert len(db._connections) <= db.pool_size
+
+async def test_run_rolls_back_on_error(db):
+    await db.execute('CREATE TABLE t (x INTEGER)')
+
+    def failing(conn):
+        conn.execute('INSERT INTO t VALUES (1)')
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await db.run(failing)
+    assert await db.fetchall('SELECT * FROM t') == []
@@ -0,0 +1,55 @@
+import pytest
+import pytest_asyncio
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.load_replay import Replayer, bot_traffic, random_traffic, start_target, stop_target
+from generate import generate
+
+pytestmark = pytest.mark.asyncio
+
+TOKEN = "42:FAKE"
+CONFIG = {
+    "bot_name": "FAQBot",
+    "handlers": [
+        {"command": "/start", "text": "Привет"},
+        {"command": "/faq", "text": "Вопросы:", "reply_markup": {"inline_keyboard": [
+            [{"text": "Вопрос 1", "callback_data": "faq_1", "response": "Ответ 1"}],
+        ]}},
+    ],
+}
+
+@pytest_asyncio.fixture
+async def api():
+    api = await FakeBotApi().start()
+    yield api
+    await api.close()
+
+async def test_fake_api_serves_aiogram_bot(api):
+    replies = []
+    api.on_reply = lambda token, method, params: replies.append((token, method, params["chat_id"]))
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    try:
+        assert (await bot.get_me()).username == "fake_42_bot"
+        api.push(TOKEN, {"message": {"message_id": 1, "date": 0, "chat": {"id": 7, "type": "private"}, "text": "/start"}})
+        updates = await bot.get_updates(offset=0, timeout=1)
+        assert [update.message.text for update in updates] == ["/start"]
+        assert await bot.get_updates(offset=updates[0].update_id + 1, timeout=0) == []
+        message = await bot.send_message(7, "Привет")
+        assert message.chat.id == 7 and message.text == "Привет"
+    finally:
+        await bot.session.close()
+    assert replies == [(TOKEN, "sendMessage", "7")]
+
+async def test_replay_generated_bot(api, tmp_path):
+    script = tmp_path / "bot_1.py"
+    generate(CONFIG, str(script), 1)
+    assert bot_traffic(str(script)) == (("/start", "/faq"), ("faq_1",))
+    process = await start_target(str(script), api, TOKEN, str(tmp_path))
+    try:
+        result = await Replayer(api, TOKEN, users=5).replay(random_traffic(("/start", "/faq"), ("faq_1",)), 30, rate=200)
+    finally:
+        stop_target(process)
+    assert (result["sent"], result["replied"], result["lost"]) == (30, 30, 0)
+    assert 0 < result["p50_ms"] <= result["p99_ms"] <= result["max_ms"]
@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from utils.utils_db import Database
+from utils.utils_fsm_storage import SQLiteStorage
+
+pytestmark = pytest.mark.asyncio
+
+class Form(StatesGroup):
+    bot_name = State()
+    bot_token = State()
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "bot_users.db"), pool_size=1)
+    yield db
+    db.close()
+
+async def rows(db):
+    return await db.fetchall('SELECT storage_key, state, data FROM fsm_storage')
+
+async def test_wizard_resumes_after_restart(db):
+    storage = SQLiteStorage(db, flush_interval=60)
+    state = FSMContext(storage=storage, key=KEY)
+    await state.set_state(Form.bot_token)
+    await state.update_data(template="faq", config={"bot_name": "Бот", "handlers": []})
+    assert await rows(db) == []
+    await storage.close()
+
+    restarted = FSMContext(storage=SQLiteStorage(db), key=KEY)
+    assert await restarted.get_state() == Form.bot_token.state
+    assert await restarted.get_data() == {"template": "faq", "config": {"bot_name": "Бот", "handlers": []}}
+
+    await restarted.clear()
+    await restarted.storage.close()
+    assert await rows(db) == []
+
+async def test_writes_are_batched(db):
+    storage = SQLiteStorage(db, flush_interval=60, batch_size=3)
+    for user_id in range(3):
+        await storage.set_state(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), Form.bot_name)
+    await asyncio.sleep(0.05)
+    assert len(await rows(db)) == 3
+    await storage.close()
+
+async def test_data_is_copied(db):
+    storage = SQLiteStorage(db)
+    data = {"faq_list": []}
+    await storage.set_data(KEY, data)
+    data["faq_list"].append(1)
+    (await storage.get_data(KEY))["faq_list"].append(2)
+    assert await storage.get_data(KEY) == {"faq_list": []}
+    await storage.close()
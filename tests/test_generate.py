@@ -1,9 +1,12 @@
 import pytest
 import sqlite3
 import os
-from generate import generate
+from generate import generate, content_hash
 from jinja2 import Environment, FileSystemLoader
-from utils.utils_validation import validate_config, validate_block_schema, validate_bot_token
+from utils.utils_validation import (
+    validate_config, validate_block_schema, validate_bot_token, validate_bot_config, config_validator,
+    is_valid_text, validate_faqs,
+)
 
 @pytest.fixture
 def env():
@@ -30,9 +33,9 @@ def sample_config():
     }
 
 @pytest.fixture(autouse=True)
-def clear_db():
-    if os.path.exists("bot_users.db"):
-        os.remove("bot_users.db")
+def clear_db(tmp_path, monkeypatch):
+    # A fresh working directory instead of deleting the repository's bot_users.db.
+    monkeypatch.chdir(tmp_path)
 
 def test_config_validation(sample_config):
     is_valid, error = validate_config(sample_config)
@@ -81,4 +84,56 @@ def test_invalid_generation(env, tmp_path):
     assert not is_valid, f"Ожидалась ошибка валидации: {error}"
     # Проверка, что генерация не происходит при недействительной конфигурации
     with pytest.raises(Exception):
-        generate(invalid_config, output_file)
\ No newline at end of file
+        generate(invalid_config, output_file)
+
+def test_bot_config_validation_reports_all_errors(sample_config):
+    is_valid, errors = validate_bot_config(sample_config)
+    assert is_valid and errors == []
+
+    keyboard = sample_config["handlers"][0]["reply_markup"]["inline_keyboard"]
+    keyboard[0][0]["url"] = "ftp://example.com"
+    del keyboard[0][1]["response"]
+    sample_config["handlers"].append({"command": "/help"})
+    is_valid, errors = validate_bot_config(sample_config)
+    assert not is_valid
+    assert errors == [
+        "Недопустимый URL в кнопке: ftp://example.com",
+        "Кнопка с callback_data в /start не содержит response",
+        "Обработчик /help не содержит обязательных полей: command, text",
+    ]
+    assert validate_config(sample_config) == (False, errors[0])
+
+def test_button_errors_by_kind(sample_config):
+    keyboard = sample_config["handlers"][0]["reply_markup"]["inline_keyboard"]
+    keyboard[0] = [{"text": "Пусто"}, {"callback_data": "no_text"}, {"text": "Оба", "url": "https://example.com", "callback_data": "x"}]
+    assert validate_bot_config(sample_config) == (False, [
+        "Кнопка в /start не содержит text или url/callback_data",
+        "Кнопка с callback_data в /start не содержит response",
+    ])
+
+def test_block_schema_errors_and_cached_validator():
+    is_valid, error = validate_block_schema({"bot_name": 1, "handlers": []})
+    assert not is_valid
+    assert error.startswith("Ошибка валидации схемы:")
+    assert validate_config({"bot_name": 1, "handlers": []}) == (True, "")
+    assert config_validator() is config_validator()
+
+def test_content_hash_normalizes_config():
+    config = {"bot_name": "Бот", "handlers": [{"command": "/start", "text": "Привет"}]}
+    reordered = {"handlers": [{"text": "Привет", "command": "/start"}], "bot_name": "Бот"}
+    assert content_hash(config, "1:A") == content_hash(reordered, "1:A")
+    assert content_hash(config, "1:A") != content_hash(config, "1:B")
+    assert content_hash(config, "1:A") != content_hash({**config, "bot_name": "Другой"}, "1:A")
+
+def test_is_valid_text():
+    assert is_valid_text("Привет, World! (v1.0)")
+    for text in (None, "", "   ", "tab\there", "emoji 😀", "<script>\n"):
+        assert not is_valid_text(text)
+
+def test_validate_faqs_reports_every_bad_entry():
+    faqs = [{"question": "Q1", "answer": "A1"}, {"question": "Q2 😀", "answer": "A2"}, {"question": "Q3", "answer": " "}]
+    assert validate_faqs(faqs[:1]) == (True, [])
+    assert validate_faqs(faqs) == (False, [
+        "FAQ 2: вопрос или ответ содержат недопустимые символы",
+        "FAQ 3: вопрос или ответ содержат недопустимые символы",
+    ])
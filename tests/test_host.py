@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import sqlite3
+import pytest
+from unittest.mock import patch
+from generate import generate
+from egtgbt.host import BotHost, load_bot_module, BOTS_DIR, RUN_MODE_INPROCESS, RUN_MODE_SUBPROCESS
+
+TOKENS = {1: "111111:AAAA", 2: "222222:BBBB", 3: "333333:CCCC"}
+
+@pytest.fixture
+def config():
+    return {"bot_name": "HostBot", "handlers": [{"command": "/start", "text": "Привет!"}]}
+
+@pytest.fixture
+def bots_dir(tmp_path, config):
+    for config_id in TOKENS:
+        generate(config, str(tmp_path / f"bot_{config_id}.py"), config_id)
+    return tmp_path
+
+@pytest.fixture
+def db_path(tmp_path, config):
+    path = str(tmp_path / "bot_users.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE bot_configs (config_id INTEGER PRIMARY KEY, bot_token TEXT, config_json TEXT, run_mode TEXT)")
+    conn.executemany(
+        "INSERT INTO bot_configs (config_id, bot_token, config_json, run_mode) VALUES (?, ?, ?, ?)",
+        [(1, TOKENS[1], None, RUN_MODE_INPROCESS),
+         (2, TOKENS[2], json.dumps(config), RUN_MODE_INPROCESS),
+         (3, TOKENS[3], json.dumps(config), RUN_MODE_SUBPROCESS)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+def test_load_bot_module_data_table(bots_dir):
+    module = load_bot_module(1, TOKENS[1], str(bots_dir))
+    assert module.CONFIG_ID == 1
+    assert module.COMMANDS == (("start", "Привет!", None),)
+    assert module.CALLBACKS == ()
+
+def test_load_legacy_bot_module_uses_own_token():
+    first = load_bot_module(7, TOKENS[1], BOTS_DIR)
+    second = load_bot_module(7, TOKENS[2], BOTS_DIR)
+    assert first.bot.token == TOKENS[1]
+    assert second.bot.token == TOKENS[2]
+    assert first.dp is not second.dp
+    assert "BOT_TOKEN" not in os.environ or os.environ["BOT_TOKEN"] not in TOKENS.values()
+
+@pytest.mark.asyncio
+async def test_host_loads_only_inprocess_bots(bots_dir, db_path):
+    async def idle(self, config_id, bot, dp):
+        await asyncio.Event().wait()
+
+    host = BotHost(db_path=db_path, bots_dir=str(bots_dir))
+    with patch.object(BotHost, "_poll", idle):
+        assert await host.load_all() == 2
+        assert 1 in host and 2 in host and 3 not in host
+        bot = host.bots[2][0]
+        await host.start_bot(2, TOKENS[2], {"bot_name": "HostBot", "handlers": [{"command": "/faq", "text": "FAQ"}]})
+        assert host.bots[2][0] is bot
+        await host.stop_bot(1)
+        assert 1 not in host
+        await host.stop_all()
+    assert len(host) == 0
+    assert not host.running
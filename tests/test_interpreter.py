@@ -0,0 +1,102 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from aiogram import Bot
+from aiogram.types import Update
+from generate import generate
+from egtgbt.interpreter import build_dispatcher, compile_config, render_text
+from egtgbt.runtime import build_dispatcher as build_table_dispatcher
+
+pytestmark = pytest.mark.asyncio
+
+TOKEN = "123456:ABCDEF"
+
+@pytest.fixture
+def config():
+    return {
+        "bot_name": "FAQBot",
+        "handlers": [
+            {"command": "/start", "text": "*Привет\\!*\\n\\nЗвоните: +1 (234) 'ok' & \"go\""},
+            {
+                "command": "/faq",
+                "text": "Часто задаваемые вопросы:\\nВыберите интересующий вопрос\\.",
+                "reply_markup": {
+                    "inline_keyboard": [
+                        [
+                            {"text": "Сайт", "url": "https://example.com"},
+                            {"text": "Вопрос 1", "callback_data": "faq_1", "response": "Ответ 1\\."}
+                        ],
+                        [{"text": "Вопрос 2", "callback_data": "faq_2", "response": "Ответ <2>"}]
+                    ]
+                }
+            }
+        ]
+    }
+
+def message_update(text, update_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    })
+
+def callback_update(data, update_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": data,
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "menu"},
+        },
+    })
+
+UPDATES = [message_update("/start"), message_update("/faq"), message_update("/help"),
+           callback_update("faq_1"), callback_update("faq_2"), callback_update("unknown")]
+
+async def replies(dp):
+    bot = Bot(TOKEN)
+    calls = []
+    with patch.object(Bot, "__call__", AsyncMock(side_effect=lambda method, *a, **kw: calls.append(method))):
+        for update in UPDATES:
+            await dp.feed_update(bot, update)
+    return [(type(call).__name__, call.model_dump(exclude_none=True)) for call in calls]
+
+# Replies of a bot rendered by the pre-runtime bot_template.py.j2 for the config above.
+LEGACY_REPLIES = [
+    ("SendMessage", "*Привет\\!*\n\nЗвоните: +1 (234) &#39;ok&#39; &amp; &#34;go&#34;"),
+    ("SendMessage", "Часто задаваемые вопросы:\nВыберите интересующий вопрос\\."),
+    ("SendMessage", "*Для помощи напишите администратору:* @NeK0TeR"),
+    ("SendMessage", "Ответ 1\\."),
+    ("AnswerCallbackQuery", None),
+    ("SendMessage", "Ответ &lt;2&gt;"),
+    ("AnswerCallbackQuery", None),
+]
+
+async def test_interpreter_matches_generated_code(config, tmp_path):
+    output_file = tmp_path / "bot_1.py"
+    generate(config, str(output_file), 1)
+    exec_globals = {"__file__": str(output_file)}
+    exec(output_file.read_text(encoding="utf-8-sig"), exec_globals)
+    assert exec_globals["CONFIG_ID"] == 1
+    assert (exec_globals["COMMANDS"], exec_globals["CALLBACKS"]) == compile_config(config)
+
+    generated = await replies(build_table_dispatcher(exec_globals["COMMANDS"], exec_globals["CALLBACKS"]))
+    interpreted = await replies(build_dispatcher(config))
+    assert interpreted == generated
+    assert [(name, call.get("text")) for name, call in interpreted] == LEGACY_REPLIES
+    assert interpreted[1][1]["reply_markup"] == {"inline_keyboard": [
+        [{"text": "Сайт", "url": "https://example.com"}, {"text": "Вопрос 1", "callback_data": "faq_1"}],
+        [{"text": "Вопрос 2", "callback_data": "faq_2"}],
+    ]}
+
+async def test_invalid_config_rejected():
+    with pytest.raises(ValueError):
+        build_dispatcher({"handlers": []})
+
+async def test_render_text_mirrors_template_literals():
+    assert render_text("a\\nb") == "a\nb"
+    assert render_text("x\\.y") == "x\\.y"
+    assert render_text("<b>'q'</b>") == "&lt;b&gt;&#39;q&#39;&lt;/b&gt;"
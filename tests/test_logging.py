@@ -0,0 +1,76 @@
+import io
+import json
+import logging
+import queue
+import threading
+from types import SimpleNamespace
+import pytest
+from utils.utils_logging import (
+    ContextQueueHandler, LoggingContextMiddleware, config_id_var, parse_levels, setup_logging, stop_logging, user_id_var,
+)
+
+@pytest.fixture
+def log_stream():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    stream = io.StringIO()
+    setup_logging(level="INFO", levels={"tests.quiet": "WARNING", "tests.chatty": "DEBUG"}, stream=stream, fmt="json")
+    try:
+        yield stream
+    finally:
+        stop_logging()
+        for name in ("tests.quiet", "tests.chatty"):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+def records(stream):
+    stop_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+@pytest.mark.asyncio
+async def test_context_and_extra_fields_in_json(log_stream):
+    async def handler(event, data):
+        logging.getLogger("tests.handler").info("Handled %s", "update", extra={"handler": "/start"})
+
+    await LoggingContextMiddleware(7)(handler, None, {"event_from_user": SimpleNamespace(id=42)})
+    logging.getLogger("tests.handler").info("Outside")
+    handled, outside = records(log_stream)
+    assert handled["msg"] == "Handled update"
+    assert (handled["config_id"], handled["user_id"], handled["handler"]) == (7, 42, "/start")
+    assert handled["level"] == "INFO" and handled["logger"] == "tests.handler"
+    assert (outside["config_id"], outside["user_id"]) == (None, None)
+    assert config_id_var.get() is None and user_id_var.get() is None
+
+@pytest.mark.asyncio
+async def test_queue_handler_leaves_formatting_to_listener(log_stream):
+    threads = []
+
+    class Lazy:
+        def __str__(self):
+            threads.append(threading.current_thread())
+            return "lazy"
+
+    log_queue = queue.SimpleQueue()
+    ContextQueueHandler(log_queue).handle(logging.LogRecord("tests", logging.INFO, "", 0, "Value %s", (Lazy(),), None))
+    record = log_queue.get_nowait()
+    assert threads == [] and record.msg == "Value %s" and record.config_id is None
+    # pytest's own capture handlers format on this thread, so look only at the listener's output.
+    (queued,) = [h for h in logging.getLogger().handlers if isinstance(h, ContextQueueHandler)]
+    queued.handle(record)
+    (entry,) = records(log_stream)
+    assert entry["msg"] == "Value lazy"
+    assert threads and threads[0] is not threading.main_thread()
+
+@pytest.mark.asyncio
+async def test_per_logger_levels(log_stream):
+    logging.getLogger("tests.quiet").info("dropped")
+    logging.getLogger("tests.quiet").warning("kept")
+    logging.getLogger("tests.chatty.sub").debug("debug kept")
+    logging.getLogger("tests.other").debug("dropped")
+    assert [entry["msg"] for entry in records(log_stream)] == ["kept", "debug kept"]
+
+def test_parse_levels():
+    assert parse_levels("aiogram=warning, egtgbt.supervisor=DEBUG,,junk") == {
+        "aiogram": "WARNING", "egtgbt.supervisor": "DEBUG",
+    }
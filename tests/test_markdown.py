@@ -0,0 +1,52 @@
+import random
+from utils.utils_markdown import (
+    SPECIAL_CHARS, MarkdownTemplate, escape_markdown, contact_text, business_card_handlers, faq_handlers,
+)
+
+
+def legacy_escape_markdown(text):
+    """escape_markdown as target_bot_code.py had it, the reference for byte-identical output."""
+    for char, escaped in [('_', '\\_'), ('*', '\\*'), ('[', '\\['), (']', '\\]'), ('(', '\\('), (')', '\\)'),
+                          ('~', '\\~'), ('`', '\\`'), ('>', '\\>'), ('#', '\\#'), ('+', '\\+'), ('-', '\\-'),
+                          ('=', '\\='), ('|', '\\|'), ('{', '\\{'), ('}', '\\}'), ('.', '\\.'), ('!', '\\!'),
+                          ('"', '\\"'), ("'", "\\'"), ("\\", "\\\\"), ("\n", "\\n"), ("\r", "\\r"), ("\t", "\\t")]:
+        text = text.replace(char, escaped)
+    return text
+
+
+def test_escape_matches_legacy():
+    alphabet = "".join(char for char, _ in SPECIAL_CHARS) + "abc Привет 😀"
+    rng = random.Random(0)
+    samples = ["", "plain", "a_b", "\\_", "C:\\path\\file.txt", "line\r\nnext\ttab"]
+    samples += ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60))) for _ in range(500)]
+    for text in samples:
+        assert escape_markdown(text) == legacy_escape_markdown(text)
+
+
+def test_escape_none_is_empty():
+    assert escape_markdown(None) == ""
+
+
+def test_template_escapes_only_fields():
+    template = MarkdownTemplate("*{title}*\\n{body}")
+    assert template.render(title="v1.0", body="a-b") == "*v1\\\\.0*\\n" + legacy_escape_markdown("a-b")
+
+
+def test_contact_text():
+    assert contact_text("Hi") == "*Hi*\\n\\n📋 *Контактная информация:*\\nℹ️ Контактная информация не указана.\\n"
+    text = contact_text("Hi", phone="+7", website="a.ru")
+    assert text.index("Website") < text.index("Phone")
+    assert "Email" not in text and "не указана" not in text
+
+
+def test_handlers_do_not_share_menu():
+    first = business_card_handlers("Hi", None, None, None, "help")
+    first[-1]["reply_markup"]["inline_keyboard"].clear()
+    second = business_card_handlers("Hi", None, None, None, "help")
+    assert second[-1]["reply_markup"]["inline_keyboard"]
+
+
+def test_faq_handlers():
+    handlers = faq_handlers([{"question": "Why?", "answer": "Because."}])
+    button = handlers[1]["reply_markup"]["inline_keyboard"][0][0]
+    assert button == {"text": "Why?", "callback_data": "faq_1", "response": legacy_escape_markdown("Because.")}
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.load_replay import Replayer, random_traffic, start_target, stop_target
+from egtgbt.interpreter import build_dispatcher
+from generate import generate
+from utils import utils_metrics
+from utils.utils_metrics import (
+    API_SECONDS, HANDLER_SECONDS, UPDATES, Registry, fetch_snapshot, instrument, metrics_socket_path, render,
+)
+
+pytestmark = pytest.mark.asyncio
+
+TOKEN = "42:FAKE"
+CONFIG = {
+    "bot_name": "FAQBot",
+    "handlers": [
+        {"command": "/start", "text": "Привет"},
+        {"command": "/faq", "text": "Вопросы:", "reply_markup": {"inline_keyboard": [
+            [{"text": "Вопрос 1", "callback_data": "faq_1", "response": "Ответ 1"}],
+        ]}},
+    ],
+}
+
+@pytest_asyncio.fixture
+async def api():
+    api = await FakeBotApi().start()
+    yield api
+    await api.close()
+
+def series(metric, **labels):
+    return [value for key, value in metric.series.items() if all(dict(zip(metric.labelnames, key))[k] == v for k, v in labels.items())]
+
+async def test_render_prometheus_text():
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs.", ("kind",)).inc('a"b')
+    registry.histogram("job_seconds", "Job time.", buckets=(0.1, 1.0)).observe(0.5)
+    assert render([registry.snapshot()]) == "\n".join([
+        "# HELP jobs_total Jobs.",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="a\\"b"} 1',
+        "# HELP job_seconds Job time.",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{le="0.1"} 0',
+        'job_seconds_bucket{le="1.0"} 1',
+        'job_seconds_bucket{le="+Inf"} 1',
+        "job_seconds_sum 0.5",
+        "job_seconds_count 1",
+    ]) + "\n"
+
+async def test_series_overflow(monkeypatch):
+    monkeypatch.setattr(utils_metrics, "MAX_SERIES", 2)
+    counter = Registry().counter("clicks_total", "Clicks.", ("data",))
+    for data in ("a", "b", "c", "d", "a"):
+        counter.inc(data)
+    assert counter.series == {("a",): 2, ("b",): 1, ("other",): 2}
+
+async def test_series_overflow_is_per_config_id(monkeypatch):
+    monkeypatch.setattr(utils_metrics, "MAX_SERIES", 2)
+    histogram = Registry().histogram("handler_seconds", "Handlers.", ("config_id", "event", "handler"), bounded=("handler",))
+    for config_id, handler in (("1", "a"), ("1", "b"), ("1", "c"), ("2", "a"), ("2", "d")):
+        histogram.observe(0.1, config_id, "callback_query", handler)
+    assert sorted(histogram.series) == [
+        ("1", "callback_query", "a"), ("1", "callback_query", "b"), ("1", "callback_query", "other"),
+        ("2", "callback_query", "a"), ("2", "callback_query", "d"),
+    ]
+
+async def test_middleware_records_handlers_and_api_calls(api):
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    dp = build_dispatcher(CONFIG)
+    instrument(bot, dp, "t1")
+    instrument(bot, dp, "t1")
+    chat = {"id": 1, "type": "private"}
+    user = {"id": 1, "is_bot": False, "first_name": "User"}
+    try:
+        for i, text in enumerate(["/start", "/faq", "/nope"], 1):
+            await dp.feed_update(bot, Update.model_validate({"update_id": i, "message": {
+                "message_id": i, "date": 0, "chat": chat, "from": user, "text": text}}))
+        await dp.feed_update(bot, Update.model_validate({"update_id": 4, "callback_query": {
+            "id": "4", "chat_instance": "1", "data": "faq_1", "from": user,
+            "message": {"message_id": 1, "date": 0, "chat": chat, "text": "menu"}}}))
+    finally:
+        await bot.session.close()
+    assert sorted((key[1], key[2], value[2]) for key, value in HANDLER_SECONDS.series.items() if key[0] == "t1") == [
+        ("callback_query", "faq_1", 1), ("message", "/faq", 1), ("message", "/start", 1),
+    ]
+    assert UPDATES.series[("t1", "handled")] == 3 and UPDATES.series[("t1", "unhandled")] == 1
+    assert [value[2] for value in series(API_SECONDS, config_id="t1", method="sendMessage")] == [3]
+    assert [value[2] for value in series(API_SECONDS, config_id="t1", method="answerCallbackQuery")] == [1]
+
+async def test_subprocess_bot_serves_snapshot(api, tmp_path, monkeypatch):
+    monkeypatch.setenv("BOT_METRICS", "1")
+    monkeypatch.setenv("BOT_SOCKETS_DIR", str(tmp_path))
+    script = tmp_path / "bot_7.py"
+    generate(CONFIG, str(script), 7)
+    process = await start_target(str(script), api, TOKEN, str(tmp_path))
+    try:
+        await Replayer(api, TOKEN, users=2).replay(random_traffic(("/start", "/faq"), ("faq_1",)), 10, rate=200)
+        # A button counts as answered at its ack, before its handler returns and is timed.
+        for _ in range(50):
+            snapshot = await fetch_snapshot(metrics_socket_path(7, process.pid, str(tmp_path)))
+            handled = sum(value["count"] for labels, value in snapshot["bot_handler_seconds"]["series"]
+                          if labels["config_id"] == "7")
+            if handled == 10:
+                break
+            await asyncio.sleep(0.1)
+    finally:
+        stop_target(process)
+    assert handled == 10
+    text = render([snapshot])
+    assert 'telegram_api_seconds_count{config_id="7",method="getMe"} 1' in text
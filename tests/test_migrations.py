@@ -0,0 +1,77 @@
+import importlib
+import sqlite3
+import pytest
+from utils.utils_migrations import MIGRATIONS, current_version, migrate
+from utils.utils_telegram import token_hash
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "bot_users.db"))
+    yield conn
+    conn.close()
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def test_fresh_database_gets_every_migration_once(conn):
+    assert migrate(conn) == [number for number, _, _ in MIGRATIONS]
+    assert migrate(conn) == []
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert {"bot_token", "pid", "run_mode"} <= columns(conn, "bot_configs")
+
+def test_legacy_database_is_upgraded(conn):
+    conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT)')
+    conn.execute('CREATE TABLE bot_configs (config_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                 'bot_name TEXT, config_json TEXT, bot_token TEXT, pid INTEGER)')
+    conn.execute("INSERT INTO bot_configs (user_id, bot_name) VALUES (1, 'Old')")
+    conn.commit()
+    migrate(conn)
+    assert conn.execute('SELECT bot_name, run_mode FROM bot_configs').fetchall() == [("Old", "subprocess")]
+
+@pytest.fixture
+def init_db(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "123456:ABCDEF")
+    return importlib.import_module("target_bot_code").init_db
+
+def test_init_db_on_fresh_database(init_db, tmp_path):
+    path = str(tmp_path / "bot_users.db")
+    init_db(path)
+    init_db(path)
+    conn = sqlite3.connect(path)
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ("wal",)
+    conn.close()
+
+def test_init_db_upgrades_legacy_database(init_db, tmp_path, conn):
+    conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT)')
+    conn.execute('CREATE TABLE bot_configs (config_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                 'bot_name TEXT, config_json TEXT, bot_token TEXT, pid INTEGER)')
+    conn.execute("INSERT INTO bot_configs (user_id, bot_name, bot_token) VALUES (1, 'Old', '1:A')")
+    conn.commit()
+    init_db(str(tmp_path / "bot_users.db"))
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert conn.execute('SELECT bot_name, run_mode FROM bot_configs').fetchall() == [("Old", "subprocess")]
+
+def test_token_hash_is_backfilled_and_indexed(conn):
+    migrate(conn, target=7)
+    conn.execute("INSERT INTO bot_configs (user_id, bot_name, bot_token) VALUES (1, 'Old', '1:A')")
+    conn.commit()
+    migrate(conn)
+    assert conn.execute('SELECT token_hash FROM bot_configs').fetchall() == [(token_hash("1:A"),)]
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT config_id FROM bot_configs WHERE token_hash = ?', ("x",)).fetchall()
+    assert any("idx_bot_configs_token_hash" in row[-1] for row in plan)
+
+def test_list_bots_uses_user_id_index(conn):
+    migrate(conn)
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT config_id, bot_name FROM bot_configs WHERE user_id = ?', (1,)).fetchall()
+    assert any("idx_bot_configs_user_id" in row[-1] for row in plan)
+
+def test_failed_migration_rolls_back(conn):
+    def broken(conn):
+        conn.execute('CREATE TABLE half_done (x INTEGER)')
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        migrate(conn, MIGRATIONS + [(99, "broken", broken)])
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert not conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchall()
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from utils.utils_profiler import (
+    PROFILE_SIGNAL, SamplingProfiler, catches_signal, install_profile_signal, request_profile, request_path,
+)
+
+pytestmark = pytest.mark.asyncio
+
+def busy():
+    time.sleep(0.2)
+
+async def test_profile_records_samples_and_stalls(tmp_path):
+    profiler = SamplingProfiler("test", output_dir=str(tmp_path), interval=0.002, stall_threshold=0.05)
+    assert profiler.start(1)
+    assert not profiler.start(1)
+    # Stall only once the sampler has seen the loop's heartbeat, however slowly its thread got going.
+    beat = profiler._beat
+    while not profiler.samples or profiler._beat == beat:
+        await asyncio.sleep(0)
+    busy()
+    assert await asyncio.to_thread(profiler.done.wait, 10)
+    assert not any(thread.name == "profiler" for thread in threading.enumerate())
+    # A loaded machine may add stalls of its own; the one in busy() must be among them.
+    duration, stack = next(stall for stall in profiler.stalls if stall[1][-1].startswith("busy (test_profiler.py"))
+    assert duration >= 0.15
+    collapsed, speedscope, stalls = profiler.paths
+    assert any(line.startswith("MainThread;") and "busy (test_profiler.py" in line
+               for line in open(collapsed, encoding="utf-8"))
+    with open(speedscope, encoding="utf-8") as f:
+        profile = json.load(f)
+    frames = profile["shared"]["frames"]
+    assert any(frame["name"].startswith("busy ") for frame in frames)
+    assert all(index < len(frames) for sample in profile["profiles"][0]["samples"] for index in sample)
+    assert "busy (test_profiler.py" in open(stalls, encoding="utf-8").read()
+
+async def test_signal_starts_profiler_for_requested_time(tmp_path):
+    profiler = SamplingProfiler("signalled", output_dir=str(tmp_path), interval=0.002)
+    loop = asyncio.get_running_loop()
+    install_profile_signal(profiler)
+    try:
+        assert catches_signal(os.getpid(), PROFILE_SIGNAL)
+        assert request_profile(os.getpid(), 0.1, output_dir=str(tmp_path))
+        # done is set when the run ends; the default PROFILE_SECONDS would not end within the timeout.
+        assert await asyncio.to_thread(profiler.done.wait, 10)
+    finally:
+        loop.remove_signal_handler(PROFILE_SIGNAL)
+    assert profiler.paths is not None
+    assert not os.path.exists(request_path(os.getpid(), str(tmp_path)))
+    assert [os.path.basename(path).split(".", 1)[1] for path in profiler.paths[:2]] == ["collapsed.txt", "speedscope.json"]
+
+# Like a bots/bot_N.py generated before egtgbt.runtime, it installs no handler: SIGUSR1 would terminate it.
+LEGACY_BOT = "import time\nprint('up', flush=True)\ntime.sleep(60)\n"
+
+async def test_legacy_bot_is_not_signalled(tmp_path):
+    legacy = subprocess.Popen([sys.executable, "-c", LEGACY_BOT], stdout=subprocess.PIPE)
+    try:
+        assert await asyncio.to_thread(legacy.stdout.readline) == b"up\n"
+        assert not catches_signal(legacy.pid, PROFILE_SIGNAL)
+        assert not request_profile(legacy.pid, 1, output_dir=str(tmp_path))
+        assert not os.path.exists(request_path(legacy.pid, str(tmp_path)))
+        with pytest.raises(subprocess.TimeoutExpired):
+            legacy.wait(timeout=0.5)
+    finally:
+        legacy.kill()
+        legacy.wait()
+    with pytest.raises(ProcessLookupError):
+        request_profile(legacy.pid, 1, output_dir=str(tmp_path))
@@ -0,0 +1,50 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from egtgbt.routing import CallbackRouter
+
+def callback_update(data):
+    return Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1", "chat_instance": "1", "data": data,
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+        },
+    })
+
+def test_resolve_exact_and_prefix():
+    callbacks = CallbackRouter()
+    first, second, short, long = (lambda c: 1), (lambda c: 2), (lambda c: 3), (lambda c: 4)
+    callbacks.add("faq_1", first)
+    callbacks.add("faq_1", second)
+    callbacks.add_prefix("template_", short)
+    callbacks.add_prefix("template_faq", long)
+    assert callbacks.resolve("faq_1").callback is first
+    assert callbacks.resolve("template_business_card").callback is short
+    assert callbacks.resolve("template_faq").callback is long
+    assert callbacks.resolve("faq_2") is None
+    assert callbacks.resolve(None) is None
+    assert len(callbacks) == 3
+
+@pytest.mark.asyncio
+async def test_attach_dispatches_with_handler_kwargs():
+    dp = Dispatcher()
+    callbacks = CallbackRouter()
+    seen = []
+
+    @callbacks.exact("menu_list_bots")
+    async def list_bots(callback):
+        seen.append(("list", callback.data))
+
+    @callbacks.prefix("template_")
+    async def template(callback, state):
+        seen.append(("template", callback.data, state is not None))
+
+    callbacks.attach(dp)
+    bot = Bot("123456:ABCDEF")
+    with patch.object(Bot, "__call__", AsyncMock()):
+        await dp.feed_update(bot, callback_update("menu_list_bots"))
+        await dp.feed_update(bot, callback_update("template_faq"))
+        await dp.feed_update(bot, callback_update("unknown"))
+    assert seen == [("list", "menu_list_bots"), ("template", "template_faq", True)]
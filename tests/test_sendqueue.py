@@ -0,0 +1,114 @@
+import asyncio
+import time
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, GetUpdates, SendMessage
+from utils.utils_metrics import SEND_RETRY_AFTER, SEND_WAIT_SECONDS
+from utils.utils_sendqueue import ACK, SEND, SendQueue, TokenBucket, lane_of
+
+pytestmark = pytest.mark.asyncio
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class Recorder:
+    """make_request stand-in that records (method, chat_id, time) and can answer with 429s first."""
+
+    def __init__(self, retry_after=()):
+        self.calls = []
+        self.retry_after = list(retry_after)
+
+    async def __call__(self, bot, method):
+        self.calls.append((method.__api_method__, getattr(method, "chat_id", None), time.perf_counter()))
+        if self.retry_after:
+            error = TelegramRetryAfter(method, "Too Many Requests", 1)
+            error.retry_after = self.retry_after.pop(0)
+            raise error
+        return True
+
+async def test_token_bucket():
+    clock = Clock()
+    bucket = TokenBucket(2, 2, clock=clock)
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay() == 0
+    bucket.pause(3)
+    assert bucket.delay() == pytest.approx(3)
+    clock.now += 3
+    bucket.take()
+    # After a pause the bucket starts nearly empty instead of allowing a burst.
+    assert bucket.delay() == pytest.approx(0.5)
+    unlimited = TokenBucket(0, 1, clock=clock)
+    for _ in range(100):
+        unlimited.take()
+    assert unlimited.delay() == 0
+
+async def test_lanes():
+    assert lane_of("answerCallbackQuery") == ACK
+    assert lane_of("sendMessage") == lane_of("editMessageText") == SEND
+    assert lane_of("getUpdates") is None and lane_of("getMe") is None
+
+async def test_callback_acks_jump_the_queue():
+    queue = SendQueue("test-ack", rate=50, chat_rate=0)
+    make_request = Recorder()
+    sends = [asyncio.create_task(queue(make_request, None, SendMessage(chat_id=i, text="x"))) for i in range(60)]
+    await asyncio.sleep(0)
+    ack = asyncio.create_task(queue(make_request, None, AnswerCallbackQuery(callback_query_id="1")))
+    await asyncio.gather(ack, *sends)
+    order = [name for name, _, _ in make_request.calls]
+    # The first 50 sends fit into the burst; the ack goes before the 10 still queued.
+    assert order.index("answerCallbackQuery") == 50
+    assert [chat_id for _, chat_id, _ in make_request.calls if chat_id is not None] == list(range(60))
+    assert queue.waiters == [] and queue._pump is None
+
+async def test_chat_rate_keeps_order():
+    queue = SendQueue("test-chat", rate=0, chat_rate=20)
+    make_request = Recorder()
+    start = time.perf_counter()
+    await asyncio.gather(*(queue(make_request, None, SendMessage(chat_id=7, text=str(i))) for i in range(6)))
+    await queue(make_request, None, GetUpdates())
+    texts = [call[0] for call in make_request.calls]
+    assert texts == ["sendMessage"] * 6 + ["getUpdates"]
+    # A burst of 3, then one every 1/20 s.
+    assert make_request.calls[5][2] - start >= 0.14
+    assert sum(value["count"] for _, value in SEND_WAIT_SECONDS.snapshot()["series"]) >= 6
+
+async def test_chat_calls_reach_the_api_in_order():
+    queue = SendQueue("test-order", rate=0, chat_rate=0)
+    done = []
+
+    async def make_request(bot, method):
+        # The first call is the slowest; without the chat lock the others would overtake it.
+        await asyncio.sleep(0.05 if method.text == "0" else 0)
+        done.append(method.text)
+        return True
+
+    await asyncio.gather(*(queue(make_request, None, SendMessage(chat_id=3, text=str(i))) for i in range(3)))
+    assert done == ["0", "1", "2"]
+
+async def test_retry_after_pauses_the_chat_and_retries():
+    queue = SendQueue("test-429", rate=0, chat_rate=0)
+    make_request = Recorder(retry_after=[0.2])
+    start = time.perf_counter()
+    first = asyncio.create_task(queue(make_request, None, SendMessage(chat_id=1, text="a")))
+    await asyncio.sleep(0.05)
+    other = await queue(make_request, None, SendMessage(chat_id=2, text="b"))
+    assert other is True and make_request.calls[-1][2] - start < 0.2
+    assert await first is True
+    attempts = [at - start for name, chat_id, at in make_request.calls if chat_id == 1]
+    assert len(attempts) == 2 and attempts[1] >= 0.19
+    assert SEND_RETRY_AFTER.series[("test-429", "sendMessage")] == 1
+
+async def test_retry_after_gives_up():
+    queue = SendQueue("test-429-long", rate=0, chat_rate=0)
+    make_request = Recorder(retry_after=[120])
+    with pytest.raises(TelegramRetryAfter):
+        await queue(make_request, None, SendMessage(chat_id=1, text="a"))
+    assert len(make_request.calls) == 1
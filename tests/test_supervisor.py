@@ -0,0 +1,189 @@
+import asyncio
+import sqlite3
+import subprocess
+import sys
+import psutil
+import pytest
+import pytest_asyncio
+from egtgbt.supervisor import Supervisor, STATUS_FAILED, STATUS_RUNNING, STATUS_STOPPED
+from egtgbt.webhook import webhook_secret
+from utils.utils_db import Database
+from utils.utils_migrations import migrate
+from utils.utils_telegram import token_hash
+
+pytestmark = pytest.mark.asyncio
+
+SLEEPER = "import time\ntime.sleep(60)\n"
+CRASHER = "import sys\nsys.exit(3)\n"
+
+@pytest.fixture
+def bots_dir(tmp_path):
+    bots = tmp_path / "bots"
+    bots.mkdir()
+    (bots / "bot_1.py").write_text(SLEEPER)
+    (bots / "bot_2.py").write_text(CRASHER)
+    return bots
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    path = str(tmp_path / "bot_users.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany("INSERT INTO bot_configs (config_id, bot_token) VALUES (?, ?)", [(1, "1:A"), (2, "2:B")])
+    conn.commit()
+    conn.close()
+    db = Database(path, pool_size=1)
+    yield db
+    db.close()
+
+async def status(db, config_id):
+    return await db.fetchone(
+        'SELECT pid, status, restart_count, last_exit_code FROM bot_configs WHERE config_id = ?', (config_id,)
+    )
+
+async def test_start_and_stop(db, bots_dir):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir))
+    pid = await supervisor.start(1, "1:A")
+    assert psutil.pid_exists(pid)
+    assert await status(db, 1) == (pid, STATUS_RUNNING, 0, None)
+    assert await db.fetchone('SELECT token_hash FROM bot_configs WHERE config_id = 1') == (token_hash("1:A"),)
+    await supervisor.stop(1)
+    assert not psutil.pid_exists(pid)
+    assert (await status(db, 1))[:2] == (None, STATUS_STOPPED)
+    assert 1 not in supervisor
+
+async def test_crashed_bot_is_restarted_with_backoff(db, bots_dir):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir), backoff_initial=0.01, max_restarts=3)
+    assert [supervisor.backoff(n) for n in (1, 2, 3)] == [0.01, 0.02, 0.04]
+    await supervisor.start(2, "2:B")
+    await asyncio.wait_for(supervisor._watchers[2], timeout=10)
+    assert await status(db, 2) == (None, STATUS_FAILED, 3, 3)
+    await supervisor.close()
+
+async def test_resume_adopts_live_bots_and_restarts_dead_ones(db, bots_dir):
+    live = subprocess.Popen([sys.executable, str(bots_dir / "bot_1.py")], start_new_session=True)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    await db.execute("UPDATE bot_configs SET pid = ?, status = ? WHERE config_id = 1", (live.pid, STATUS_RUNNING))
+    # Bot 2's pid was recycled by an unrelated process, which must be left alone.
+    unrelated = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    await db.execute("UPDATE bot_configs SET pid = ?, status = ? WHERE config_id = 2", (unrelated.pid, STATUS_RUNNING))
+    (bots_dir / "bot_2.py").write_text(SLEEPER)
+    supervisor = Supervisor(db, bots_dir=str(bots_dir))
+    try:
+        assert await supervisor.resume() == (1, 1)
+        assert supervisor.processes[1] == live.pid
+        assert supervisor.processes[2] not in (live.pid, unrelated.pid)
+        assert unrelated.poll() is None
+        await supervisor.close()
+        # Shutdown leaves bots running for the next builder to adopt.
+        assert live.poll() is None
+        assert (await status(db, 1))[:2] == (live.pid, STATUS_RUNNING)
+        supervisor = Supervisor(db, bots_dir=str(bots_dir))
+        assert await supervisor.resume() == (2, 0)
+        await supervisor.close()
+    finally:
+        for process in (live, unrelated):
+            process.kill()
+            process.wait()
+        psutil.Process((await status(db, 2))[0]).kill()
+
+async def test_adopt_unknown_needs_the_webhook_secret(db, bots_dir):
+    live = subprocess.Popen([sys.executable, str(bots_dir / "bot_1.py")], start_new_session=True)
+    # As recorded by the Supervisor that started it, e.g. the CLI's.
+    await db.execute("UPDATE bot_configs SET pid = ?, token_hash = ? WHERE config_id = 1", (live.pid, token_hash("1:A")))
+    supervisor = Supervisor(db, bots_dir=str(bots_dir))
+    try:
+        assert not await supervisor.adopt_unknown(token_hash("1:A"), "forged")
+        assert not await supervisor.adopt_unknown(token_hash("2:B"), webhook_secret("2:B"))
+        assert 1 not in supervisor
+        assert await supervisor.adopt_unknown(token_hash("1:A"), webhook_secret("1:A"))
+        assert supervisor.processes[1] == live.pid
+        await supervisor.close()
+    finally:
+        live.kill()
+        live.wait()
+
+READY = "import os, time\nos.write(int(os.environ['BOT_READY_FD']), b'ready\\n')\ntime.sleep(60)\n"
+
+async def deploy(supervisor, bots_dir, script):
+    (bots_dir / "bot_1.py").write_text(script)
+    return await supervisor.replace(1, "1:A")
+
+async def test_replace_drains_old_bot_once_new_one_is_ready(db, bots_dir):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir), ready_timeout=10)
+    try:
+        old_pid = await deploy(supervisor, bots_dir, READY)
+        new_pid = await deploy(supervisor, bots_dir, READY)
+        assert new_pid != old_pid
+        assert not psutil.pid_exists(old_pid)
+        assert supervisor.processes[1] == new_pid
+        assert await status(db, 1) == (new_pid, STATUS_RUNNING, 0, None)
+    finally:
+        await supervisor.stop(1)
+
+# Records whether it had to wait for BOT_START_FD and which bots had stopped when it began "polling".
+POLLER = """import os, signal, sys, time
+signal.signal(signal.SIGTERM, lambda *_: (open(f"stopped_{os.getpid()}", "w").close(), sys.exit(0)))
+os.write(int(os.environ["BOT_READY_FD"]), b"ready\\n")
+if "BOT_START_FD" in os.environ:
+    os.read(int(os.environ["BOT_START_FD"]), 64)
+stopped = sorted(name for name in os.listdir(".") if name.startswith("stopped_"))
+with open(f"polling_{os.getpid()}.tmp", "w") as f:
+    f.write(" ".join([str("BOT_START_FD" in os.environ), *stopped]))
+os.rename(f"polling_{os.getpid()}.tmp", f"polling_{os.getpid()}")
+time.sleep(60)
+"""
+
+async def polling_marker(bots_dir, pid):
+    marker = bots_dir / f"polling_{pid}"
+    for _ in range(200):
+        if marker.exists():
+            return marker.read_text()
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"pid {pid} never started polling")
+
+async def test_replace_starts_polling_only_after_old_bot_stopped(db, bots_dir):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir), ready_timeout=10)
+    try:
+        old_pid = await deploy(supervisor, bots_dir, POLLER)
+        assert await polling_marker(bots_dir, old_pid) == "True"
+        new_pid = await deploy(supervisor, bots_dir, POLLER)
+        assert await polling_marker(bots_dir, new_pid) == f"True stopped_{old_pid}"
+    finally:
+        await supervisor.stop(1)
+
+class FakeIngress:
+    def url(self, bot_token):
+        return "https://example.com/webhook"
+
+    def add_socket(self, bot_token, path):
+        pass
+
+    def remove(self, bot_token):
+        pass
+
+async def test_replace_overlaps_webhook_bots(db, bots_dir, tmp_path):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir), ready_timeout=10, webhook=FakeIngress(),
+                            sockets_dir=str(tmp_path))
+    try:
+        old_pid = await deploy(supervisor, bots_dir, POLLER)
+        new_pid = await deploy(supervisor, bots_dir, POLLER)
+        # The new bot did not wait for the old one, which the ingress stopped routing to.
+        assert (await polling_marker(bots_dir, new_pid)).startswith("False")
+        assert not psutil.pid_exists(old_pid)
+    finally:
+        await supervisor.stop(1)
+
+@pytest.mark.parametrize("script", [CRASHER, SLEEPER], ids=["exits", "never_ready"])
+async def test_replace_rolls_back_when_new_bot_is_not_ready(db, bots_dir, script):
+    supervisor = Supervisor(db, bots_dir=str(bots_dir), ready_timeout=2)
+    try:
+        old_pid = await deploy(supervisor, bots_dir, READY)
+        with pytest.raises(RuntimeError):
+            await deploy(supervisor, bots_dir, script)
+        assert supervisor.processes[1] == old_pid
+        assert psutil.Process(old_pid).status() != psutil.STATUS_ZOMBIE
+        assert await status(db, 1) == (old_pid, STATUS_RUNNING, 0, None)
+    finally:
+        await supervisor.stop(1)
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from utils.utils_telegram import TelegramApi, token_hash
+
+pytestmark = pytest.mark.asyncio
+
+TOKEN = "123456:valid"
+
+@pytest_asyncio.fixture
+async def stub_api():
+    calls = []
+
+    async def get_me(request):
+        token = request.match_info["token"]
+        calls.append(token)
+        if token == "999:slow":
+            await asyncio.sleep(1)
+        if token != TOKEN:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"})
+        return web.json_response({"ok": True, "result": {"id": 123456, "is_bot": True, "username": "stub_bot"}})
+
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/getMe", get_me)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    yield f"http://127.0.0.1:{port}", calls
+    await runner.cleanup()
+
+async def test_verified_tokens_are_cached_by_hash(stub_api):
+    base_url, calls = stub_api
+    api = TelegramApi(base_url=base_url)
+    try:
+        assert await api.verify_token(TOKEN) == (True, {"id": 123456, "is_bot": True, "username": "stub_bot"})
+        assert (await api.verify_token(TOKEN))[0]
+        assert calls == [TOKEN]
+        assert api.verified.get(token_hash(TOKEN))["username"] == "stub_bot"
+        assert await api.verify_token("1:bad") == (False, "Unauthorized")
+        assert await api.verify_token("1:bad") == (False, "Unauthorized")
+        assert calls == [TOKEN, "1:bad", "1:bad"]
+    finally:
+        await api.close()
+
+async def test_read_timeout(stub_api):
+    base_url, _ = stub_api
+    api = TelegramApi(base_url=base_url, read_timeout=0.1)
+    try:
+        assert await api.verify_token("999:slow") == (False, "Не удалось связаться с Telegram")
+    finally:
+        await api.close()
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+from egtgbt.interpreter import build_dispatcher
+from egtgbt.webhook import SECRET_HEADER, WebhookIngress, serve_socket, socket_path, webhook_secret
+from utils.utils_telegram import token_hash
+
+pytestmark = pytest.mark.asyncio
+
+TOKEN = "123456:ABCDEF"
+CONFIG = {"bot_name": "HookBot", "handlers": [{"command": "/start", "text": "Привет!"}]}
+
+def start_update(update_id=1):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "/start",
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+@pytest.fixture
+def sent():
+    calls = []
+    with patch.object(Bot, "__call__", AsyncMock(side_effect=lambda method, *a, **kw: calls.append(method))):
+        yield calls
+
+@pytest_asyncio.fixture
+async def telegram():
+    """Plays Telegram's side: posts updates to the ingress the way setWebhook delivery does."""
+    ingress = WebhookIngress(base_url="https://hooks.example.com")
+    client = TestClient(TestServer(ingress.app()))
+    await client.start_server()
+
+    async def post(key, update, secret):
+        response = await client.post(f"/webhook/{key}", json=update, headers={SECRET_HEADER: secret})
+        await asyncio.sleep(0.05)
+        return response.status
+
+    yield ingress, post
+    await client.close()
+    await ingress.close()
+
+async def test_in_process_dispatcher(telegram, sent):
+    ingress, post = telegram
+    bot = Bot(TOKEN)
+    key = ingress.add_dispatcher(bot, build_dispatcher(CONFIG))
+    assert ingress.url(TOKEN) == f"https://hooks.example.com/webhook/{token_hash(TOKEN)}"
+    assert await post(key, start_update(), webhook_secret(TOKEN)) == 200
+    assert [call.text for call in sent] == ["Привет!"]
+    assert await post(key, start_update(2), "forged") == 403
+    assert await post("0" * 64, start_update(3), webhook_secret(TOKEN)) == 404
+    assert len(sent) == 1
+    await bot.session.close()
+
+async def test_forward_over_unix_socket(telegram, sent, tmp_path):
+    ingress, post = telegram
+    bot = Bot(TOKEN)
+    path = socket_path(1, 4242, str(tmp_path))
+    runner = await serve_socket(bot, build_dispatcher(CONFIG), path)
+    key = ingress.add_socket(TOKEN, path)
+    assert await post(key, start_update(), webhook_secret(TOKEN)) == 200
+    assert [call.text for call in sent] == ["Привет!"]
+    await runner.cleanup()
+    # While the bot is down Telegram gets a 503 and redelivers later.
+    assert await post(key, start_update(2), webhook_secret(TOKEN)) == 503
+    await bot.session.close()
+
+async def test_resolver_adds_unknown_routes(telegram, sent):
+    ingress, post = telegram
+    bot = Bot(TOKEN)
+
+    resolved = []
+
+    async def resolver(key, secret):
+        resolved.append(key)
+        return key == token_hash(TOKEN) and secret == webhook_secret(TOKEN) and ingress.add_dispatcher(bot, build_dispatcher(CONFIG))
+
+    ingress.resolver = resolver
+    # Without a secret header the resolver is not even asked.
+    assert await post(token_hash(TOKEN), start_update(), "") == 404
+    assert resolved == []
+    assert await post(token_hash(TOKEN), start_update(), webhook_secret(TOKEN)) == 200
+    assert len(sent) == 1
+    await bot.session.close()
@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.utils_metrics import SQLITE_SECONDS
+
+DEFAULT_POOL_SIZE = 4
+
+
+class Database:
+    """Fixed pool of long-lived SQLite connections, each owned by one worker thread.
+
+    Queries run on the pool's threads, so a slow fsync never blocks the event
+    loop. Connections stay open for the life of the pool, which lets sqlite3
+    reuse prepared statements through its per-connection statement cache.
+    """
+
+    def __init__(self, path='bot_users.db', pool_size=DEFAULT_POOL_SIZE, cached_statements=256, timeout=5.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='db')
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _run(self, fn, *args):
+        conn = self._connection()
+        with SQLITE_SECONDS.time("run"):
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _fetch(self, op, sql, params):
+        with SQLITE_SECONDS.time(op):
+            cursor = self._connection().execute(sql, params)
+            return cursor.fetchone() if op == "fetchone" else cursor.fetchall()
+
+    async def run(self, fn, *args):
+        """Call fn(conn, *args) on a pool thread inside one transaction."""
+        return await self._submit(self._run, fn, *args)
+
+    async def execute(self, sql, params=()):
+        """Run a write statement and return (rowcount, lastrowid)."""
+        def execute(conn):
+            cursor = conn.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+        return await self.run(execute)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self.run(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    async def fetchone(self, sql, params=()):
+        return await self._submit(self._fetch, "fetchone", sql, params)
+
+    async def fetchall(self, sql, params=()):
+        return await self._submit(self._fetch, "fetchall", sql, params)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
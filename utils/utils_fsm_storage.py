@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        storage_key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+UPSERT = '''
+    INSERT INTO fsm_storage (storage_key, state, data, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+'''
+
+
+def storage_key_id(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage persisted in SQLite with an in-memory cache and write-behind batching.
+
+    Reads are served from the cache after the first load of a key. Writes only
+    update the cache and mark the key dirty; a background task flushes dirty
+    keys in one transaction every ``flush_interval`` seconds, or sooner once
+    ``batch_size`` keys are waiting, so wizard steps do not each pay an fsync.
+    Cleared states are deleted from the table. Because the cache is
+    authoritative, every replica sharing the file must own a disjoint set of
+    users (e.g. one replica per bot token).
+    """
+
+    def __init__(self, db, flush_interval: float = 0.5, batch_size: int = 100):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._cache: Dict[str, list] = {}
+        self._dirty = set()
+        self._table_ready = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def _ensure_table(self):
+        if not self._table_ready:
+            await self.db.execute(CREATE_TABLE)
+            self._table_ready = True
+
+    async def _record(self, key: StorageKey) -> list:
+        key_id = storage_key_id(key)
+        record = self._cache.get(key_id)
+        if record is None:
+            await self._ensure_table()
+            row = await self.db.fetchone('SELECT state, data FROM fsm_storage WHERE storage_key = ?', (key_id,))
+            record = [row[0], json.loads(row[1]) if row and row[1] else {}] if row else [None, {}]
+            # Another coroutine may have loaded the key while we were waiting.
+            record = self._cache.setdefault(key_id, record)
+        return record
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(storage_key_id(key))
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while self._dirty:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush FSM storage")
+
+    async def flush(self):
+        """Write every dirty key to SQLite in a single transaction."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        upserts = []
+        deletes = []
+        for key_id in dirty:
+            state, data = self._cache[key_id]
+            if state is None and not data:
+                deletes.append((key_id,))
+            else:
+                upserts.append((key_id, state, json.dumps(data, ensure_ascii=False)))
+
+        def write(conn):
+            if upserts:
+                conn.executemany(UPSERT, upserts)
+            if deletes:
+                conn.executemany('DELETE FROM fsm_storage WHERE storage_key = ?', deletes)
+
+        await self._ensure_table()
+        try:
+            await self.db.run(write)
+        except BaseException:
+            # Includes cancellation by close(); the upsert is idempotent, so retrying is safe.
+            self._dirty |= dirty
+            raise
+        for key_id, in deletes:
+            record = self._cache.get(key_id)
+            # Cleared keys leave the cache unless they were written again meanwhile.
+            if key_id not in self._dirty and record is not None and record[0] is None and not record[1]:
+                del self._cache[key_id]
+        return len(dirty)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._record(key)
+        record[1] = json.loads(json.dumps(data))
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads(json.dumps((await self._record(key))[1]))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
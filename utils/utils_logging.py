@@ -0,0 +1,138 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# LOG_LEVEL is the root level; LOG_LEVELS overrides it per logger, e.g.
+# LOG_LEVELS=aiogram.event=WARNING,egtgbt.supervisor=DEBUG. LOG_FORMAT is json or text.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [config_id=%(config_id)s user_id=%(user_id)s] %(message)s"
+
+# Set per update by LoggingContextMiddleware, or once per process by a generated bot.
+config_id_var = contextvars.ContextVar("config_id", default=None)
+user_id_var = contextvars.ContextVar("user_id", default=None)
+
+# Attributes every LogRecord has; anything else on a record came from extra= and is logged as a field.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class ContextQueueHandler(QueueHandler):
+    """Puts records on the queue as they are, with the caller's config_id and user_id attached.
+
+    The stdlib QueueHandler formats the message in prepare(), i.e. on the
+    logging thread; here %-args, extra fields and tracebacks are formatted by
+    the listener's thread instead, so objects passed as args must not be
+    mutated after the call.
+    """
+
+    def prepare(self, record):
+        if not hasattr(record, "config_id"):
+            record.config_id = config_id_var.get()
+        if not hasattr(record, "user_id"):
+            record.user_id = user_id_var.get()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, config_id, user_id and extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "config_id": getattr(record, "config_id", None),
+            "user_id": getattr(record, "user_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        record.__dict__.setdefault("config_id", None)
+        record.__dict__.setdefault("user_id", None)
+        return super().format(record)
+
+
+def parse_levels(spec):
+    """'aiogram=WARNING,egtgbt.supervisor=DEBUG' -> {'aiogram': 'WARNING', 'egtgbt.supervisor': 'DEBUG'}."""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, levels=None, stream=None, fmt=None):
+    """Route all logging through a queue to a background writer thread; safe to call more than once.
+
+    Handlers then only enqueue the record, so a slow stdout or disk never
+    blocks the event loop. Returns the QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel((level or LOG_LEVEL).upper())
+    for name, module_level in {**parse_levels(LOG_LEVELS), **(levels or {})}.items():
+        logging.getLogger(name).setLevel(module_level)
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush the queue and detach the queue handler."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, ContextQueueHandler):
+            root.removeHandler(handler)
+    _listener = None
+
+
+class LoggingContextMiddleware:
+    """Outer update middleware: records logged while handling an update carry its config_id and user_id."""
+
+    def __init__(self, config_id=None):
+        self.config_id = config_id
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        config_token = config_id_var.set(self.config_id) if self.config_id is not None else None
+        user_token = user_id_var.set(user.id if user is not None else None)
+        try:
+            return await handler(event, data)
+        finally:
+            user_id_var.reset(user_token)
+            if config_token is not None:
+                config_id_var.reset(config_token)
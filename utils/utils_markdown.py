@@ -0,0 +1,123 @@
+import copy
+from string import Formatter
+
+# (character, escape) in the order escape_markdown applies them, one str.replace pass
+# each. The order is significant: "\\" comes after the markup characters, so the
+# backslash added for "_" is itself escaped again and "_" becomes "\\\\_".
+SPECIAL_CHARS = (
+    ('_', '\\_'),
+    ('*', '\\*'),
+    ('[', '\\['),
+    (']', '\\]'),
+    ('(', '\\('),
+    (')', '\\)'),
+    ('~', '\\~'),
+    ('`', '\\`'),
+    ('>', '\\>'),
+    ('#', '\\#'),
+    ('+', '\\+'),
+    ('-', '\\-'),
+    ('=', '\\='),
+    ('|', '\\|'),
+    ('{', '\\{'),
+    ('}', '\\}'),
+    ('.', '\\.'),
+    ('!', '\\!'),
+    ('"', '\\"'),
+    ("'", "\\'"),
+    ("\\", "\\\\"),
+    ("\n", "\\n"),
+    ("\r", "\\r"),
+    ("\t", "\\t"),
+)
+
+
+def escape_markdown(text):
+    """Escape special MarkdownV2 characters for Telegram."""
+    if text is None:
+        return ""
+    # 24 str.replace passes beat a single str.translate or re.sub here: the escapes are
+    # multi-character, which sends both onto their slow per-character paths
+    # (see benchmarks/bench_escape_markdown.py).
+    for char, escaped in SPECIAL_CHARS:
+        text = text.replace(char, escaped)
+    return text
+
+
+class MarkdownTemplate:
+    """A message body parsed once into literal markup and fields; render() escapes only the fields.
+
+    Literal parts are written already escaped, e.g. MarkdownTemplate("*{title}*\\\\n").
+    """
+
+    def __init__(self, source):
+        self.parts = tuple((literal, field) for literal, field, _, _ in Formatter().parse(source))
+
+    def render(self, **values):
+        chunks = []
+        for literal, field in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(escape_markdown(values[field]))
+        return "".join(chunks)
+
+
+CONTACT_HEADER = MarkdownTemplate("*{welcome}*\\n\\n📋 *Контактная информация:*\\n")
+CONTACT_LINES = (
+    ("website", MarkdownTemplate("🌐 *Website:* {website}\\n")),
+    ("email", MarkdownTemplate("📧 *Email:* {email}\\n")),
+    ("phone", MarkdownTemplate("📞 *Phone:* {phone}\\n")),
+)
+NO_CONTACTS = "ℹ️ Контактная информация не указана.\\n"
+FAQ_TEXT = "Часто задаваемые вопросы:\\nВыберите интересующий вопрос\\."
+FAQ_START_TEXT = "Добро пожаловать в бот FAQ! Используйте /faq для просмотра вопросов."
+MENU_HANDLERS = (
+    {"command": "/create_bot", "text": "Начать создание нового бота."},
+    {"command": "/list_bots", "text": "Показать список ваших ботов."},
+    {"command": "/delete_bot", "text": "Удалить бота."},
+    {
+        "command": "/menu",
+        "text": "Выберите действие:",
+        "reply_markup": {
+            "inline_keyboard": [
+                [
+                    {"text": "Создать бота", "callback_data": "menu_create_bot", "response": "Начнем создание бота!"},
+                    {"text": "Список ботов", "callback_data": "menu_list_bots", "response": "Показываю ваши боты."}
+                ],
+                [
+                    {"text": "Удалить бота", "callback_data": "menu_delete_bot", "response": "Выберите бота для удаления."}
+                ]
+            ]
+        }
+    },
+)
+
+
+def contact_text(welcome_text, phone=None, email=None, website=None):
+    fields = {"website": website, "email": email, "phone": phone}
+    text = CONTACT_HEADER.render(welcome=welcome_text)
+    text += "".join(line.render(**{name: fields[name]}) for name, line in CONTACT_LINES if fields[name])
+    if not any(fields.values()):
+        text += NO_CONTACTS
+    return text
+
+
+def business_card_handlers(welcome_text, phone, email, website, help_text):
+    """Handlers of a business card bot with every message body escaped once, at config-build time."""
+    return [
+        {"command": "/start", "text": contact_text(welcome_text, phone, email, website)},
+        {"command": "/help", "text": escape_markdown(help_text)},
+        *copy.deepcopy(MENU_HANDLERS),
+    ]
+
+
+def faq_handlers(faqs):
+    """Handlers of a FAQ bot; faqs is a list of {"question", "answer"} in plain text."""
+    buttons = [
+        [{"text": escape_markdown(faq["question"]), "callback_data": f"faq_{i}", "response": escape_markdown(faq["answer"])}]
+        for i, faq in enumerate(faqs, 1)
+    ]
+    return [
+        {"command": "/start", "text": FAQ_START_TEXT},
+        {"command": "/faq", "text": FAQ_TEXT, "reply_markup": {"inline_keyboard": buttons}},
+    ]
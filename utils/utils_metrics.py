@@ -0,0 +1,344 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+import aiohttp
+from aiohttp import web
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import CallbackQuery, Message
+
+logger = logging.getLogger(__name__)
+
+# Local port of the builder's Prometheus endpoint; metrics are served only when it is set.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.getenv("METRICS_PORT") else None
+METRICS_ENV = "BOT_METRICS"
+BUILDER_ID = "builder"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Values of a metric's bounded labels (all but config_id, unless given) beyond this many
+# series per config_id are folded into OVERFLOW, so arbitrary callback_data cannot
+# grow the registry without bound and one bot cannot use up another's series.
+MAX_SERIES = 1000
+OVERFLOW = "other"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), bounded=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        if bounded is None:
+            bounded = [label for label in self.labelnames if label != "config_id"]
+        self.bounded = frozenset(i for i, label in enumerate(self.labelnames) if label in bounded)
+        self.series = {}
+        # Number of series per value of the unbounded labels.
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        # Called with self._lock held, right before the series is created or updated.
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        key = tuple(str(value) for value in labels)
+        if key in self.series:
+            return key
+        group = tuple(value for i, value in enumerate(key) if i not in self.bounded)
+        if self._groups.get(group, 0) >= MAX_SERIES:
+            return tuple(OVERFLOW if i in self.bounded else value for i, value in enumerate(key))
+        self._groups[group] = self._groups.get(group, 0) + 1
+        return key
+
+    def snapshot(self):
+        with self._lock:
+            series = [[dict(zip(self.labelnames, key)), self._value(value)] for key, value in self.series.items()]
+        return {"type": self.kind, "help": self.help, "series": series}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            key = self._key(labels)
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def _value(self, value):
+        return value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            key = self._key(labels)
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def _value(self, value):
+        return value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, bounded=None):
+        super().__init__(name, help, labelnames, bounded)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, *labels):
+        with self._lock:
+            key = self._key(labels)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _value(self, value):
+        counts, total, count = value
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return {"buckets": list(zip(self.buckets, cumulative)), "sum": total, "count": count}
+
+
+class Registry:
+    """Named counters and histograms of one process; snapshot() is JSON-serializable."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=(), bounded=None):
+        return self._get(Counter, name, help, labelnames, bounded=bounded)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, bounded=None):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets, bounded=bounded)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_seconds", "Time spent in a bot's message and callback handlers.", ("config_id", "event", "handler"),
+    bounded=("handler",),
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Handler calls that raised.", ("config_id", "event", "handler"), bounded=("handler",)
+)
+UPDATES = REGISTRY.counter("bot_updates_total", "Updates received by a bot's dispatcher.", ("config_id", "status"))
+API_SECONDS = REGISTRY.histogram(
+    "telegram_api_seconds", "Latency of outbound Telegram Bot API calls.", ("config_id", "method")
+)
+API_ERRORS = REGISTRY.counter("telegram_api_errors_total", "Telegram Bot API calls that failed.", ("config_id", "method"))
+SQLITE_SECONDS = REGISTRY.histogram("sqlite_seconds", "Time spent running SQLite statements on the pool.", ("op",))
+GENERATE_SECONDS = REGISTRY.histogram("generate_seconds", "Time spent rendering a bot with generate().")
+SEND_QUEUED = REGISTRY.gauge(
+    "telegram_send_queued", "Outbound Bot API calls waiting for a rate-limit slot.", ("config_id", "lane")
+)
+SEND_WAIT_SECONDS = REGISTRY.histogram(
+    "telegram_send_wait_seconds", "Time outbound Bot API calls waited for a rate-limit slot.", ("config_id", "lane")
+)
+SEND_RETRY_AFTER = REGISTRY.counter(
+    "telegram_retry_after_total", "429 Too Many Requests answers (retry_after) from Telegram.", ("config_id", "method")
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def render(snapshots):
+    """Merge Registry.snapshot() dicts (of this and other processes) into Prometheus text format."""
+    families = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            merged = families.setdefault(name, {"type": family["type"], "help": family["help"], "series": []})
+            merged["series"].extend(family["series"])
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in family["series"]:
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            for bound, count in value["buckets"]:
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': repr(float(bound))})} {count}")
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def cache_snapshot(name, cache):
+    """An LRUCache's stats() as a snapshot to render() alongside a Registry's, labelled cache=name."""
+    stats = cache.stats()
+    labels = {"cache": name}
+    return {
+        "cache_hits_total": {"type": "counter", "help": "Cache lookups that found an entry.", "series": [[labels, stats["hits"]]]},
+        "cache_misses_total": {"type": "counter", "help": "Cache lookups that found nothing.", "series": [[labels, stats["misses"]]]},
+        "cache_entries": {"type": "gauge", "help": "Entries in the cache.", "series": [[labels, stats["size"]]]},
+        "cache_max_entries": {"type": "gauge", "help": "Capacity of the cache.", "series": [[labels, stats["maxsize"]]]},
+    }
+
+
+def handler_label(event, data):
+    """Command name, callback_data, or the FSM state for plain text, as the handler label of an event."""
+    if isinstance(event, CallbackQuery):
+        return "callback_query", event.data or ""
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            return "message", text.split(maxsplit=1)[0].split("@", 1)[0]
+        return "message", data.get("raw_state") or "text"
+    return type(event).__name__, ""
+
+
+class HandlerMetricsMiddleware:
+    """Inner middleware: count and time every handler call, labelled by config_id and handler."""
+
+    def __init__(self, config_id):
+        self.config_id = str(config_id)
+
+    async def __call__(self, handler, event, data):
+        kind, label = handler_label(event, data)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(self.config_id, kind, label)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, self.config_id, kind, label)
+
+
+class UpdateMetricsMiddleware:
+    """Outer update middleware: count updates by whether a handler took them."""
+
+    def __init__(self, config_id):
+        self.config_id = str(config_id)
+
+    async def __call__(self, handler, event, data):
+        try:
+            result = await handler(event, data)
+        except Exception:
+            UPDATES.inc(self.config_id, "error")
+            raise
+        UPDATES.inc(self.config_id, "unhandled" if result is UNHANDLED else "handled")
+        return result
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: time every outbound Bot API call of a Bot."""
+
+    def __init__(self, config_id):
+        self.config_id = str(config_id)
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.inc(self.config_id, name)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, self.config_id, name)
+
+
+def instrument(bot, dp, config_id):
+    """Attach the metrics middlewares to a bot and its dispatcher; safe to call again for the same bot."""
+    if not any(isinstance(m, RequestMetricsMiddleware) for m in bot.session.middleware):
+        bot.session.middleware(RequestMetricsMiddleware(config_id))
+    if not any(isinstance(m, UpdateMetricsMiddleware) for m in dp.update.outer_middleware):
+        dp.update.outer_middleware(UpdateMetricsMiddleware(config_id))
+        dp.message.middleware(HandlerMetricsMiddleware(config_id))
+        dp.callback_query.middleware(HandlerMetricsMiddleware(config_id))
+
+
+def metrics_socket_path(config_id, pid, sockets_dir):
+    """Unix socket a subprocess bot serves its Registry.snapshot() on, next to its webhook socket."""
+    return os.path.join(sockets_dir, f"bot_{config_id}.{pid}.metrics.sock")
+
+
+async def serve_snapshot_socket(path, registry=REGISTRY):
+    """Serve registry.snapshot() as JSON on a unix socket for the builder to collect; returns the runner."""
+    async def handle(request):
+        return web.json_response(registry.snapshot())
+
+    app = web.Application()
+    app.router.add_get("/", handle)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    await web.UnixSite(runner, path).start()
+    return runner
+
+
+async def fetch_snapshot(path, timeout=1.0):
+    """Registry snapshot of the bot serving path, or None if it does not answer in time."""
+    try:
+        async with aiohttp.ClientSession(
+            connector=aiohttp.UnixConnector(path=path), timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as session:
+            async with session.get("http://bot/") as response:
+                return await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.debug("No metrics from %s: %r", path, e)
+        return None
+
+
+async def collect_local():
+    return [REGISTRY.snapshot()]
+
+
+async def serve_metrics(collect, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve GET /metrics in Prometheus text format; collect() returns the snapshots to merge."""
+    async def handle(request):
+        return web.Response(text=render(await collect()), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics on http://%s:%s/metrics", host, port)
+    return runner
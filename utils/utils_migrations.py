@@ -0,0 +1,132 @@
+import logging
+import sqlite3
+from utils.utils_fsm_storage import CREATE_TABLE as CREATE_FSM_STORAGE
+from utils.utils_telegram import token_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_column(conn, table, column, definition):
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_configs (
+            config_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bot_name TEXT,
+            config_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+
+def add_token_and_pid(conn):
+    _add_column(conn, 'bot_configs', 'bot_token', 'TEXT')
+    _add_column(conn, 'bot_configs', 'pid', 'INTEGER')
+
+
+def add_run_mode(conn):
+    _add_column(conn, 'bot_configs', 'run_mode', "TEXT DEFAULT 'subprocess'")
+
+
+def create_fsm_storage(conn):
+    conn.execute(CREATE_FSM_STORAGE)
+
+
+def create_bot_configs_indexes(conn):
+    # list_bots and delete filter by owner; startup scans running pids; BotHost selects by run_mode.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_configs_user_id ON bot_configs (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_configs_pid ON bot_configs (pid) WHERE pid IS NOT NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_configs_run_mode ON bot_configs (run_mode)')
+
+
+def add_supervisor_status(conn):
+    _add_column(conn, 'bot_configs', 'status', 'TEXT')
+    _add_column(conn, 'bot_configs', 'restart_count', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'bot_configs', 'last_exit_code', 'INTEGER')
+
+
+def add_content_hash(conn):
+    _add_column(conn, 'bot_configs', 'content_hash', 'TEXT')
+
+
+def add_token_hash(conn):
+    # The webhook ingress looks bots up by the token hash in their webhook URL.
+    _add_column(conn, 'bot_configs', 'token_hash', 'TEXT')
+    rows = conn.execute('SELECT config_id, bot_token FROM bot_configs WHERE bot_token IS NOT NULL').fetchall()
+    conn.executemany('UPDATE bot_configs SET token_hash = ? WHERE config_id = ?',
+                     [(token_hash(bot_token), config_id) for config_id, bot_token in rows])
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_configs_token_hash ON bot_configs (token_hash)')
+
+
+# Ordered (version, description, migration). Every migration is idempotent, so a
+# database created before schema_version existed is brought up to date safely.
+# Append new migrations at the end; never renumber or edit applied ones.
+MIGRATIONS = [
+    (1, "users and bot_configs tables", create_base_tables),
+    (2, "bot_configs.bot_token and bot_configs.pid", add_token_and_pid),
+    (3, "bot_configs.run_mode", add_run_mode),
+    (4, "fsm_storage table", create_fsm_storage),
+    (5, "bot_configs indexes on user_id, pid and run_mode", create_bot_configs_indexes),
+    (6, "bot_configs.status, restart_count and last_exit_code", add_supervisor_status),
+    (7, "bot_configs.content_hash", add_content_hash),
+    (8, "bot_configs.token_hash with an index", add_token_hash),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS, target=None):
+    """Apply pending migrations in order, each in its own transaction. Returns the applied versions."""
+    version = current_version(conn)
+    conn.commit()
+    applied = []
+    for number, description, migration in sorted(migrations, key=lambda m: m[0]):
+        if number <= version or (target is not None and number > target):
+            continue
+        conn.execute('BEGIN')
+        try:
+            migration(conn)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (number, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied migration %d: %s", number, description)
+        applied.append(number)
+    return applied
+
+
+def migrate_path(path='bot_users.db', target=None):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        return migrate(conn, target=target)
+    finally:
+        conn.close()
@@ -0,0 +1,236 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = os.getenv(
+    "PROFILES_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+)
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+STALL_THRESHOLD = float(os.getenv("PROFILE_STALL_MS", "100")) / 1000
+MAX_PROFILE_SECONDS = 600.0
+PROFILE_SIGNAL = signal.SIGUSR1
+
+
+def frame_name(code):
+    # co_qualname (3.11+) tells methods of different classes apart.
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Stack of frame as a root-first tuple of frame names."""
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread for a limited time.
+
+    Nothing runs until start(): no sampler thread, no trace hooks, no
+    event-loop callbacks. While running, a heartbeat on the event loop lets
+    the sampler spot stalls; each stall longer than ``stall_threshold`` is
+    logged with the loop thread's stack at the time. When the time is up the
+    samples are written to ``output_dir`` as a collapsed-stack file (for
+    flamegraph.pl and speedscope) and a speedscope JSON profile.
+    """
+
+    def __init__(self, name, output_dir=PROFILES_DIR, interval=PROFILE_INTERVAL, stall_threshold=STALL_THRESHOLD):
+        self.name = name
+        self.output_dir = output_dir
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.samples = collections.Counter()
+        self.stalls = []
+        self.paths = None
+        self.done = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._loop_thread = None
+        self._generation = 0
+        self._beat = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=PROFILE_SECONDS):
+        """Profile this process for seconds (capped at MAX_PROFILE_SECONDS); False if already running."""
+        if self.running:
+            return False
+        seconds = max(0.0, min(float(seconds), MAX_PROFILE_SECONDS))
+        self.samples = collections.Counter()
+        self.stalls = []
+        self.paths = None
+        self.done.clear()
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._generation += 1
+        if self._loop is not None:
+            self._loop.call_soon(self._heartbeat, self._generation)
+        self._thread = threading.Thread(target=self._sample, args=(seconds,), name="profiler", daemon=True)
+        self._thread.start()
+        logger.info("Profiling %s for %.0f s", self.name, seconds)
+        return True
+
+    def _heartbeat(self, generation):
+        # Re-arms itself only while its own run lasts, so nothing is left on the loop afterwards.
+        if generation == self._generation and not self.done.is_set():
+            self._beat = time.monotonic()
+            self._loop.call_later(self.interval, self._heartbeat, generation)
+
+    def _sample(self, seconds):
+        me = threading.get_ident()
+        names = {}
+        stall = None
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    self.samples[(names.get(ident, str(ident)),) + collapse(frame)] += 1
+                if self._loop is not None:
+                    stall = self._check_stall(stall)
+                time.sleep(self.interval)
+            if stall is not None:
+                self._end_stall(stall, time.monotonic())
+        finally:
+            try:
+                self.paths = self.write()
+                logger.info("Profile of %s written to %s", self.name, self.paths[0])
+            except OSError:
+                logger.exception("Could not write the profile of %s", self.name)
+            self.done.set()
+
+    def _check_stall(self, stall):
+        now = time.monotonic()
+        lag = now - self._beat
+        if lag > self.stall_threshold + self.interval:
+            if stall is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                stall = (self._beat, collapse(frame) if frame is not None else ())
+            return stall
+        if stall is not None:
+            self._end_stall(stall, self._beat)
+        return None
+
+    def _end_stall(self, stall, resumed):
+        started, stack = stall
+        duration = resumed - started
+        self.stalls.append((duration, stack))
+        logger.warning("Event loop of %s stalled for %.0f ms in %s", self.name, duration * 1000,
+                       " <- ".join(reversed(stack[-3:])) or "?")
+
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self):
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.most_common():
+            sample = []
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                sample.append(index[name])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": self.name, "unit": "seconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+        }
+
+    def write(self):
+        """Write <name>-<time>.collapsed.txt, .speedscope.json and, if the loop stalled, .stalls.txt."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        paths = [base + ".collapsed.txt", base + ".speedscope.json"]
+        with open(paths[0], "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        with open(paths[1], "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f)
+        if self.stalls:
+            paths.append(base + ".stalls.txt")
+            with open(paths[2], "w", encoding="utf-8") as f:
+                for duration, stack in self.stalls:
+                    f.write(f"{duration * 1000:.0f} ms\n" + "".join(f"  {name}\n" for name in stack) + "\n")
+        return paths
+
+
+def request_path(pid, output_dir=PROFILES_DIR):
+    return os.path.join(output_dir, f"{pid}.request")
+
+
+def catches_signal(pid, sig):
+    """True if process pid has a handler installed for sig, read from SigCgt in /proc/<pid>/status.
+
+    False where that cannot be read (no /proc, e.g. macOS); raises ProcessLookupError if pid is gone.
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("SigCgt:"):
+                    return bool(int(line.split()[1], 16) >> (sig - 1) & 1)
+    except FileNotFoundError:
+        if os.path.exists("/proc/self/status"):
+            raise ProcessLookupError(pid) from None
+    return False
+
+
+def request_profile(pid, seconds=None, output_dir=PROFILES_DIR):
+    """Ask process pid to profile itself: its duration goes in a request file, then PROFILE_SIGNAL.
+
+    Returns False without signalling a process that has no handler for PROFILE_SIGNAL,
+    e.g. a bot module generated before egtgbt.runtime or one still starting up:
+    the signal's default action would kill it.
+    """
+    if not catches_signal(pid, PROFILE_SIGNAL):
+        return False
+    if seconds is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(request_path(pid, output_dir), "w", encoding="utf-8") as f:
+            f.write(str(float(seconds)))
+    os.kill(pid, PROFILE_SIGNAL)
+    return True
+
+
+def install_profile_signal(profiler, loop=None):
+    """Start profiler on PROFILE_SIGNAL (kill -USR1 <pid>); the handler itself costs nothing until then."""
+    def on_signal():
+        seconds = PROFILE_SECONDS
+        path = request_path(os.getpid(), profiler.output_dir)
+        try:
+            with open(path, encoding="utf-8") as f:
+                seconds = float(f.read())
+            os.remove(path)
+        except (OSError, ValueError):
+            pass
+        if not profiler.start(seconds):
+            logger.info("Profiler of %s is already running", profiler.name)
+
+    (loop or asyncio.get_running_loop()).add_signal_handler(PROFILE_SIGNAL, on_signal)
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from utils.utils_cache import LRUCache
+from utils.utils_metrics import SEND_QUEUED, SEND_RETRY_AFTER, SEND_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Telegram's flood limits (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this):
+# about 30 messages per second per bot, 1 per second per private chat and 20 per minute per group.
+# A rate of 0 turns that limit off, e.g. against benchmarks.fake_bot_api.
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+CHAT_BURST = 3
+GROUP_BURST = 1
+# Chats whose buckets are kept; an evicted chat simply starts again with a full bucket.
+MAX_CHATS = 10000
+# A 429 is retried this many times if Telegram asks to wait no longer than MAX_RETRY_AFTER seconds.
+MAX_RETRIES = 3
+MAX_RETRY_AFTER = 60.0
+
+# Lanes, in priority order: callback acks expire after a few seconds and go first.
+ACK = 0
+SEND = 1
+LANE_NAMES = {ACK: "ack", SEND: "send"}
+SEND_PREFIXES = ("send", "copy", "forward", "edit")
+
+
+def lane_of(api_method):
+    """ACK for answerCallbackQuery, SEND for methods that post to a chat, None for the rest (getUpdates, getMe...)."""
+    if api_method == "answerCallbackQuery":
+        return ACK
+    if api_method.startswith(SEND_PREFIXES):
+        return SEND
+    return None
+
+
+class TokenBucket:
+    """rate tokens per second, at most capacity at a time; a rate of 0 means unlimited."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        # updated is in the future while paused: nothing accrues until then.
+        if now > self.updated:
+            if self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available (0 if one is now)."""
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.rate > 0 and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self._refill(self.clock())
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def pause(self, seconds):
+        """No tokens for seconds (Telegram's retry_after), then one at a time again instead of a burst."""
+        now = self.clock()
+        self._refill(now)
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = min(self.tokens, 1.0)
+        self.updated = max(self.updated, self.paused_until)
+
+
+class _Chat:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+
+
+class SendQueue(BaseRequestMiddleware):
+    """Session middleware: schedule a Bot's outbound calls within Telegram's flood limits.
+
+    A call to a chat holds that chat's asyncio.Lock until Telegram has
+    answered it, retries included, so a chat's calls reach it in the order
+    they were made. Holding the lock it waits for the chat's bucket, then
+    for a slot in the bot-wide bucket, where pending callback acks are
+    served before queued sends. A 429 answer pauses the chat (or the whole
+    bot for calls without a chat) for retry_after seconds and the call is
+    queued again.
+    """
+
+    def __init__(self, config_id, rate=None, chat_rate=None, group_rate=None, max_chats=MAX_CHATS):
+        self.config_id = str(config_id)
+        self.chat_rate = SEND_CHAT_RATE if chat_rate is None else chat_rate
+        self.group_rate = SEND_GROUP_RATE if group_rate is None else group_rate
+        rate = SEND_RATE if rate is None else rate
+        self.bucket = TokenBucket(rate, max(rate, 1))
+        self.chats = LRUCache(maxsize=max_chats)
+        self.waiters = []
+        self._seq = itertools.count()
+        self._pump = None
+
+    def chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            # Group and channel ids are negative.
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate, GROUP_BURST) if is_group else TokenBucket(self.chat_rate, CHAT_BURST)
+            chat = _Chat(bucket)
+            self.chats.put(chat_id, chat)
+        return chat
+
+    async def acquire(self, lane, chat=None):
+        """Wait until a call in lane (to chat, if given) may be sent without exceeding the limits."""
+        if chat is not None:
+            while (wait := chat.bucket.delay()) > 0:
+                await asyncio.sleep(wait)
+            chat.bucket.take()
+        await self._slot(lane)
+
+    async def _slot(self, lane):
+        if not self.waiters and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (lane, next(self._seq), future))
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        # Hands out bot-wide slots in (lane, arrival) order; exits when nobody waits.
+        try:
+            while self.waiters:
+                wait = self.bucket.delay()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                _, _, future = heapq.heappop(self.waiters)
+                if not future.done():
+                    self.bucket.take()
+                    future.set_result(None)
+        finally:
+            self._pump = None
+
+    async def __call__(self, make_request, bot, method):
+        lane = lane_of(method.__api_method__)
+        if lane is None:
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None) if lane == SEND else None
+        # The wait of the first attempt includes the time spent behind the chat's earlier calls.
+        start = time.perf_counter()
+        if chat_id is None:
+            return await self._send(make_request, bot, method, lane, None, start)
+        chat = self.chat(chat_id)
+        async with chat.lock:
+            return await self._send(make_request, bot, method, lane, chat, start)
+
+    async def _send(self, make_request, bot, method, lane, chat, start):
+        name = method.__api_method__
+        for attempt in itertools.count():
+            SEND_QUEUED.inc(self.config_id, LANE_NAMES[lane])
+            try:
+                await self.acquire(lane, chat)
+            finally:
+                SEND_QUEUED.dec(self.config_id, LANE_NAMES[lane])
+                SEND_WAIT_SECONDS.observe(time.perf_counter() - start, self.config_id, LANE_NAMES[lane])
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                SEND_RETRY_AFTER.inc(self.config_id, name)
+                (self.bucket if chat is None else chat.bucket).pause(e.retry_after)
+                if attempt >= MAX_RETRIES or e.retry_after > MAX_RETRY_AFTER:
+                    raise
+                logger.warning("%s to chat %s hit flood control, retrying in %s s", name,
+                               getattr(method, "chat_id", None), e.retry_after)
+                start = time.perf_counter()
+
+
+def throttle(bot, config_id):
+    """Put a bot's outbound calls through a SendQueue; safe to call again for the same bot.
+
+    Call it before instrument(), so the API latency metrics time each attempt
+    and not the time spent queued.
+    """
+    if not any(isinstance(m, SendQueue) for m in bot.session.middleware):
+        bot.session.middleware(SendQueue(config_id))
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import logging
+import os
+import aiohttp
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from utils.utils_cache import LRUCache
+from utils.utils_metrics import API_ERRORS, API_SECONDS, BUILDER_ID
+
+logger = logging.getLogger(__name__)
+
+# Point at a local stub server in tests, e.g. TELEGRAM_API_URL=http://127.0.0.1:8081.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+DEFAULT_API_URL = TELEGRAM_API_URL or "https://api.telegram.org"
+
+
+def bot_session():
+    """aiohttp session for an aiogram Bot: None (aiogram's default) unless TELEGRAM_API_URL is set."""
+    if TELEGRAM_API_URL is None:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(DEFAULT_API_URL))
+
+
+def token_hash(token):
+    """Cache and log key for a token, so the secret itself is never stored or printed."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TelegramApi:
+    """Shared keep-alive client for the builder's own Bot API calls (getMe token checks).
+
+    One ClientSession is created lazily on the running loop and reused, so
+    repeated checks share pooled TCP+TLS connections. Successful getMe results
+    are cached for ``token_ttl`` seconds, keyed by the token's sha256.
+    """
+
+    def __init__(self, base_url=None, connect_timeout=5.0, read_timeout=10.0, token_ttl=300.0, cache_size=1024):
+        self.base_url = (base_url or DEFAULT_API_URL).rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.verified = LRUCache(maxsize=cache_size, ttl=token_ttl)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30),
+            )
+        return self._session
+
+    async def call(self, token, method, **params):
+        try:
+            with API_SECONDS.time(BUILDER_ID, method):
+                async with self.session.post(f"{self.base_url}/bot{token}/{method}", json=params or None) as response:
+                    return await response.json(content_type=None)
+        except Exception:
+            API_ERRORS.inc(BUILDER_ID, method)
+            raise
+
+    async def verify_token(self, token):
+        """Call getMe and return (is_valid, bot_info_or_error)."""
+        key = token_hash(token)
+        bot_info = self.verified.get(key)
+        if bot_info is not None:
+            return True, bot_info
+        try:
+            data = await self.call(token, "getMe")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("getMe failed for token %s: %r", key[:12], e)
+            return False, "Не удалось связаться с Telegram"
+        if not data.get("ok"):
+            return False, data.get("description", "Ошибка")
+        self.verified.put(key, data["result"])
+        return True, data["result"]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,36 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RegisteredUsers:
+    """Registered user ids in front of the users table.
+
+    Only positive answers are cached, so a new registration is never hidden
+    behind a cached "not registered".
+    """
+
+    def __init__(self, db, cache):
+        self.db = db
+        self.cache = cache
+
+    async def is_registered(self, user_id):
+        if self.cache.get(user_id):
+            return True
+        user = await self.db.fetchone('SELECT 1 FROM users WHERE user_id = ?', (user_id,))
+        if user:
+            self.cache.put(user_id, True)
+        return user is not None
+
+    async def register(self, user_id, username, first_name):
+        await self.db.execute('INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
+                              (user_id, username, first_name))
+        self.cache.put(user_id, True)
+
+    async def warm(self):
+        """Load the most recently registered users, up to the cache size."""
+        rows = await self.db.fetchall('SELECT user_id FROM users ORDER BY registered_at DESC LIMIT ?',
+                                      (self.cache.maxsize,))
+        for (user_id,) in reversed(rows):
+            self.cache.put(user_id, True)
+        logger.info("Loaded %d registered users into the cache", len(rows))
@@ -1,46 +1,138 @@
+import copy
 import json
-from jsonschema import validate, ValidationError
+import os
+import re
+from functools import lru_cache
+from jsonschema import validators
+from jsonschema.exceptions import best_match
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'block_schema.json')
+
+# Rules validate_config used to check by hand, expressed as schema keywords so that
+# structure and rules are checked by one compiled validator in a single traversal.
+HANDLER_RULES = {"required": ["command", "text"]}
+# A button is either a url button or a callback button. if/then/else picks the one branch
+# that applies instead of trying both as anyOf would.
+BUTTON_RULES = {
+    "required": ["text"],
+    "if": {"required": ["url"]},
+    "then": {"dependentRequired": {"callback_data": ["response"]}},
+    "else": {"required": ["callback_data", "response"]},
+}
+URL_RULES = {"pattern": "^(http://|https://|tel:)"}
+
+# Characters user-entered names, messages and FAQ entries may contain. Compiled once into
+# a character class, so a check is one fullmatch() in C instead of a set lookup per char.
+TEXT_CHARS = (
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ,.!?+-*()[]{}:;@#$%^&_=<>~`"
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+)
+TEXT_RE = re.compile("[" + re.escape(TEXT_CHARS) + "]+")
+
+
+@lru_cache(maxsize=None)
+def load_block_schema():
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _compile(schema):
+    cls = validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+@lru_cache(maxsize=None)
+def block_schema_validator():
+    """block_schema.json compiled once; the meta-schema is checked here and never again."""
+    return _compile(load_block_schema())
+
+
+@lru_cache(maxsize=None)
+def config_validator():
+    """block_schema.json extended with the handler and button rules."""
+    schema = copy.deepcopy(load_block_schema())
+    handler = schema['properties']['handlers']['items']
+    handler.update(HANDLER_RULES)
+    button = handler['properties']['reply_markup']['properties']['inline_keyboard']['items']['items']
+    button.update(BUTTON_RULES)
+    button['properties']['url'].update(URL_RULES)
+    return _compile(schema)
+
+
+def _command(config, path):
+    try:
+        return config['handlers'][path[1]].get('command', 'unknown')
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return 'unknown'
+
+
+def _describe(config, error):
+    """Return (is_rule_error, message) for a config_validator() error."""
+    path = list(error.absolute_path)
+    if error.validator == 'required' and not path:
+        return True, "Отсутствуют обязательные поля: bot_name, handlers"
+    if error.validator == 'required' and len(path) == 2:
+        return True, f"Обработчик {_command(config, path)} не содержит обязательных полей: command, text"
+    # A callback button without response fails the else branch's required.
+    if error.validator == 'dependentRequired' or (
+            'else' in error.absolute_schema_path and 'callback_data' in error.instance):
+        return True, f"Кнопка с callback_data в {_command(config, path)} не содержит response"
+    if error.validator == 'required' and len(path) == 6:
+        return True, f"Кнопка в {_command(config, path)} не содержит text или url/callback_data"
+    if error.validator == 'pattern':
+        return True, f"Недопустимый URL в кнопке: {error.instance}"
+    return False, f"Ошибка валидации схемы: {error.message}"
+
+
+def _config_errors(config):
+    # Report errors in document order, like the hand-written checks did.
+    errors = sorted(config_validator().iter_errors(config), key=lambda e: [(type(p).__name__, p) for p in e.absolute_path])
+    described = []
+    for error in errors:
+        item = _describe(config, error)
+        if item not in described:
+            described.append(item)
+    return described
+
+
+def validate_bot_config(config):
+    """Check structure and button rules in one pass and return (is_valid, all_errors)."""
+    errors = [message for _, message in _config_errors(config)]
+    return not errors, errors
+
 
 def validate_config(config):
-    required_fields = {'bot_name', 'handlers'}
-    handler_required_fields = {'command', 'text'}
-    
-    if not all(field in config for field in required_fields):
-        return False, "Отсутствуют обязательные поля: bot_name, handlers"
-    
-    for handler in config.get('handlers', []):
-        if not all(field in handler for field in handler_required_fields):
-            return False, f"Обработчик {handler.get('command', 'unknown')} не содержит обязательных полей: command, text"
-        
-        if handler.get('reply_markup') and 'inline_keyboard' in handler['reply_markup']:
-            for row in handler['reply_markup']['inline_keyboard']:
-                for button in row:
-                    if not ('text' in button and ('url' in button or 'callback_data' in button)):
-                        return False, f"Кнопка в {handler['command']} не содержит text или url/callback_data"
-                    if 'url' in button and not button['url'].startswith(('http://', 'https://', 'tel:')):
-                        return False, f"Недопустимый URL в кнопке: {button['url']}"
-                    if 'callback_data' in button and 'response' not in button:
-                        return False, f"Кнопка с callback_data в {handler['command']} не содержит response"
-    
+    for is_rule, message in _config_errors(config):
+        if is_rule:
+            return False, message
     return True, ""
 
-from jsonschema import validate, ValidationError
-import json
-import os
 
 def validate_block_schema(config):
-    schema_path = os.path.join(os.path.dirname(__file__), 'block_schema.json')
-    with open(schema_path, 'r', encoding='utf-8') as f:
-        schema = json.load(f)
-    try:
-        validate(instance=config, schema=schema)
-        return True, ""
-    except ValidationError as e:
-        return False, f"Ошибка валидации схемы: {e.message}"
+    error = best_match(block_schema_validator().iter_errors(config))
+    if error is not None:
+        return False, f"Ошибка валидации схемы: {error.message}"
+    return True, ""
+
 
 def validate_bot_token(token):
     if not token or not isinstance(token, str):
         return False, "Токен не указан или не является строкой"
     if not token.count(":") == 1 or not token.split(":")[0].isdigit():
         return False, "Некорректный формат токена"
-    return True, ""
\ No newline at end of file
+    return True, ""
+
+
+def is_valid_text(text):
+    """Validate text to ensure it contains only safe characters for Markdown and Python strings."""
+    return bool(text) and TEXT_RE.fullmatch(text) is not None and not text.isspace()
+
+
+def validate_faqs(faqs):
+    """Check every {"question", "answer"} of a FAQ list and return (is_valid, errors), one error per bad entry."""
+    errors = []
+    for i, faq in enumerate(faqs, 1):
+        if not (is_valid_text(faq.get("question")) and is_valid_text(faq.get("answer"))):
+            errors.append(f"FAQ {i}: вопрос или ответ содержат недопустимые символы")
+    return not errors, errors